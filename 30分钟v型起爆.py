@@ -1,4 +1,3 @@
-import pandas as pd
 from pytdx.hq import TdxHq_API
 import time
 import schedule
@@ -145,15 +144,7 @@ def load_tdx_mapping(tdx_install_path):
 
     # 1. 读取股票-行业映射
     try:
-        df_hy = pd.read_csv(
-            tdxhy_file, 
-            sep='|', 
-            encoding='gbk', 
-            dtype=str, 
-            header=None, 
-            engine='python'
-        )
-        stock_to_industry_map = pd.Series(df_hy[5].values, index=df_hy[1]).to_dict()
+        stock_to_industry_map = gupiaojichu.load_map(tdxhy_file, 1, 5)
         logging.info(f"成功构建股票-行业映射，共 {len(stock_to_industry_map)} 条记录")
         logging.debug(f"股票-行业映射示例（前5项）: {list(stock_to_industry_map.items())[:5]}")
     except FileNotFoundError:
@@ -163,17 +154,7 @@ def load_tdx_mapping(tdx_install_path):
 
     # 2. 读取股票-指数映射
     try:
-        df_zs = pd.read_csv(
-            tdxzs_file, 
-            sep='|', 
-            header=None, 
-            dtype=str,
-            encoding='gbk', 
-            engine='python'
-        )
-        mask = df_zs[5].str.startswith('X')  # 过滤指数标识
-        filtered_series = pd.Series(df_zs.loc[mask, 5].values, index=df_zs.loc[mask, 1])
-        stock_to_zs_map = filtered_series.to_dict()
+        stock_to_zs_map = gupiaojichu.load_map(tdxzs_file, 1, 5, filter_prefix='X')  # 过滤指数标识
         logging.info(f"成功构建股票-指数映射，共 {len(stock_to_zs_map)} 条记录")
         logging.debug(f"股票-指数映射示例（前5项）: {list(stock_to_zs_map.items())[:5]}")
     
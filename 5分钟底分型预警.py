@@ -1,15 +1,19 @@
 import pandas as pd
-from pytdx.hq import TdxHq_API
+from pytdx.parser.base import RSP_HEADER_LEN
+from pytdx.parser.get_security_bars import GetSecurityBarsCmd
 import redis
 import time
-import schedule
 import os
 from datetime import datetime
 import gupiaojichu
 import logging
 import json
-import winsound
+import struct
+import zlib
 import numpy as np
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 配置日志
 logging.basicConfig(
@@ -21,32 +25,84 @@ logging.basicConfig(
     ]
 )
 
-def di_fen_xing(merged):
+def di_fen_xing(high, low):
+    """
+    判断合并后K线的最后三根是否构成底分型
+    
+    Args:
+        high: 合并后K线的最高价序列（列表或numpy数组）
+        low: 合并后K线的最低价序列（列表或numpy数组）
+    """
     # 确保有至少3根K线才能形成分型
-    if len(merged) < 3:
+    if len(high) < 3:
         return False
     
-    # 获取最后三根K线（从左到右依次为前一根、中间根、后一根）
-    k1 = merged[-3]  # 倒数第三根K线（左侧）
-    k2 = merged[-2]  # 倒数第二根K线（中间）
-    k3 = merged[-1]  # 最后一根K线（右侧）
-    
-    # 提取高低点（假设merged中每个元素为[high, low]结构）
-    k1_high, k1_low = k1.high, k1.low
-    k2_high, k2_low = k2.high, k2.low
-    k3_high, k3_low = k3.high, k3.low
+    # 最后三根K线（从左到右依次为前一根、中间根、后一根）
+    h = high[-3:]
+    l = low[-3:]
     
     # 底分型条件：
     # 1. 中间K线低点是三根中的最低点
     # 2. 中间K线高点是三根中的最低点
-    is_bottom = (k2_low < k1_low and k2_low < k3_low and
-                 k2_high < k1_high and k2_high < k3_high)
-    
-    return is_bottom
+    return bool(l[1] < l[0] and l[1] < l[2] and
+                h[1] < h[0] and h[1] < h[2])
+
 
+# 已有合并状态时每次获取的K线条数，需覆盖两次轮询之间新收盘的K线
+INCREMENTAL_BARS = 10
+# 每批流水线请求的股票数
+BATCH_SIZE = 32
 
 
+def recv_exact(sock, size):
+    """从socket读满size字节，连接断开时抛出异常"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("服务器断开连接")
+        buf.extend(chunk)
+    return buf
+
+
+def fetch_bars_pipelined(client, category, stocks):
+    """
+    流水线获取多只股票的K线：所有请求一次发出，再按发送顺序逐个读取响应
+    pytdx的请求包不带序号，服务器按收到的顺序应答，响应与请求按顺序一一对应
+    
+    Args:
+        client: pytdx连接的socket（TdxHq_API.client）
+        category: K线类别
+        stocks: [(market, stock_code, full_code, count), ...]
+        
+    Returns:
+        list: 与stocks一一对应的K线列表（pytdx get_security_bars的返回格式）
+    """
+    cmds = []
+    for market, stock_code, full_code, count in stocks:
+        cmd = GetSecurityBarsCmd(client)
+        cmd.setParams(category, market, stock_code, 0, count)
+        cmds.append(cmd)
+    client.sendall(b''.join(cmd.send_pkg for cmd in cmds))
+    
+    result = []
+    for cmd in cmds:
+        head_buf = recv_exact(client, RSP_HEADER_LEN)
+        _, _, _, zipsize, unzipsize = struct.unpack("<IIIHH", head_buf)
+        body_buf = recv_exact(client, zipsize)
+        if zipsize != unzipsize:
+            body_buf = zlib.decompress(body_buf)
+        result.append(cmd.parseResponse(body_buf))
+    return result
+
 class StockDataCollector:
+    # 信号股票写入的目标blk文件
+    BLK_OUT_PATHS = (
+        r"D:\zd_hbzq\T0002\blocknew\QSGHDDFX.blk",
+    )
+    # 已触发股票集合的持久化文件（放在脚本所在目录，不随启动目录变化），记录交易日，每轮结束有新增时写入
+    TRIGGERED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "triggered.json")
+
     def __init__(self, blk_file_path):
         """
         初始化股票数据收集器
@@ -58,171 +114,352 @@ class StockDataCollector:
             redis_db: Redis数据库编号
         """
         self.blk_file_path = blk_file_path
-        self.stock_list = self.load_stock_list()
-        self.triggered_stocks = set()  # 新增：用于记录已触发的股票代码
+        self.blk_mtime = self.get_blk_mtime()  # 记录加载时的修改时间，文件变化时才重新加载
+        # 股票列表按列存放：市场代码、股票代码、完整代码三个平行数组
+        self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
+        # 记录已触发的股票代码，启动时从输出blk文件和当天的已触发文件恢复，避免重启后重复触发；交易日变化时重置
+        self.triggered_date = self.trade_date()
+        self.triggered_stocks = self.load_triggered_stocks(self.triggered_date)
+        self.triggered_saved = len(self.triggered_stocks)  # 已持久化的数量，用于判断是否需要重写
         # 服务器列表
         self.servers = [
             ('152.136.167.10', 7709),
             ('36.153.42.16', 7709)
         ]
+        # 线程池：每只股票的获取+判断相互独立，并发执行以重叠网络等待
+        self.max_workers = len(self.servers) * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # pytdx长连接池（按线程独占，空闲过久先发心跳），与其他脚本共用gupiaojichu中的实现
+        self.tdx_pool = gupiaojichu.TdxApiPool(self.servers)
+        # blk文件写入缓冲：触发时只记录，每轮结束统一追加写入
+        self.pending_writes = defaultdict(list)
+        self.write_lock = threading.Lock()
+        # 增量合并状态：{full_code: (已收盘K线合并后的尾部, 最后一根已收盘K线的时间, 已收盘K线数)}
+        self.merge_state = {}
+        # 每只股票每轮都会走到的debug日志先判断级别，INFO级别下不做f-string格式化
+        self.log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        # 后台蜂鸣提醒，与其他脚本共用gupiaojichu中的实现
+        self.beeper = gupiaojichu.Beeper()
         
-        logging.info(f"初始化完成，共加载 {len(self.stock_list)} 只股票")
+        logging.info(f"初始化完成，共加载 {len(self.full_codes)} 只股票")
+    
+    @staticmethod
+    def trade_date():
+        """当前交易日（按本地日期），如 2024-01-02"""
+        return datetime.now().strftime('%Y-%m-%d')
+    
+    def load_triggered_stocks(self, trade_date):
+        """
+        从输出blk文件和已触发股票文件读取之前已触发的股票
+        
+        Args:
+            trade_date: 当前交易日，已触发股票文件只恢复该交易日的记录
+        
+        Returns:
+            set: 已触发的完整股票代码集合 (如 sh600000)
+        """
+        triggered = set()
+        
+        for file_path in self.BLK_OUT_PATHS:
+            if not os.path.exists(file_path):
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if len(line) >= 7:
+                            # 第一位是市场代码(0: 深圳, 1: 上海)，后六位是股票代码
+                            market_prefix = 'sz' if line[0] == '0' else 'sh'
+                            triggered.add(f"{market_prefix}{line[1:7]}")
+            except Exception as e:
+                logging.error(f"读取已触发股票文件 {file_path} 失败: {e}")
+        
+        if os.path.exists(self.TRIGGERED_PATH):
+            try:
+                with open(self.TRIGGERED_PATH, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                # 其他交易日的记录（以及不带日期的旧格式列表）直接忽略
+                if isinstance(saved, dict) and saved.get('date') == trade_date:
+                    triggered.update(saved.get('stocks', []))
+            except Exception as e:
+                logging.error(f"读取已触发股票文件 {self.TRIGGERED_PATH} 失败: {e}")
+        
+        if triggered:
+            logging.info(f"恢复 {len(triggered)} 只已触发股票")
+        return triggered
+    
+    def reset_triggered_if_new_day(self):
+        """交易日变化时重置已触发股票：只保留输出blk文件中仍存在的，前一交易日的记录不再排除"""
+        today = self.trade_date()
+        if today == self.triggered_date:
+            return
+        self.triggered_date = today
+        self.triggered_stocks = self.load_triggered_stocks(today)
+        self.triggered_saved = len(self.triggered_stocks)
+        logging.info(f"交易日切换到 {today}，重置已触发股票，剩余 {len(self.triggered_stocks)} 只")
+    
+    def save_triggered_stocks(self):
+        """已触发股票有新增时连同交易日整体写入TRIGGERED_PATH，先写临时文件再替换，避免中途退出留下半个文件"""
+        if len(self.triggered_stocks) == self.triggered_saved:
+            return
+        tmp_path = self.TRIGGERED_PATH + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'date': self.triggered_date, 'stocks': sorted(self.triggered_stocks)}, f)
+            os.replace(tmp_path, self.TRIGGERED_PATH)
+            self.triggered_saved = len(self.triggered_stocks)
+        except Exception as e:
+            logging.error(f"写入已触发股票文件 {self.TRIGGERED_PATH} 失败: {e}")
     
     def load_stock_list(self):
         """
         从blk文件加载股票列表
         
         Returns:
-            list: 股票代码列表，格式为 [('市场代码', '股票代码', '完整代码'), ...]
+            tuple: (市场代码数组, 股票代码数组, 完整代码数组)，三个数组按行对应
         """
-        stock_list = []
-        
         try:
-            with open(self.blk_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(self.blk_file_path, 'rb') as f:
+                data = f.read()
                 
-            # 跳过第一行空白，从第二行开始处理
-            for line in lines[1:]:
-                line = line.strip()
-                if line:
-                    # 第一位是市场代码，后六位是股票代码
-                    market_code = line[0]
-                    stock_code = line[1:7]
-                    
-                    # 将市场代码转换为pytdx需要的格式
-                    # 0: 深圳, 1: 上海
-                    if market_code == '0':
-                        market = 0  # 深圳
-                        market_prefix = 'sz'
-                    else:
-                        market = 1  # 上海
-                        market_prefix = 'sh'
-                    
-                    full_code = f"{market_prefix}{stock_code}"
-                    stock_list.append((market, stock_code, full_code))
-                    
-                    logging.debug(f"加载股票: {full_code}")
-                    
+            # 跳过第一行空白，从第二行开始处理；去掉空行后整体切成每行7字节的矩阵
+            lines = np.char.strip(np.array(data.splitlines()[1:], dtype='S'))
+            lines = lines[np.char.str_len(lines) > 0].astype('S7')
+            buf = lines.view(np.uint8).reshape(-1, 7)
+            # 第一位是市场代码，后六位是股票代码
+            # 整列换算pytdx的市场代码和sz/sh前缀，不再逐行判断
+            markets = (buf[:, 0] != ord('0')).astype(np.int8)
+            stock_codes = np.ascontiguousarray(buf[:, 1:]).view('S6').ravel()
+            full_codes = np.char.add(np.where(markets == 0, b'sz', b'sh'), stock_codes)
+            return markets, stock_codes.astype(str), full_codes.astype(str)
         except Exception as e:
             logging.error(f"读取blk文件失败: {e}")
             
-        return stock_list
+        return np.empty(0, dtype=np.int8), np.empty(0, dtype='U6'), np.empty(0, dtype='U8')
+    
+    def get_blk_mtime(self):
+        """获取blk文件修改时间，文件不可访问时返回None"""
+        try:
+            return os.path.getmtime(self.blk_file_path)
+        except OSError:
+            return None
+    
+    def refresh_stock_list(self):
+        """blk文件修改时间变化时重新加载股票列表，未变化时不读文件"""
+        mtime = self.get_blk_mtime()
+        if mtime != self.blk_mtime:
+            self.blk_mtime = mtime
+            self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
+            logging.info(f"blk文件已变化，重新加载 {len(self.full_codes)} 只股票")
     
-    def get_5min_data(self, market, stock_code, full_code):
+    def pending_stocks(self):
+        """按已触发集合整体过滤股票列表，返回未触发股票的 [(market, stock_code, full_code), ...]"""
+        idx = np.flatnonzero(~np.isin(self.full_codes, list(self.triggered_stocks)))
+        return list(zip(self.markets[idx].tolist(), self.stock_codes[idx].tolist(), self.full_codes[idx].tolist()))
+
+    def get_5min_data(self, market, stock_code, full_code, count=200):
         """
-        获取单只股票的5分钟K线数据（200条）
+        获取单只股票最近count条5分钟K线数据
         
         Args:
             market: 市场代码 (0: 深圳, 1: 上海)
             stock_code: 股票代码
             full_code: 完整股票代码 (如 sh600000)
+            count: 获取的K线条数
+            
+        Returns:
+            tuple: (最高价列表, 最低价列表, 时间列表)，获取失败时为 (None, None, None)
+        """
+        return self.get_5min_data_batch([(market, stock_code, full_code, count)])[0]
+    
+    def get_5min_data_batch(self, stocks):
+        """
+        在同一连接上流水线获取一批股票的5分钟K线数据，一次往返取回整批
+        
+        Args:
+            stocks: [(market, stock_code, full_code, count), ...]
             
         Returns:
-            list or None: 200条K线数据，每条包含open, close, high, low, datetime
+            list: 与stocks一一对应的 (最高价列表, 最低价列表, 时间列表)，获取失败的为 (None, None, None)
         """
-        api = TdxHq_API()
+        # 从当前线程的连接池轮询取连接，失败时整批换其他服务器重试
+        local = self.tdx_pool.get()
         
-        # 尝试所有服务器直到成功
-        for server_ip, server_port in self.servers:
+        for i in self.tdx_pool.rotation(local):
+            server_ip, server_port = self.servers[i]
+            if not self.tdx_pool.ensure(local, i):
+                continue
+            
             try:
-                if api.connect(server_ip, server_port):
-                    logging.debug(f"成功连接到服务器 {server_ip}:{server_port}，获取 {full_code}")
-                    
-                    # 获取5分钟K线数据 (category=0)，获取200条
-                    data = api.get_security_bars(0, market, stock_code, 0, 200)
-                    api.disconnect()
-                    
-                    if data:
-                        # 处理所有200条数据
-                        result_list = []
-                        result_list_high = []
-                        result_list_low = []
-                        for bar in data:
-                            # 提取需要的字段
-                            result = {
-                                'open': float(bar['open']),
-                                'high': float(bar['high']),
-                                'low': float(bar['low']),
-                                'close': float(bar['close']),
-                                'datetime': bar['datetime']
-                            }
-                            result_list_high.append(float(bar['high']))
-                            result_list_low.append(float(bar['low']))
-                            result_list.append(result)
-                        
-                        # 按时间排序（从旧到新）
-                        # result_list.sort(key=lambda x: x['datetime'])
-                        
-                        logging.debug(f"成功获取 {full_code} 数据: {len(result_list)} 条")
-                        return result_list,result_list_high,result_list_low
-                    else:
-                        logging.warning(f"未获取到 {full_code} 的数据")
-                        return None,None,None
-                else:
-                    logging.debug(f"连接服务器 {server_ip}:{server_port} 失败")
-                    
+                # 获取5分钟K线数据 (category=0)
+                data_list = fetch_bars_pipelined(local.api_pool[i].client, 0, stocks)
             except Exception as e:
-                logging.debug(f"服务器 {server_ip}:{server_port} 获取 {full_code} 出错: {e}")
+                logging.debug(f"服务器 {server_ip}:{server_port} 获取 {len(stocks)} 只股票出错: {e}")
+                # 响应读到一半出错时连接上的数据已错位，必须断开重连
+                self.tdx_pool.mark_broken(local, i)
                 continue
+            self.tdx_pool.touch(local, i)
+            
+            result = []
+            for (market, stock_code, full_code, count), data in zip(stocks, data_list):
+                if data:
+                    # 下游只用到high、low和时间，直接提取这几列，不再为每条K线构建字典
+                    result_list_high = [float(bar['high']) for bar in data]
+                    result_list_low = [float(bar['low']) for bar in data]
+                    result_list_time = [bar['datetime'] for bar in data]
+                    if self.log_debug:
+                        logging.debug(f"成功获取 {full_code} 数据: {len(result_list_high)} 条")
+                    result.append((result_list_high,result_list_low,result_list_time))
+                else:
+                    logging.warning(f"未获取到 {full_code} 的数据")
+                    result.append((None,None,None))
+            return result
                 
-        logging.error(f"所有服务器都无法获取 {full_code} 的数据")
-        return None,None,None
+        logging.error(f"所有服务器都无法获取 {', '.join(stock[2] for stock in stocks)} 的数据")
+        return [(None,None,None)] * len(stocks)
     
     def write_to_blk_files(self, market, stock_code):
-        """将股票代码写入两个blk文件"""
+        """将股票代码加入blk文件写入缓冲，由flush_blk_files统一落盘"""
         # 组合格式：market(1位) + stock_code(6位)
         blk_code = f"{market}{stock_code}"
-        # 目标文件路径
-        file_paths = [
-            r"D:\zd_hbzq\T0002\blocknew\QSGHDDFX.blk",
-        ]
+        with self.write_lock:
+            for file_path in self.BLK_OUT_PATHS:
+                self.pending_writes[file_path].append(blk_code)
+
+    def flush_blk_files(self):
+        """把本轮缓冲的股票代码一次性追加写入各blk文件"""
+        with self.write_lock:
+            pending = self.pending_writes
+            self.pending_writes = defaultdict(list)
         
-        for file_path in file_paths:
+        for file_path, blk_codes in pending.items():
             try:
                 # 以追加模式写入，确保文件存在（不存在则创建）
                 with open(file_path, 'a', encoding='utf-8') as f:
-                    f.write(f"{blk_code}\n")
-                logging.info(f"成功将 {blk_code} 写入 {file_path}")
+                    f.write('\n'.join(blk_codes) + '\n')
+                logging.info(f"成功将 {', '.join(blk_codes)} 写入 {file_path}")
             except Exception as e:
                 logging.error(f"写入文件 {file_path} 失败: {e}")
                 
 
+    def check_stock_batch(self, stocks):
+        """
+        在工作线程中流水线获取一批股票数据并逐只判断底分型
+        
+        Returns:
+            list: 与stocks一一对应的判断结果，获取数据失败的为None
+        """
+        # 已有合并状态时只取最近几根K线做增量合并，否则取200条从头合并
+        requests = [
+            (market, stock_code, full_code, INCREMENTAL_BARS if full_code in self.merge_state else 200)
+            for market, stock_code, full_code in stocks
+        ]
+        results = []
+        for (market, stock_code, full_code), bars in zip(stocks, self.get_5min_data_batch(requests)):
+            try:
+                results.append(self.check_stock(market, stock_code, full_code, bars))
+            except Exception as e:
+                logging.error(f"处理 {full_code} 时发生错误: {e}")
+                results.append(None)
+        return results
+
+    def check_stock(self, market, stock_code, full_code, bars=None):
+        """
+        判断单只股票是否出现底分型
+        
+        Args:
+            bars: 已获取的 (最高价列表, 最低价列表, 时间列表)，为None时自行获取
+        
+        Returns:
+            bool or None: 是否出现底分型，获取数据失败时返回None
+        """
+        state = self.merge_state.get(full_code)
+        if bars is None:
+            count = INCREMENTAL_BARS if state else 200
+            bars = self.get_5min_data(market, stock_code, full_code, count)
+        stock_data_high,stock_data_low,stock_data_time = bars
+        
+        if not stock_data_high:
+            return None
+        
+        # 最后一根K线可能还在走，不计入缓存状态；之前的K线已收盘，合并结果不再变化
+        done = len(stock_data_high) - 1
+        if state:
+            merged_tail, last_time, bar_count = state
+            if stock_data_time[0] > last_time:
+                # 取到的K线和上次状态之间有缺口（如隔了一个午休/隔夜未运行），丢弃状态从头合并
+                del self.merge_state[full_code]
+                return self.check_stock(market, stock_code, full_code)
+            # 只合并上次之后新收盘的K线
+            start = done
+            while start > 0 and stock_data_time[start - 1] > last_time:
+                start -= 1
+            merged = list(merged_tail)
+        else:
+            start = 0
+            bar_count = 0
+            merged = []
+        
+        gupiaojichu.extend_merged_bars(merged, stock_data_high[start:done], stock_data_low[start:done],
+                                       done - start, bar_count)
+        bar_count += done - start
+        if done > 0:
+            # 合并只依赖最后两根，底分型需要最后三根，缓存最后三根即可
+            self.merge_state[full_code] = (merged[-3:], stock_data_time[done - 1], bar_count)
+        
+        # 在已收盘K线的合并结果上叠加当前K线，判断最后三根是否构成底分型
+        tail = merged[-3:]
+        gupiaojichu.extend_merged_bars(tail, stock_data_high[done:], stock_data_low[done:], 1, bar_count)
+        ok = di_fen_xing([bar.high for bar in tail[-3:]], [bar.low for bar in tail[-3:]])
+        # ok = identify_three_buy_variant(stock_data_high,stock_data_low)
+        return ok
+
     def update_all_stocks(self):
         """
         更新所有股票数据到Redis
         """
-        self.stock_list = self.load_stock_list()
+        self.refresh_stock_list()
+        self.reset_triggered_if_new_day()
         success_count = 0
         fail_count = 0
         
         logging.info("开始更新所有股票数据...")
         
-        for market, stock_code, full_code in self.stock_list:
+        # 获取与判断在工作线程并发执行；写blk文件和蜂鸣只在主线程进行，避免争用文件和音频设备
+        # 已触发过的股票不再获取数据
+        todo = self.pending_stocks()
+        # 按批流水线请求，一批一次往返；股票较少时缩小批量，保证每个工作线程都有活干
+        batch_size = max(1, min(BATCH_SIZE, -(-len(todo) // self.max_workers)))
+        futures = {
+            self.executor.submit(self.check_stock_batch, todo[j:j + batch_size]): todo[j:j + batch_size]
+            for j in range(0, len(todo), batch_size)
+        }
+        
+        for future in as_completed(futures):
+            stocks = futures[future]
             try:
-                # 获取股票数据（200条）
-                stock_data,stock_data_high,stock_data_low = self.get_5min_data(market, stock_code, full_code)
-                
-                if stock_data:
-                    data_len = len(stock_data_high)
-                    merged = gupiaojichu.merge_contained_bars(stock_data_high,stock_data_low,data_len)
-                    ok = di_fen_xing(merged)
-                    # ok = identify_three_buy_variant(stock_data_high,stock_data_low)
-                    if  ok:
+                results = future.result()
+            except Exception as e:
+                fail_count += len(stocks)
+                logging.error(f"处理 {', '.join(stock[2] for stock in stocks)} 时发生错误: {e}")
+                continue
+            
+            for (market, stock_code, full_code), ok in zip(stocks, results):
+                if ok is not None:
+                    if ok:
                         self.write_to_blk_files(market, stock_code)
                         logging.warning(f"底分型： {stock_code}")
-                        winsound.Beep(1000, 500)  # 1000Hz频率，持续500毫秒
+                        self.beeper.beep()
                         self.triggered_stocks.add(full_code)  # 记录已触发的股票
                  
                     success_count += 1
                 else:
                     fail_count += 1
                     logging.warning(f"获取 {full_code} 数据失败")
-                    
-            except Exception as e:
-                fail_count += 1
-                logging.error(f"处理 {full_code} 时发生错误: {e}")
                 
         
+        self.flush_blk_files()
+        self.save_triggered_stocks()
         logging.info(f"数据更新完成: 成功 {success_count}, 失败 {fail_count}")
         return success_count, fail_count
 
@@ -262,16 +499,18 @@ class StockDataCollector:
         
         logging.info(f"开始定时数据收集，间隔: {interval_seconds}秒")
         
-        # 立即执行一次
-        self.update_all_stocks()
-        
-        # 设置定时任务
-        schedule.every(interval_seconds).seconds.do(self.update_all_stocks)
+        # 按单调时钟定时：立即执行一次，之后每隔interval_seconds执行一次
+        next_t = time.monotonic()
         
         try:
             while True:
-                schedule.run_pending()
-                time.sleep(1)
+                self.update_all_stocks()
+                next_t += interval_seconds
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.monotonic()  # 本轮耗时超过间隔，从当前时间重新计时
         except KeyboardInterrupt:
             logging.info("程序被用户中断")
         except Exception as e:
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from openpyxl import load_workbook
 from openpyxl.drawing.image import Image
 from openpyxl.styles import Font, Alignment
 import os
@@ -17,7 +16,9 @@ output_sheet = '随机复利模拟结果'
 
 try:
     # 1. 模拟计算逻辑
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
+    # 交易明细直接从文件读取：pd.read_excel读到的是公式单元格缓存的计算结果，
+    # 而ExcelWriter载入的工作簿保留的是公式字符串，不能用来读取数据
+    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
     returns = df[column_name].dropna().values / 100 
     num_trades = len(returns) 
     random_indices = np.random.randint(0, len(returns), size=(num_simulations, num_trades))
@@ -56,14 +57,14 @@ try:
     plt.close()
 
     # 4. 写入原始路径数据 (这次从 D 列开始写，留出 A-C 列放统计)
-    with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-        path_df = pd.DataFrame(curves.T)
-        path_df.columns = [f'路径_{i+1}' for i in range(num_simulations)]
-        path_df.to_excel(writer, sheet_name=output_sheet, startrow=0, startcol=3) # startcol=3 是 D 列
+    # 模拟路径和统计摘要都写在同一个工作簿上，最后只保存一次；计算出错时不会改动文件
+    writer = pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace')
+    path_df = pd.DataFrame(curves.T)
+    path_df.columns = [f'路径_{i+1}' for i in range(num_simulations)]
+    path_df.to_excel(writer, sheet_name=output_sheet, startrow=0, startcol=3) # startcol=3 是 D 列
 
-    # 5. 【原生填值】在 A1 写入统计摘要
-    wb = load_workbook(file_path)
-    ws = wb[output_sheet]
+    # 5. 【原生填值】在 A1 写入统计摘要（直接在刚写入的工作表上填写，不再重新载入文件）
+    ws = writer.sheets[output_sheet]
     
     # 设置表头文字
     ws['A1'] = "策略统计指标"
@@ -87,7 +88,8 @@ try:
     img.height = 1440
     ws.add_image(img, 'DE2') 
     
-    wb.save(file_path)
+    # 保存时才读取图片数据，临时图片要在保存之后再删除
+    writer.close()
 
     if os.path.exists(temp_img):
         os.remove(temp_img)
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from openpyxl import load_workbook
 from openpyxl.drawing.image import Image
 from openpyxl.styles import Font, Alignment
 import os
@@ -21,7 +20,9 @@ RISK_REDUCTION = 0.5  # 风险缩减系数：回撤后只承担 0.5 倍风险
 
 try:
     # 1. 加载数据
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
+    # 交易明细直接从文件读取：pd.read_excel读到的是公式单元格缓存的计算结果，
+    # 而ExcelWriter载入的工作簿保留的是公式字符串，不能用来读取数据
+    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
     # 原始收益率（基于1%风险金）
     returns = df[column_name].dropna().values / 100 
     num_trades = len(returns) 
@@ -100,13 +101,14 @@ try:
     plt.close()
 
     # 5. 写入 Excel (保持原逻辑)
-    with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-        path_df = pd.DataFrame(curves.T)
-        path_df.columns = [f'路径_{i+1}' for i in range(num_simulations)]
-        path_df.to_excel(writer, sheet_name=output_sheet, startrow=0, startcol=3)
+    # 模拟路径和统计摘要都写在同一个工作簿上，最后只保存一次；计算出错时不会改动文件
+    writer = pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace')
+    path_df = pd.DataFrame(curves.T)
+    path_df.columns = [f'路径_{i+1}' for i in range(num_simulations)]
+    path_df.to_excel(writer, sheet_name=output_sheet, startrow=0, startcol=3)
 
-    wb = load_workbook(file_path)
-    ws = wb[output_sheet]
+    # 直接在刚写入的工作表上填写统计摘要，不再重新载入文件
+    ws = writer.sheets[output_sheet]
     ws['A1'] = "策略统计指标 (动态风控模式)"
     ws['B1'] = "数值结果"
     ws['A1'].font = Font(bold=True)
@@ -121,7 +123,7 @@ try:
 
     img = Image(temp_img)
     ws.add_image(img, 'A15')
-    wb.save(file_path)
+    writer.close()
     print(f"成功！动态风险管理模拟已完成，结果保存至 {file_path}")
 
 except Exception as e:
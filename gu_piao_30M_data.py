@@ -1,14 +1,112 @@
 import logging
+import os
 import time
-import schedule
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import gupiaojichu
-from pytdx.hq import TdxHq_API
+from gupiaojichu import njit
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+@njit(cache=True)
+def segments_overlap(high, low, a_start, a_end, b_start, b_end):
+    """判断两个向下线段的价格区间是否重合"""
+    return min(high[a_start], high[b_start]) > max(low[a_end], low[b_end])
+
+@njit(cache=True)
+def three_buy2_kernel(frac, high, low):
+    """ThreeBuy2的编译内核，frac/high/low均为float64数组，返回float64信号数组"""
+    data_len = frac.shape[0]
+    pf_out = np.zeros(data_len, dtype=np.float64)
+    if data_len <= 0:
+        return pf_out
+
+    # 提取转折点
+    turn_idx = np.empty(data_len, dtype=np.int64)
+    turn_dir = np.empty(data_len, dtype=np.int64)
+    n_turns = 0
+    for i in range(data_len):
+        val = frac[i]
+        if val != 0.0:
+            turn_idx[n_turns] = i
+            turn_dir[n_turns] = int(val)
+            n_turns += 1
+
+    # 构建线段，每行为 (起点, 终点, 方向)
+    segments = np.empty((data_len, 3), dtype=np.int64)
+    n_seg = 0
+    i = 0
+    while i < n_turns:
+        dir1 = turn_dir[i]
+        found = False
+        for j in range(i + 1, n_turns):
+            if turn_dir[j] == -dir1:
+                segments[n_seg, 0] = turn_idx[i]
+                segments[n_seg, 1] = turn_idx[j]
+                segments[n_seg, 2] = dir1
+                n_seg += 1
+                i = j
+                found = True
+                break
+        if not found:
+            break
+
+    # 线段终点随构建顺序递增，倒序扫描即按结束位置降序，取最近4个向下线段
+    down = np.empty(4, dtype=np.int64)
+    n_down = 0
+    for k in range(n_seg - 1, -1, -1):
+        if segments[k, 2] == 1:
+            down[n_down] = k
+            n_down += 1
+            if n_down == 4:
+                break
+
+    if n_down < 4:
+        return pf_out
+
+    seg1_start, seg1_end = segments[down[0], 0], segments[down[0], 1]
+    seg2_start, seg2_end = segments[down[1], 0], segments[down[1], 1]
+    seg3_start, seg3_end = segments[down[2], 0], segments[down[2], 1]
+    seg4_start, seg4_end = segments[down[3], 0], segments[down[3], 1]
+
+    # 判断线段重合
+    seg2_seg3 = segments_overlap(high, low, seg2_start, seg2_end, seg3_start, seg3_end)
+    seg3_seg4 = segments_overlap(high, low, seg3_start, seg3_end, seg4_start, seg4_end)
+    all_overlap = seg2_seg3 and seg3_seg4
+
+    # 线段低点
+    seg1_low = low[seg1_end]
+    seg2_high = high[seg2_start]
+    seg3_high = high[seg3_start]
+    seg4_high = high[seg4_start]
+
+    # 判断输出条件
+    should_output = False
+    if all_overlap:
+        should_output = seg1_low > seg2_high or seg1_low > seg3_high or seg1_low > seg4_high
+    elif seg2_seg3:
+        should_output = seg1_low > seg2_high or seg1_low > seg3_high
+
+    # 最后线段方向判断
+    if should_output and segments[n_seg - 1, 2] == 1:
+        if seg1_end < data_len:
+            pf_out[seg1_end] = 1.0
+        if seg1_start < data_len:
+            pf_out[seg1_start] = -1.0
+    return pf_out
+
 class StockSignalAnalyzer:
+    # 信号股票写入的目标blk文件
+    BLK_OUT_PATHS = (
+        r"D:\zd_hbzq\T0002\blocknew\BSMJB.blk",
+        # r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
+        # r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
+        # r"D:\new_tdx\T0002\blocknew\zxg.blk"
+    )
+
     def __init__(self, blk_file_path, n=10):
         """
         初始化股票信号分析器
@@ -16,65 +114,111 @@ class StockSignalAnalyzer:
         :param n: NEAR_DOWN条件中的K线数量阈值
         """
         self.blk_file_path = blk_file_path
-        self.stock_list = self.load_stock_list()
+        self.blk_mtime = self.get_blk_mtime()  # 记录加载时的修改时间，文件变化时才重新加载
+        # 股票列表按列存放：市场代码、股票代码、完整代码三个平行数组
+        self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
         self.n = n  # NEAR_DOWN参数
-        self.triggered_stocks = set()  # 新增：用于记录已触发的股票代码
+        # 记录已触发的股票代码，启动时从输出blk文件恢复，避免重启后重复触发
+        self.triggered_stocks = self.load_triggered_stocks()
         self.servers = [
             ('152.136.167.10', 7709),
             ('36.153.42.16', 7709)
         ]
-        logging.info(f"初始化完成，共加载 {len(self.stock_list)} 只股票，N参数: {self.n}")
+        # 线程池：每只股票的获取+计算相互独立，并发执行以重叠网络等待
+        self.max_workers = len(self.servers) * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # pytdx长连接池（按线程独占，空闲过久先发心跳），与其他脚本共用gupiaojichu中的实现
+        self.tdx_pool = gupiaojichu.TdxApiPool(self.servers)
+        # blk文件写入缓冲：触发时只记录，每轮结束统一追加写入
+        self.pending_writes = defaultdict(list)
+        self.write_lock = threading.Lock()
+        logging.info(f"初始化完成，共加载 {len(self.full_codes)} 只股票，N参数: {self.n}")
+
+    def load_triggered_stocks(self):
+        """从输出blk文件读取之前已写入的股票，返回完整代码集合 (如 sh600000)"""
+        triggered = set()
+        for file_path in self.BLK_OUT_PATHS:
+            if not os.path.exists(file_path):
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if len(line) >= 7:
+                            market_prefix = 'sz' if line[0] == '0' else 'sh'  # 0:深圳, 1:上海
+                            triggered.add(f"{market_prefix}{line[1:7]}")
+            except Exception as e:
+                logging.error(f"读取已触发股票文件 {file_path} 失败: {e}")
+        if triggered:
+            logging.info(f"从输出blk文件恢复 {len(triggered)} 只已触发股票")
+        return triggered
 
     def load_stock_list(self):
-        """加载股票列表，格式参考原有逻辑"""
-        stock_list = []
+        """加载股票列表，格式参考原有逻辑，返回 (市场代码数组, 股票代码数组, 完整代码数组)"""
         try:
-            with open(self.blk_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(self.blk_file_path, 'rb') as f:
+                data = f.read()
             
-            for line in lines[1:]:  # 跳过首行
-                line = line.strip()
-                if line:
-                    market_code = line[0]
-                    stock_code = line[1:7]
-                    market = 0 if market_code == '0' else 1  # 0:深圳, 1:上海
-                    market_prefix = 'sz' if market == 0 else 'sh'
-                    full_code = f"{market_prefix}{stock_code}"
-                    stock_list.append((market, stock_code, full_code))
+            # 跳过首行，去掉空行后整体切成每行7字节的矩阵：市场代码(1位)+股票代码(6位)
+            lines = np.char.strip(np.array(data.splitlines()[1:], dtype='S'))
+            lines = lines[np.char.str_len(lines) > 0].astype('S7')
+            buf = lines.view(np.uint8).reshape(-1, 7)
+            # 第一位是市场代码（0:深圳, 1:上海），后六位是股票代码
+            # 整列换算pytdx的市场代码和sz/sh前缀，不再逐行判断
+            markets = (buf[:, 0] != ord('0')).astype(np.int8)
+            stock_codes = np.ascontiguousarray(buf[:, 1:]).view('S6').ravel()
+            full_codes = np.char.add(np.where(markets == 0, b'sz', b'sh'), stock_codes)
+            return markets, stock_codes.astype(str), full_codes.astype(str)
         except Exception as e:
             logging.error(f"读取股票列表失败: {e}")
-        return stock_list
+        return np.empty(0, dtype=np.int8), np.empty(0, dtype='U6'), np.empty(0, dtype='U8')
+
+    def get_blk_mtime(self):
+        """获取blk文件修改时间，文件不可访问时返回None"""
+        try:
+            return os.path.getmtime(self.blk_file_path)
+        except OSError:
+            return None
+
+    def refresh_stock_list(self):
+        """blk文件修改时间变化时重新加载股票列表，未变化时不读文件"""
+        mtime = self.get_blk_mtime()
+        if mtime != self.blk_mtime:
+            self.blk_mtime = mtime
+            self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
+            logging.info(f"股票列表文件已变化，重新加载 {len(self.full_codes)} 只股票")
+
+    def pending_stocks(self):
+        """按已触发集合整体过滤股票列表，返回未触发股票的 [(market, stock_code, full_code), ...]"""
+        idx = np.flatnonzero(~np.isin(self.full_codes, list(self.triggered_stocks)))
+        return list(zip(self.markets[idx].tolist(), self.stock_codes[idx].tolist(), self.full_codes[idx].tolist()))
 
     def get_kline_data(self, market, stock_code, full_code):
-        """获取K线数据（包含高开低收等信息）"""
-        api = TdxHq_API()
-        for server_ip, server_port in self.servers:
+        """获取K线数据，按列返回 {'high': [...], 'low': [...], 'close': [...]}，获取失败时返回None"""
+        # 从当前线程的连接池轮询取连接，失败时依次尝试其他服务器
+        local = self.tdx_pool.get()
+        for i in self.tdx_pool.rotation(local):
+            if not self.tdx_pool.ensure(local, i):
+                continue
             try:
-                if api.connect(server_ip, server_port):
-                    # 获取5分钟K线数据(200条)，category=9代表5分钟线
-                    data = api.get_security_bars(2, market, stock_code, 0, 200)
-                    api.disconnect()
-                    
-                    if data:
-                        # 整理数据为字典列表
-                        kline_data = []
-                        for bar in data:
-                            kline_data.append({
-                                'open': float(bar['open']),
-                                'high': float(bar['high']),
-                                'low': float(bar['low']),
-                                'close': float(bar['close']),
-                                'datetime': bar['datetime']
-                            })
-                        return kline_data
-                    else:
-                        logging.warning(f"{full_code} 未获取到K线数据")
-                        return None
-                else:
-                    logging.debug(f"连接服务器 {server_ip}:{server_port} 失败")
+                # 获取5分钟K线数据(200条)，category=9代表5分钟线
+                data = local.api_pool[i].get_security_bars(2, market, stock_code, 0, 200)
             except Exception as e:
                 logging.debug(f"获取 {full_code} 数据出错: {e}")
+                self.tdx_pool.mark_broken(local, i)
                 continue
+            self.tdx_pool.touch(local, i)
+
+            if data:
+                # 只提取信号计算用到的列，不再为每根K线构建字典
+                return {
+                    'high': [float(bar['high']) for bar in data],
+                    'low': [float(bar['low']) for bar in data],
+                    'close': [float(bar['close']) for bar in data],
+                }
+            else:
+                logging.warning(f"{full_code} 未获取到K线数据")
+                return None
         logging.error(f"所有服务器均无法获取 {full_code} 数据")
         return None
 
@@ -83,101 +227,32 @@ class StockSignalAnalyzer:
         data_len = len(frac)
         if len(high) != data_len or len(low) != data_len:
             raise ValueError("输入序列长度必须一致")
-        
-        pf_out = [0.0] * data_len
-        if data_len <= 0:
-            return pf_out
-
-        # 提取转折点
-        turn_points = []
-        for i in range(data_len):
-            val = frac[i]
-            if val != 0.0:
-                turn_points.append((i, int(val)))
-
-        # 构建线段
-        segments = []
-        i = 0
-        while i < len(turn_points):
-            idx1, dir1 = turn_points[i]
-            found = False
-            for j in range(i + 1, len(turn_points)):
-                idx2, dir2 = turn_points[j]
-                if dir2 == -dir1:
-                    segments.append((idx1, idx2, dir1))
-                    i = j
-                    found = True
-                    break
-            if not found:
-                break
 
-        # 筛选向下线段
-        down_segments = [
-            (s, e) for s, e, d in segments if d == 1
-        ]
-        down_segments.sort(key=lambda x: -x[1])  # 按结束位置降序
-
-        if len(down_segments) < 4:
-            return pf_out
-
-        # 取最近4个向下线段
-        seg1, seg2, seg3, seg4 = down_segments[0], down_segments[1], down_segments[2], down_segments[3]
-
-        # 判断线段重合
-        def segments_overlap(a, b):
-            a_high = high[a[0]]
-            a_low = low[a[1]]
-            b_high = high[b[0]]
-            b_low = low[b[1]]
-            return min(a_high,b_high) > max(a_low,b_low)
-
-        seg2_seg3 = segments_overlap(seg2, seg3)
-        seg3_seg4 = segments_overlap(seg3, seg4)
-        all_overlap = seg2_seg3 and seg3_seg4
-
-        # 线段低点
-        seg1_low = low[seg1[1]]
-        seg2_high = high[seg2[0]]
-        seg3_high = high[seg3[0]]
-        seg4_high = high[seg4[0]]
-
-        # 判断输出条件
-        should_output = False
-        if all_overlap:
-            should_output = seg1_low > seg2_high or seg1_low > seg3_high or seg1_low > seg4_high
-        elif seg2_seg3:
-            should_output = seg1_low > seg2_high or seg1_low > seg3_high
-
-        # 最后线段方向判断
-        if should_output and segments and segments[-1][2] == 1:
-            if seg1[1] < data_len:
-                pf_out[seg1[1]] = 1.0
-            if seg1[0] < data_len:
-                pf_out[seg1[0]] = -1.0
-        return pf_out
+        return three_buy2_kernel(
+            np.asarray(frac, dtype=np.float64),
+            np.asarray(high, dtype=np.float64),
+            np.asarray(low, dtype=np.float64),
+        )
 
     def calculate_buy_signal(self, kline_data):
         """计算买入信号，对应通达信公式逻辑"""
-        if not kline_data or len(kline_data) < 20:
+        if not kline_data or len(kline_data['high']) < 20:
             return False, None
 
         # 提取所需数据序列
-        high = [k['high'] for k in kline_data]
-        low = [k['low'] for k in kline_data]
-        close = [k['close'] for k in kline_data]
+        high = kline_data['high']
+        low = kline_data['low']
+        close = kline_data['close']
         data_len = len(high)
 
         # 计算TURNS和TURNS1
         turns = gupiaojichu.identify_turns(data_len,high, low)
         turns1 = self.three_buy2(turns, high, low)
 
-        # 寻找TURNS1中值为1的位置
-        has_one = sum(1 for val in turns1 if val == 1.0) > 0
-        # one_pos = -1
-        # for i in range(data_len-1, -1, -1):
-        #     if turns1[i] == 1.0:
-        #         one_pos = data_len - 1 - i  # 距离当前K线的位置
-        #         break
+        # 寻找TURNS1中值为1的位置（turns1是numpy数组，最后一个非零下标即最近的一个）
+        one_idx = np.flatnonzero(turns1 == 1.0)
+        has_one = one_idx.size > 0
+        # one_pos = data_len - 1 - one_idx[-1] if has_one else -1  # 距离当前K线的位置
 
         # # 计算ZG_VALUE
         # zg_value = 0.0
@@ -193,12 +268,9 @@ class StockSignalAnalyzer:
         # buy_signal = close[-1] > zg_value and zg_value > 0 and near_down
 
         # # 处理TURNS1中值为-1的位置
-        # has_onef = sum(1 for val in turns1 if val == -1.0) > 0
-        # one_posf = -1
-        # for i in range(data_len-1, -1, -1):
-        #     if turns1[i] == -1.0:
-        #         one_posf = data_len - 1 - i
-        #         break
+        # one_idx_f = np.flatnonzero(turns1 == -1.0)
+        # has_onef = one_idx_f.size > 0
+        # one_posf = data_len - 1 - one_idx_f[-1] if has_onef else -1
 
         # # 计算ZG_VALUEF和HHV
         # zg_valuef = 0.0
@@ -219,38 +291,56 @@ class StockSignalAnalyzer:
         return final_signal, zg_value
     
     def write_to_blk_files(self, market, stock_code):
-        """将股票代码写入两个blk文件"""
+        """将股票代码加入blk文件写入缓冲，由flush_blk_files统一落盘"""
         # 组合格式：market(1位) + stock_code(6位)
         blk_code = f"{market}{stock_code}"
-        # 目标文件路径
-        file_paths = [
-            r"D:\zd_hbzq\T0002\blocknew\BSMJB.blk",
-            # r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
-            # r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
-            # r"D:\new_tdx\T0002\blocknew\zxg.blk"
-        ]
+        with self.write_lock:
+            for file_path in self.BLK_OUT_PATHS:
+                self.pending_writes[file_path].append(blk_code)
+
+    def flush_blk_files(self):
+        """把本轮缓冲的股票代码一次性追加写入各blk文件"""
+        with self.write_lock:
+            pending = self.pending_writes
+            self.pending_writes = defaultdict(list)
         
-        for file_path in file_paths:
+        for file_path, blk_codes in pending.items():
             try:
                 # 以追加模式写入，确保文件存在（不存在则创建）
                 with open(file_path, 'a', encoding='utf-8') as f:
-                    f.write(f"{blk_code}\n")
-                logging.info(f"成功将 {blk_code} 写入 {file_path}")
+                    f.write('\n'.join(blk_codes) + '\n')
+                logging.info(f"成功将 {', '.join(blk_codes)} 写入 {file_path}")
             except Exception as e:
                 logging.error(f"写入文件 {file_path} 失败: {e}")
 
+    def check_stock(self, market, stock_code, full_code):
+        """在工作线程中获取单只股票K线并计算信号，获取失败时返回None"""
+        kline_data = self.get_kline_data(market, stock_code, full_code)
+        if not kline_data:
+            return None
+        return self.calculate_buy_signal(kline_data)
+
     def check_all_stocks(self):
         """检查所有股票的买入信号"""
+        self.refresh_stock_list()
         logging.info("开始检查所有股票信号...")
         signal_count = 0
-        
-        for market, stock_code, full_code in self.stock_list:
+
+        # 获取与计算在工作线程并发执行；写blk文件只在主线程进行
+        # 已触发过的股票不再获取数据
+        futures = {
+            self.executor.submit(self.check_stock, market, stock_code, full_code): (market, stock_code, full_code)
+            for market, stock_code, full_code in self.pending_stocks()
+        }
+
+        for future in as_completed(futures):
+            market, stock_code, full_code = futures[future]
             try:
-                kline_data = self.get_kline_data(market, stock_code, full_code)
-                if not kline_data:
+                result = future.result()
+                if result is None:
                     continue
 
-                signal, zg_value = self.calculate_buy_signal(kline_data)
+                signal, zg_value = result
                 if signal and full_code not in self.triggered_stocks:
                     signal_count += 1
                     self.write_to_blk_files(market, stock_code)
@@ -260,19 +350,24 @@ class StockSignalAnalyzer:
             except Exception as e:
                 logging.error(f"处理 {full_code} 时出错: {e}")
 
+        self.flush_blk_files()
         logging.info(f"信号检查完成，共发现 {signal_count} 个买入信号")
         return signal_count
 
     def run(self, interval_seconds=30):
         """运行分析器，定时检查信号"""
         logging.info(f"开始定时信号检查，间隔: {interval_seconds}秒")
-        self.check_all_stocks()  # 立即执行一次
-        
-        schedule.every(interval_seconds).seconds.do(self.check_all_stocks)
+        # 按单调时钟定时：立即执行一次，之后每隔interval_seconds执行一次
+        next_t = time.monotonic()
         try:
             while True:
-                schedule.run_pending()
-                time.sleep(1)
+                self.check_all_stocks()
+                next_t += interval_seconds
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.monotonic()  # 本轮耗时超过间隔，从当前时间重新计时
         except KeyboardInterrupt:
             logging.info("程序被用户中断")
         except Exception as e:
@@ -8,7 +8,19 @@ from pytdx.hq import TdxHq_API
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# blk文件中的市场代码 -> (pytdx市场代码, 完整代码前缀)，0:深圳, 其他:上海
+MARKET_MAP = {'0': (0, 'sz')}
+SH_MARKET = (1, 'sh')
+
 class StockSignalAnalyzer:
+    # 信号股票写入的目标blk文件
+    BLK_OUT_PATHS = (
+        r"D:\zd_hbzq\T0002\blocknew\BSMJB.blk",
+        # r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
+        # r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
+        # r"D:\new_tdx\T0002\blocknew\zxg.blk"
+    )
+
     def __init__(self, blk_file_path, n=10):
         """
         初始化股票信号分析器
@@ -37,8 +49,7 @@ class StockSignalAnalyzer:
                 if line:
                     market_code = line[0]
                     stock_code = line[1:7]
-                    market = 0 if market_code == '0' else 1  # 0:深圳, 1:上海
-                    market_prefix = 'sz' if market == 0 else 'sh'
+                    market, market_prefix = MARKET_MAP.get(market_code, SH_MARKET)
                     full_code = f"{market_prefix}{stock_code}"
                     stock_list.append((market, stock_code, full_code))
         except Exception as e:
@@ -111,11 +122,13 @@ class StockSignalAnalyzer:
             if not found:
                 break
 
-        # 筛选向下线段
-        down_segments = [
-            (s, e) for s, e, d in segments if d == 1
-        ]
-        down_segments.sort(key=lambda x: -x[1])  # 按结束位置降序
+        # 筛选向下线段：线段终点随构建顺序递增，倒序扫描即按结束位置降序，取到4个即停
+        down_segments = []
+        for s, e, d in reversed(segments):
+            if d == 1:
+                down_segments.append((s, e))
+                if len(down_segments) == 4:
+                    break
 
         if len(down_segments) < 4:
             return pf_out
@@ -167,7 +180,7 @@ class StockSignalAnalyzer:
         turns1 = self.three_buy2(turns, high, low)
 
         # 寻找TURNS1中值为1的位置
-        has_one = sum(1 for val in turns1 if val == 1.0) > 0
+        has_one = any(val == 1.0 for val in turns1)  # 找到第一个即停止
         # one_pos = -1
         # for i in range(data_len-1, -1, -1):
         #     if turns1[i] == 1.0:
@@ -188,7 +201,7 @@ class StockSignalAnalyzer:
         # buy_signal = close[-1] > zg_value and zg_value > 0 and near_down
 
         # # 处理TURNS1中值为-1的位置
-        # has_onef = sum(1 for val in turns1 if val == -1.0) > 0
+        # has_onef = any(val == -1.0 for val in turns1)
         # one_posf = -1
         # for i in range(data_len-1, -1, -1):
         #     if turns1[i] == -1.0:
@@ -217,15 +230,8 @@ class StockSignalAnalyzer:
         """将股票代码写入两个blk文件"""
         # 组合格式：market(1位) + stock_code(6位)
         blk_code = f"{market}{stock_code}"
-        # 目标文件路径
-        file_paths = [
-            r"D:\zd_hbzq\T0002\blocknew\BSMJB.blk",
-            # r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
-            # r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
-            # r"D:\new_tdx\T0002\blocknew\zxg.blk"
-        ]
         
-        for file_path in file_paths:
+        for file_path in self.BLK_OUT_PATHS:
             try:
                 # 以追加模式写入，确保文件存在（不存在则创建）
                 with open(file_path, 'a', encoding='utf-8') as f:
@@ -1,14 +1,15 @@
 import pandas as pd
-from pytdx.hq import TdxHq_API
 import redis
 import time
 import schedule
 import os
 from datetime import datetime
 import gupiaojichu
+from gupiaojichu import njit
 import logging
 import json
-import winsound
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 配置日志
 logging.basicConfig(
@@ -20,215 +21,241 @@ logging.basicConfig(
     ]
 )
 
-def identify_turns(high, low):
-    """
-    识别价格转折点（高点和低点）
-    
-    参数:
-        high: 最高价序列（列表或类似可索引对象）
-        low: 最低价序列（列表或类似可索引对象）
-    
-    返回:
-        list: 转折点标记列表，1.0表示高点，-1.0表示低点，0.0表示无转折
-    """
-    data_len = len(high)
-    # 确保high和low长度一致
-    if len(low) != data_len:
-        raise ValueError("high和low必须具有相同的长度")
+@njit(cache=True)
+def identify_turns_kernel(high, low):
+    """identify_turns的编译内核，high/low为float64数组，返回float64转折点数组"""
+    data_len = high.shape[0]
+    # 初始化输出为全0
+    pf_out = np.zeros(data_len, dtype=np.float64)
     
-    # 数据量不足时直接返回全0
+    # 数据量不足时直接返回
     if data_len <= 6:
-        return [0.0] * data_len
+        return pf_out
     
-    turns = []  # 存储候选转折点 (索引, 类型)，1为高点，-1为低点
+    # 候选转折点，turn_idx为索引，turn_type为类型（1为高点，-1为低点），每根K线最多两个
+    turn_idx = np.empty(2 * data_len, dtype=np.int64)
+    turn_type = np.empty(2 * data_len, dtype=np.int64)
+    n_turns = 0
     
-    # 处理中间部分数据（前后都有足够数据）
+    # 处理中间部分数据（前后均有4根K线）
     for i in range(4, data_len - 4):
-        current_high = high[i]
-        current_low = low[i]
-        
-        # 计算前后4根K线的最高值（不含当前）
-        max_prev_next_high = float('-inf')
-        # 前4根（i-4到i-1）
+        # 计算前后4根K线的最高值和最低值（不含当前）
+        max_prev_next_high = -np.inf
+        min_prev_next_low = np.inf
         for j in range(i - 4, i):
             max_prev_next_high = max(max_prev_next_high, high[j])
-        # 后4根（i+1到i+4）
-        for j in range(i + 1, i + 5):
-            max_prev_next_high = max(max_prev_next_high, high[j])
-        
-        # 计算前后4根K线的最低值（不含当前）
-        min_prev_next_low = float('inf')
-        # 前4根（i-4到i-1）
-        for j in range(i - 4, i):
             min_prev_next_low = min(min_prev_next_low, low[j])
-        # 后4根（i+1到i+4）
         for j in range(i + 1, i + 5):
+            max_prev_next_high = max(max_prev_next_high, high[j])
             min_prev_next_low = min(min_prev_next_low, low[j])
         
-        # 判断是否为高点
-        if current_high >= max_prev_next_high:
-            turns.append((i, 1))
-        # 判断是否为低点
-        if current_low <= min_prev_next_low:
-            turns.append((i, -1))
-    
-    # 处理最后4根K线（后面没有足够数据）
-    start = max(0, data_len - 4)
-    for i in range(start, data_len):
-        current_high = high[i]
-        current_low = low[i]
-        
-        # 只检查前4根数据
-        start_prev = max(0, i - 4)
-        max_prev_high = float('-inf')
-        min_prev_low = float('inf')
-        
-        for j in range(start_prev, i):
+        # 判断高点/低点
+        if high[i] >= max_prev_next_high:
+            turn_idx[n_turns] = i
+            turn_type[n_turns] = 1
+            n_turns += 1
+        if low[i] <= min_prev_next_low:
+            turn_idx[n_turns] = i
+            turn_type[n_turns] = -1
+            n_turns += 1
+    
+    # 处理最后4根K线（后面无足够数据），只检查前4根数据
+    for i in range(max(0, data_len - 4), data_len):
+        max_prev_high = -np.inf
+        min_prev_low = np.inf
+        for j in range(max(0, i - 4), i):
             max_prev_high = max(max_prev_high, high[j])
             min_prev_low = min(min_prev_low, low[j])
         
-        # 判断是否为高点（只需大于前4根最高）
-        if current_high >= max_prev_high:
-            turns.append((i, 1))
-        # 判断是否为低点（只需小于前4根最低）
-        if current_low <= min_prev_low:
-            turns.append((i, -1))
-    
-    # 合并连续相同类型的转折点，保留最优值（高点保留最高，低点保留最低）
-    new_turns = []
+        # 判断高点/低点
+        if high[i] >= max_prev_high:
+            turn_idx[n_turns] = i
+            turn_type[n_turns] = 1
+            n_turns += 1
+        if low[i] <= min_prev_low:
+            turn_idx[n_turns] = i
+            turn_type[n_turns] = -1
+            n_turns += 1
+    
+    # 合并连续相同类型的转折点（保留最优值）
+    new_idx = np.empty(n_turns, dtype=np.int64)
+    new_type = np.empty(n_turns, dtype=np.int64)
+    n_new = 0
     i = 0
-    while i < len(turns):
-        current_index, current_type = turns[i]
+    while i < n_turns:
+        current_index = turn_idx[i]
+        current_type = turn_type[i]
         current_high_val = high[current_index]
         current_low_val = low[current_index]
         
         j = i + 1
-        while j < len(turns) and turns[j][1] == current_type:
-            j_index = turns[j][0]
-            if current_type == 1:  # 高点，保留更高的
-                if high[j_index] > current_high_val:
-                    current_index = j_index
-                    current_high_val = high[j_index]
-            else:  # 低点，保留更低的
-                if low[j_index] < current_low_val:
-                    current_index = j_index
-                    current_low_val = low[j_index]
+        while j < n_turns and turn_type[j] == current_type:
+            j_index = turn_idx[j]
+            if current_type == 1 and high[j_index] > current_high_val:
+                current_index = j_index
+                current_high_val = high[j_index]
+            elif current_type == -1 and low[j_index] < current_low_val:
+                current_index = j_index
+                current_low_val = low[j_index]
             j += 1
         
-        new_turns.append((current_index, current_type))
+        new_idx[n_new] = current_index
+        new_type[n_new] = current_type
+        n_new += 1
         i = j
     
-    # 转折点数量不足时返回全0
-    if len(new_turns) <= 3:
-        return [0.0] * data_len
-    
-    # 验证转折点的交替性（高-低-高 或 低-高-低）
-    confirmed_turns = []
-    for i in range(len(new_turns) - 1):
-        idx1, t1 = new_turns[i]
-        idx2, t2 = new_turns[i + 1]
-        if (t1 == 1 and t2 == -1) or (t1 == -1 and t2 == 1):
-            confirmed_turns.append((idx1, t1))
+    # 转折点数量不足时返回
+    if n_new <= 3:
+        return pf_out
     
-    # 构建输出结果
-    pf_out = [0.0] * data_len
-    for index, frac in confirmed_turns:
-        if index < data_len:
-            pf_out[index] = float(frac)
+    # 验证转折点交替性（高-低-高 或 低-高-低），与后一个转折点类型不同的才确认
+    for k in range(n_new - 1):
+        if new_type[k] != new_type[k + 1]:
+            pf_out[new_idx[k]] = float(new_type[k])
     
     return pf_out
 
-def three_buy_variant(frac, high, low):
+def identify_turns(high, low):
     """
-    识别三买变体信号
+    识别价格转折点（高点和低点）
     
     参数:
-        frac: 转折点标记列表（1.0为高点，-1.0为低点，0.0无转折）
-        high: 最高价序列
-        low: 最低价序列
+        high: 最高价序列（列表或类似可索引对象）
+        low: 最低价序列（列表或类似可索引对象）
     
     返回:
-        list: 信号列表，1.0表示存在三买变体信号，0.0表示无
+        list: 转折点标记列表，1.0表示高点，-1.0表示低点，0.0表示无转折
     """
     data_len = len(high)
-    # 确保输入数组长度一致
-    if len(low) != data_len or len(frac) != data_len:
-        raise ValueError("frac、high、low必须具有相同的长度")
+    # 确保high和low长度一致
+    if len(low) != data_len:
+        raise ValueError("high和low必须具有相同的长度")
+    
+    return identify_turns_kernel(
+        np.asarray(high, dtype=np.float64),
+        np.asarray(low, dtype=np.float64),
+    ).tolist()
+
+def cannot_break_out(high):
+    """
+    快速排除最后一根K线不可能突破的情况，满足时无需计算转折点
+    
+    信号要求最后一根K线最高价高于某个向下线段起点的高点，起点是下标不小于4且在最后一根之前的转折点，
+    若最后一根的最高价不高于这段区间的最低值，则任何起点都不可能被突破。
+    这是精确的必要条件，不会漏掉信号；按固定比例估计近期高点的办法会漏掉起点较低的线段，不采用。
+    """
+    return len(high) > 5 and high[-1] <= min(high[4:-1])
+
+@njit(cache=True)
+def three_buy_variant_kernel(frac, high, low, need_both):
+    """
+    三买变体的编译内核：由转折点构建线段并判断信号
     
-    # 初始化输出数组为0
-    pf_out = [0.0] * data_len
+    参数:
+        frac/high/low: float64数组
+        need_both: 为True时最后一根K线需同时突破最近两个向下线段的起点高点，为False时突破其一即可
     
+    返回:
+        float64数组，最后一根K线为1.0表示存在信号
+    """
+    data_len = high.shape[0]
+    pf_out = np.zeros(data_len, dtype=np.float64)
     if data_len <= 0:
         return pf_out
     
-    # 1. 提取所有转折点 (索引, 类型)，类型为1（高点）或-1（低点）
-    turn_points = []
+    # 1. 提取所有转折点，类型为1（高点）或-1（低点）
+    turn_idx = np.empty(data_len, dtype=np.int64)
+    turn_dir = np.empty(data_len, dtype=np.int64)
+    n_turns = 0
     for i in range(data_len):
         val = frac[i]
         if val != 0.0:
-            turn_points.append((i, int(val)))
+            turn_idx[n_turns] = i
+            turn_dir[n_turns] = int(val)
+            n_turns += 1
     
-    # 2. 构建线段（确保转折点方向交替）
-    segments = []  # 元素为 (起点索引, 终点索引, 方向)，方向为起点的类型（1或-1）
+    # 2. 构建线段（确保转折点方向交替），每行为 (起点索引, 终点索引, 方向)
+    segments = np.empty((data_len, 3), dtype=np.int64)
+    n_seg = 0
     i = 0
-    while i < len(turn_points):
-        idx1, dir1 = turn_points[i]
+    while i < n_turns:
+        dir1 = turn_dir[i]
         found = False
         # 寻找下一个相反方向的转折点
-        for j in range(i + 1, len(turn_points)):
-            idx2, dir2 = turn_points[j]
-            if dir2 == -dir1:  # 方向相反
-                segments.append((idx1, idx2, dir1))
+        for j in range(i + 1, n_turns):
+            if turn_dir[j] == -dir1:
+                segments[n_seg, 0] = turn_idx[i]
+                segments[n_seg, 1] = turn_idx[j]
+                segments[n_seg, 2] = dir1
+                n_seg += 1
                 i = j  # 跳到下一个线段的起点
                 found = True
                 break
         if not found:
             break  # 找不到相反方向的转折点，终止构建
     
-    # 3. 筛选向下线段（方向为1：从高点到低点）
-    down_segments = []
-    for seg in segments:
-        start_idx, end_idx, direction = seg
-        if direction == 1:  # 高点到低点，属于向下线段
-            down_segments.append((start_idx, end_idx))
-    
-    # 按线段结束位置从近到远排序（最近的在前面）
-    down_segments.sort(key=lambda x: -x[1])  # 按end_idx降序排列
+    # 3. 取最近的3个向下线段（方向为1：从高点到低点）
+    # 线段终点随构建顺序递增，倒序扫描即按结束位置从近到远，取到3个即停，不需要排序
+    down = np.empty(3, dtype=np.int64)
+    n_down = 0
+    for k in range(n_seg - 1, -1, -1):
+        if segments[k, 2] == 1:
+            down[n_down] = k
+            n_down += 1
+            if n_down == 3:
+                break
     
     # 至少需要3个向下线段才可能形成信号
-    if len(down_segments) < 3:
+    if n_down < 3:
         return pf_out
     
-    # 取最近的3个向下线段
-    latest_seg = down_segments[0]    # 最近的向下线段
-    prev_seg = down_segments[1]      # 前一个向下线段
-    prev2_seg = down_segments[2]     # 前两个向下线段
+    latest_start, latest_end = segments[down[0], 0], segments[down[0], 1]  # 最近的向下线段
+    prev_start, prev_end = segments[down[1], 0], segments[down[1], 1]      # 前一个向下线段
+    prev2_end = segments[down[2], 1]                                       # 前两个向下线段
     
     # 4. 条件1：低点依次降低（前2线段低点 > 前1线段低点 > 最近线段低点）
-    latest_low = low[latest_seg[1]]    # 最近线段终点（低点）的价格
-    prev_low = low[prev_seg[1]]        # 前一线段终点（低点）的价格
-    prev2_low = low[prev2_seg[1]]      # 前两线段终点（低点）的价格
-    
-    # 检查低点是否依次降低
-    if prev_low >= prev2_low:
-        return pf_out  # 前一线段低点不低于前两线段，不满足
-    if latest_low >= prev_low:
-        return pf_out  # 最近线段低点不低于前一线段，不满足
-    
-    # 5. 条件2：最后一根K线价格突破最近两个向下线段的起点高点之一
-    last_k_idx = data_len - 1  # 最后一根K线的索引
-    last_k_price = high[last_k_idx]  # 最后一根K线的最高价（保持原逻辑）
-    
-    latest_seg_high = high[latest_seg[0]]  # 最近向下线段起点（高点）的价格
-    prev_seg_high = high[prev_seg[0]]      # 前一向下线段起点（高点）的价格
+    if low[prev_end] >= low[prev2_end] or low[latest_end] >= low[prev_end]:
+        return pf_out
     
-    if last_k_price > latest_seg_high and last_k_price > prev_seg_high:
+    # 5. 条件2：最后一根K线的最高价突破最近两个向下线段的起点高点
+    last_k_idx = data_len - 1
+    last_k_price = high[last_k_idx]
+    above_latest = last_k_price > high[latest_start]
+    above_prev = last_k_price > high[prev_start]
+    if need_both:
+        ok = above_latest and above_prev
+    else:
+        ok = above_latest or above_prev
+    if ok:
         # 所有条件满足，标记信号
         pf_out[last_k_idx] = 1.0
-        return pf_out
-    
     return pf_out
 
+def three_buy_variant(frac, high, low):
+    """
+    识别三买变体信号
+    
+    参数:
+        frac: 转折点标记列表（1.0为高点，-1.0为低点，0.0无转折）
+        high: 最高价序列
+        low: 最低价序列
+    
+    返回:
+        numpy数组: 信号数组，1.0表示存在三买变体信号，0.0表示无
+    """
+    data_len = len(high)
+    # 确保输入数组长度一致
+    if len(low) != data_len or len(frac) != data_len:
+        raise ValueError("frac、high、low必须具有相同的长度")
+    
+    # 最后一根K线需同时突破最近两个向下线段的起点高点
+    return three_buy_variant_kernel(
+        np.asarray(frac, dtype=np.float64),
+        np.asarray(high, dtype=np.float64),
+        np.asarray(low, dtype=np.float64),
+        True,
+    )
+
 def identify_three_buy_variant(high, low):
     """
     从高低点序列识别三买变体信号
@@ -238,168 +265,31 @@ def identify_three_buy_variant(high, low):
         low: 最低价序列（列表或类似可索引对象）
     
     返回:
-        list: 信号列表，1.0表示存在三买变体信号，0.0表示无
+        numpy数组: 信号数组，1.0表示存在三买变体信号，0.0表示无
     """
     data_len = len(high)
     # 确保输入序列长度一致
     if len(low) != data_len:
         raise ValueError("high和low必须具有相同的长度")
     
-    # 初始化输出信号为全0
-    pf_out = [0.0] * data_len
-    
-    # 数据量不足时直接返回
-    if data_len <= 6:
-        return pf_out
-    
-    # --------------------------
-    # 第一步：识别转折点（整合identify_turns逻辑）
-    # --------------------------
-    turns = []  # 候选转折点 (索引, 类型)，1为高点，-1为低点
-    
-    # 处理中间部分数据（前后均有4根K线）
-    for i in range(4, data_len - 4):
-        current_high = high[i]
-        current_low = low[i]
-        
-        # 计算前后4根K线的最高值（不含当前）
-        max_prev_next_high = float('-inf')
-        for j in range(i - 4, i):
-            max_prev_next_high = max(max_prev_next_high, high[j])
-        for j in range(i + 1, i + 5):
-            max_prev_next_high = max(max_prev_next_high, high[j])
-        
-        # 计算前后4根K线的最低值（不含当前）
-        min_prev_next_low = float('inf')
-        for j in range(i - 4, i):
-            min_prev_next_low = min(min_prev_next_low, low[j])
-        for j in range(i + 1, i + 5):
-            min_prev_next_low = min(min_prev_next_low, low[j])
-        
-        # 判断高点/低点
-        if current_high >= max_prev_next_high:
-            turns.append((i, 1))
-        if current_low <= min_prev_next_low:
-            turns.append((i, -1))
-    
-    # 处理最后4根K线（后面无足够数据）
-    start = max(0, data_len - 4)
-    for i in range(start, data_len):
-        current_high = high[i]
-        current_low = low[i]
-        
-        # 只检查前4根数据
-        start_prev = max(0, i - 4)
-        max_prev_high = float('-inf')
-        min_prev_low = float('inf')
-        for j in range(start_prev, i):
-            max_prev_high = max(max_prev_high, high[j])
-            min_prev_low = min(min_prev_low, low[j])
-        
-        # 判断高点/低点
-        if current_high >= max_prev_high:
-            turns.append((i, 1))
-        if current_low <= min_prev_low:
-            turns.append((i, -1))
-    
-    # 合并连续相同类型的转折点（保留最优值）
-    new_turns = []
-    i = 0
-    while i < len(turns):
-        current_index, current_type = turns[i]
-        current_high_val = high[current_index]
-        current_low_val = low[current_index]
-        
-        j = i + 1
-        while j < len(turns) and turns[j][1] == current_type:
-            j_index = turns[j][0]
-            if current_type == 1 and high[j_index] > current_high_val:
-                current_index = j_index
-                current_high_val = high[j_index]
-            elif current_type == -1 and low[j_index] < current_low_val:
-                current_index = j_index
-                current_low_val = low[j_index]
-            j += 1
-        
-        new_turns.append((current_index, current_type))
-        i = j
-    
-    # 转折点数量不足时返回
-    if len(new_turns) <= 3:
-        return pf_out
-    
-    # 验证转折点交替性，生成最终转折点列表（frac）
-    frac = [0.0] * data_len
-    for i in range(len(new_turns) - 1):
-        idx1, t1 = new_turns[i]
-        idx2, t2 = new_turns[i + 1]
-        if (t1 == 1 and t2 == -1) or (t1 == -1 and t2 == 1):
-            if idx1 < data_len:
-                frac[idx1] = float(t1)
-    
-    # --------------------------
-    # 第二步：识别三买变体信号（整合three_buy_variant逻辑）
-    # --------------------------
-    # 提取所有转折点
-    turn_points = []
-    for i in range(data_len):
-        val = frac[i]
-        if val != 0.0:
-            turn_points.append((i, int(val)))
+    # 最后一根K线不可能突破时，跳过数组转换和转折点识别
+    if cannot_break_out(high):
+        return np.zeros(data_len, dtype=np.float64)
     
-    # 构建交替线段
-    segments = []  # (起点索引, 终点索引, 方向)
-    i = 0
-    while i < len(turn_points):
-        idx1, dir1 = turn_points[i]
-        found = False
-        for j in range(i + 1, len(turn_points)):
-            idx2, dir2 = turn_points[j]
-            if dir2 == -dir1:
-                segments.append((idx1, idx2, dir1))
-                i = j
-                found = True
-                break
-        if not found:
-            break
-    
-    # 筛选向下线段（方向为1：高点到低点）
-    down_segments = [
-        (start, end) for start, end, dir in segments
-        if dir == 1
-    ]
-    
-    # 按结束位置从近到远排序
-    down_segments.sort(key=lambda x: -x[1])
-    
-    # 至少需要3个向下线段
-    if len(down_segments) < 3:
-        return pf_out
-    
-    # 取最近的3个向下线段
-    latest_seg, prev_seg, prev2_seg = down_segments[0], down_segments[1], down_segments[2]
-    
-    # 条件1：低点依次降低
-    latest_low = low[latest_seg[1]]
-    prev_low = low[prev_seg[1]]
-    prev2_low = low[prev2_seg[1]]
-    if prev_low >= prev2_low or latest_low >= prev_low:
-        return pf_out
-    
-    # 条件2：最后一根K线突破最近两个向下线段的起点高点之一
-    last_k_idx = data_len - 1
-    last_k_price = high[last_k_idx]
-    latest_seg_high = high[latest_seg[0]]
-    prev_seg_high = high[prev_seg[0]]
-    if last_k_price <= latest_seg_high and last_k_price <= prev_seg_high:
-        return pf_out
-    
-    # 所有条件满足，标记信号
-    pf_out[last_k_idx] = 1.0
-    
-    return pf_out
+    # 转折点识别与identify_turns共用同一内核，再交给线段内核；最后一根K线突破最近两个向下线段的起点高点之一即可
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    return three_buy_variant_kernel(identify_turns_kernel(h, l), h, l, False)
 
 class StockDataCollector:
+    # 信号股票写入的目标blk文件
+    BLK_OUT_PATHS = (
+        r"D:\zd_hbzq\T0002\blocknew\QBGRX.blk",
+        r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
+        r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
+        r"D:\new_tdx\T0002\blocknew\zxg.blk",
+    )
+
     def __init__(self, blk_file_path):
         """
         初始化股票数据收集器
@@ -411,55 +301,69 @@ class StockDataCollector:
             redis_db: Redis数据库编号
         """
         self.blk_file_path = blk_file_path
-        self.stock_list = self.load_stock_list()
+        self.blk_mtime = self.get_blk_mtime()  # 记录加载时的修改时间，文件变化时才重新加载
+        self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
         self.triggered_stocks = set()  # 新增：用于记录已触发的股票代码
         # 服务器列表
         self.servers = [
             ('152.136.167.10', 7709),
             ('36.153.42.16', 7709)
         ]
+        # 线程池：每只股票的获取+计算相互独立，并发执行以重叠网络等待
+        self.max_workers = len(self.servers) * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # pytdx长连接池（按线程独占，空闲过久先发心跳），与其他脚本共用gupiaojichu中的实现
+        self.tdx_pool = gupiaojichu.TdxApiPool(self.servers)
+        # 信号计算缓存：{full_code: (high列表, low列表, 信号数组)}，K线没有变化时直接复用上次结果
+        self.turn_cache = {}
+        # 启动时先调用一次numba内核完成编译（cache=True后续启动直接读缓存），避免第一轮轮询卡住
+        dummy = np.zeros(10, dtype=np.float64)
+        three_buy_variant(dummy, dummy, dummy)
+        # 后台蜂鸣提醒，与其他脚本共用gupiaojichu中的实现
+        self.beeper = gupiaojichu.Beeper()
         
-        logging.info(f"初始化完成，共加载 {len(self.stock_list)} 只股票")
+        logging.info(f"初始化完成，共加载 {len(self.full_codes)} 只股票")
     
     def load_stock_list(self):
         """
         从blk文件加载股票列表
         
         Returns:
-            list: 股票代码列表，格式为 [('市场代码', '股票代码', '完整代码'), ...]
+            tuple: (市场代码数组, 股票代码数组, 完整代码数组)，三个数组按行对应
         """
-        stock_list = []
-        
         try:
-            with open(self.blk_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(self.blk_file_path, 'rb') as f:
+                data = f.read()
                 
-            # 跳过第一行空白，从第二行开始处理
-            for line in lines[1:]:
-                line = line.strip()
-                if line:
-                    # 第一位是市场代码，后六位是股票代码
-                    market_code = line[0]
-                    stock_code = line[1:7]
-                    
-                    # 将市场代码转换为pytdx需要的格式
-                    # 0: 深圳, 1: 上海
-                    if market_code == '0':
-                        market = 0  # 深圳
-                        market_prefix = 'sz'
-                    else:
-                        market = 1  # 上海
-                        market_prefix = 'sh'
-                    
-                    full_code = f"{market_prefix}{stock_code}"
-                    stock_list.append((market, stock_code, full_code))
-                    
-                    logging.debug(f"加载股票: {full_code}")
-                    
+            # 跳过第一行空白，从第二行开始处理；去掉空行后整体切成每行7字节的矩阵
+            lines = np.char.strip(np.array(data.splitlines()[1:], dtype='S'))
+            lines = lines[np.char.str_len(lines) > 0].astype('S7')
+            buf = lines.view(np.uint8).reshape(-1, 7)
+            # 第一位是市场代码，后六位是股票代码
+            # 整列换算pytdx的市场代码和sz/sh前缀（0: 深圳, 1: 上海），不再逐行判断
+            markets = (buf[:, 0] != ord('0')).astype(np.int8)
+            stock_codes = np.ascontiguousarray(buf[:, 1:]).view('S6').ravel()
+            full_codes = np.char.add(np.where(markets == 0, b'sz', b'sh'), stock_codes)
+            return markets, stock_codes.astype(str), full_codes.astype(str)
         except Exception as e:
             logging.error(f"读取blk文件失败: {e}")
             
-        return stock_list
+        return np.empty(0, dtype=np.int8), np.empty(0, dtype='U6'), np.empty(0, dtype='U8')
+    
+    def get_blk_mtime(self):
+        """获取blk文件修改时间，文件不可访问时返回None"""
+        try:
+            return os.path.getmtime(self.blk_file_path)
+        except OSError:
+            return None
+    
+    def refresh_stock_list(self):
+        """blk文件修改时间变化时重新加载股票列表，未变化时不读文件"""
+        mtime = self.get_blk_mtime()
+        if mtime != self.blk_mtime:
+            self.blk_mtime = mtime
+            self.markets, self.stock_codes, self.full_codes = self.load_stock_list()
+            logging.info(f"blk文件已变化，重新加载 {len(self.full_codes)} 只股票")
     
     def get_5min_data(self, market, stock_code, full_code):
         """
@@ -471,69 +375,45 @@ class StockDataCollector:
             full_code: 完整股票代码 (如 sh600000)
             
         Returns:
-            list or None: 200条K线数据，每条包含open, close, high, low, datetime
+            tuple: (最高价列表, 最低价列表)，获取失败时为 (None, None)
         """
-        api = TdxHq_API()
+        # 从当前线程的连接池轮询取连接，失败时依次尝试其他服务器
+        local = self.tdx_pool.get()
         
-        # 尝试所有服务器直到成功
-        for server_ip, server_port in self.servers:
+        for i in self.tdx_pool.rotation(local):
+            server_ip, server_port = self.servers[i]
+            if not self.tdx_pool.ensure(local, i):
+                continue
+            
             try:
-                if api.connect(server_ip, server_port):
-                    logging.debug(f"成功连接到服务器 {server_ip}:{server_port}，获取 {full_code}")
-                    
-                    # 获取5分钟K线数据 (category=0)，获取200条
-                    data = api.get_security_bars(0, market, stock_code, 0, 200)
-                    api.disconnect()
-                    
-                    if data:
-                        # 处理所有200条数据
-                        result_list = []
-                        result_list_high = []
-                        result_list_low = []
-                        for bar in data:
-                            # 提取需要的字段
-                            result = {
-                                'open': float(bar['open']),
-                                'high': float(bar['high']),
-                                'low': float(bar['low']),
-                                'close': float(bar['close']),
-                                'datetime': bar['datetime']
-                            }
-                            result_list_high.append(float(bar['high']))
-                            result_list_low.append(float(bar['low']))
-                            result_list.append(result)
-                        
-                        # 按时间排序（从旧到新）
-                        # result_list.sort(key=lambda x: x['datetime'])
-                        
-                        logging.debug(f"成功获取 {full_code} 数据: {len(result_list)} 条")
-                        return result_list,result_list_high,result_list_low
-                    else:
-                        logging.warning(f"未获取到 {full_code} 的数据")
-                        return None,None,None
-                else:
-                    logging.debug(f"连接服务器 {server_ip}:{server_port} 失败")
-                    
+                # 获取5分钟K线数据 (category=0)，获取200条
+                data = local.api_pool[i].get_security_bars(0, market, stock_code, 0, 200)
             except Exception as e:
                 logging.debug(f"服务器 {server_ip}:{server_port} 获取 {full_code} 出错: {e}")
+                self.tdx_pool.mark_broken(local, i)
                 continue
+            self.tdx_pool.touch(local, i)
+            
+            if data:
+                # 下游只用到high和low，直接提取两列；pytdx解析出的价格已是float，无需再转换
+                result_list_high = [bar['high'] for bar in data]
+                result_list_low = [bar['low'] for bar in data]
+                
+                logging.debug(f"成功获取 {full_code} 数据: {len(result_list_high)} 条")
+                return result_list_high,result_list_low
+            else:
+                logging.warning(f"未获取到 {full_code} 的数据")
+                return None,None
                 
         logging.error(f"所有服务器都无法获取 {full_code} 的数据")
-        return None,None,None
+        return None,None
     
     def write_to_blk_files(self, market, stock_code):
         """将股票代码写入两个blk文件"""
         # 组合格式：market(1位) + stock_code(6位)
         blk_code = f"{market}{stock_code}"
-        # 目标文件路径
-        file_paths = [
-            r"D:\zd_hbzq\T0002\blocknew\QBGRX.blk",
-            r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
-            r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
-            r"D:\new_tdx\T0002\blocknew\zxg.blk"
-        ]
         
-        for file_path in file_paths:
+        for file_path in self.BLK_OUT_PATHS:
             try:
                 # 以追加模式写入，确保文件存在（不存在则创建）
                 with open(file_path, 'a', encoding='utf-8') as f:
@@ -542,30 +422,66 @@ class StockDataCollector:
             except Exception as e:
                 logging.error(f"写入文件 {file_path} 失败: {e}")
 
+    def check_stock(self, market, stock_code, full_code):
+        """
+        在工作线程中获取单只股票数据并计算三买变体信号
+        
+        Returns:
+            bool or None: 最后一根K线是否出现信号，获取数据失败时返回None
+        """
+        # 获取股票数据（200条）
+        stock_data_high,stock_data_low = self.get_5min_data(market, stock_code, full_code)
+        
+        if not stock_data_high:
+            return None
+        
+        # 最后一根K线不可能突破任何线段起点时信号必为0，省掉纯Python的转折点识别
+        if cannot_break_out(stock_data_high):
+            return False
+        
+        # 2秒一轮，同一根5分钟K线内多数轮次取到的高低点完全相同，此时不必重算转折点
+        cached = self.turn_cache.get(full_code)
+        if cached and cached[0] == stock_data_high and cached[1] == stock_data_low:
+            ok = cached[2]
+        else:
+            data_len = len(stock_data_high)
+            stock_data_frac =gupiaojichu.identify_turns(data_len,stock_data_high,stock_data_low)
+            ok = three_buy_variant(stock_data_frac,stock_data_high,stock_data_low)
+            # ok = identify_three_buy_variant(stock_data_high,stock_data_low)
+            self.turn_cache[full_code] = (stock_data_high, stock_data_low, ok)
+        return bool(ok[-1] == 1.0)
+
     def update_all_stocks(self):
         """
         更新所有股票数据到Redis
         """
-        self.stock_list = self.load_stock_list()
+        self.refresh_stock_list()
         success_count = 0
         fail_count = 0
         
         logging.info("开始更新所有股票数据...")
         
-        for market, stock_code, full_code in self.stock_list:
+        # 获取与计算在工作线程并发执行；写blk文件和蜂鸣只在主线程进行，避免争用文件和音频设备
+        # 三个数组一次性转成Python列表按下标分发，pytdx拿到的是原生int/str，不必逐行拆元组
+        markets = self.markets.tolist()
+        stock_codes = self.stock_codes.tolist()
+        full_codes = self.full_codes.tolist()
+        futures = {
+            self.executor.submit(self.check_stock, markets[i], stock_codes[i], full_codes[i]): i
+            for i in range(len(full_codes))
+        }
+        
+        for future in as_completed(futures):
+            i = futures[future]
+            market, stock_code, full_code = markets[i], stock_codes[i], full_codes[i]
             try:
-                # 获取股票数据（200条）
-                stock_data,stock_data_high,stock_data_low = self.get_5min_data(market, stock_code, full_code)
+                ok = future.result()
                 
-                if stock_data:
-                    data_len = len(stock_data_high)
-                    stock_data_frac =gupiaojichu.identify_turns(data_len,stock_data_high,stock_data_low)
-                    ok = three_buy_variant(stock_data_frac,stock_data_high,stock_data_low)
-                    # ok = identify_three_buy_variant(stock_data_high,stock_data_low)
-                    if  ok[-1] ==1.0 and full_code not in self.triggered_stocks:
+                if ok is not None:
+                    if ok and full_code not in self.triggered_stocks:
                         self.write_to_blk_files(market, stock_code)
                         logging.warning(f"强势背驰股票： {stock_code}")
-                        winsound.Beep(1000, 500)  # 1000Hz频率，持续500毫秒
+                        self.beeper.beep()
                         self.triggered_stocks.add(full_code)  # 记录已触发的股票
                  
                     success_count += 1
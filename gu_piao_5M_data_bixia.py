@@ -1,14 +1,16 @@
 import pandas as pd
-from pytdx.hq import TdxHq_API
 import redis
 import time
 import schedule
 import os
 from datetime import datetime
 import gupiaojichu
+from gupiaojichu import njit
 import logging
 import json
-import winsound
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 配置日志
 logging.basicConfig(
@@ -20,88 +22,60 @@ logging.basicConfig(
     ]
 )
 
-def three_buy_variant(frac, high, low):
+@njit(cache=True)
+def three_buy_variant_kernel(frac, high, low):
     """
-    识别三买变体信号
-    
-    参数:
-        frac: 转折点标记列表（1.0为高点，-1.0为低点，0.0无转折）
-        high: 最高价序列
-        low: 最低价序列
-    
-    返回:
-        list: 信号列表，1.0表示存在三买变体信号，0.0表示无
+    three_buy_variant的编译内核，frac/high/low为float64数组，返回float64信号数组
+    不改用pandas的where/ffill/tail写法：线段要求方向交替，连续同方向的转折点只取第一个，
+    直接按frac筛高低点取tail会取到被跳过的点；且只需倒序找到4个向下线段即可停止，逐点扫描比整列运算更省
     """
-    data_len = len(high)
-    # 确保输入数组长度一致
-    if len(low) != data_len or len(frac) != data_len:
-        raise ValueError("frac、high、low必须具有相同的长度")
-    
-    # 初始化输出数组为0
-    pf_out = [0.0] * data_len
-    
+    data_len = high.shape[0]
+    pf_out = np.zeros(data_len, dtype=np.float64)
     if data_len <= 0:
         return pf_out
     
-    # 1. 提取所有转折点 (索引, 类型)，类型为1（高点）或-1（低点）
-    turn_points = []
+    # 1-2. 提取转折点并构建线段（确保转折点方向交替）
+    # 从起点向后找第一个相反方向的转折点作为终点，终点再作为下一段的起点，
+    # 即连续同方向的转折点只保留第一个，相邻保留点两两构成线段：第k段为 (seg_pts[k], seg_pts[k+1])，方向为seg_dir[k]
+    seg_pts = np.empty(data_len, dtype=np.int64)
+    seg_dir = np.empty(data_len, dtype=np.int64)
+    n_pts = 0
     for i in range(data_len):
         val = frac[i]
-        if val != 0.0:
-            turn_points.append((i, int(val)))
+        if val != 0.0 and (n_pts == 0 or int(val) != seg_dir[n_pts - 1]):
+            seg_pts[n_pts] = i
+            seg_dir[n_pts] = int(val)
+            n_pts += 1
     
-    # 2. 构建线段（确保转折点方向交替）
-    segments = []  # 元素为 (起点索引, 终点索引, 方向)，方向为起点的类型（1或-1）
-    i = 0
-    while i < len(turn_points):
-        idx1, dir1 = turn_points[i]
-        found = False
-        # 寻找下一个相反方向的转折点
-        for j in range(i + 1, len(turn_points)):
-            idx2, dir2 = turn_points[j]
-            if dir2 == -dir1:  # 方向相反
-                segments.append((idx1, idx2, dir1))
-                i = j  # 跳到下一个线段的起点
-                found = True
+    # 3. 倒序扫描向下线段（方向为1：从高点到低点），线段终点随下标递增，先遇到的即最近的
+    down = np.empty(3, dtype=np.int64)
+    n_down = 0
+    for k in range(n_pts - 2, -1, -1):
+        if seg_dir[k] == 1:
+            if n_down < 3:
+                down[n_down] = k
+            n_down += 1
+            if n_down == 4:
                 break
-        if not found:
-            break  # 找不到相反方向的转折点，终止构建
-    
-    # 3. 筛选向下线段（方向为1：从高点到低点）
-    down_segments = []
-    for seg in segments:
-        start_idx, end_idx, direction = seg
-        if direction == 1:  # 高点到低点，属于向下线段
-            down_segments.append((start_idx, end_idx))
-    
-    # 按线段结束位置从近到远排序（最近的在前面）
-    down_segments.sort(key=lambda x: -x[1])  # 按end_idx降序排列
     
-    # 至少需要3个向下线段才可能形成信号
-    if len(down_segments) < 4:
+    # 至少需要4个向下线段才可能形成信号
+    if n_down < 4:
         return pf_out
     
-    # 取最近的3个向下线段
-    latest_seg = down_segments[0]    # 最近的向下线段
-    prev_seg = down_segments[1]      # 前一个向下线段
-    prev2_seg = down_segments[2]     # 前两个向下线段
+    # 4. 条件1：比较最近3个向下线段起点高点和终点低点
+    latest_low = low[seg_pts[down[0] + 1]]    # 最近线段终点（低点）的价格
+    prev_low = low[seg_pts[down[1] + 1]]      # 前一线段终点（低点）的价格
     
-    # 4. 条件1：低点依次降低（前2线段低点 > 前1线段低点 > 最近线段低点）
-    latest_low = low[latest_seg[1]]    # 最近线段终点（低点）的价格
-    prev_low = low[prev_seg[1]]        # 前一线段终点（低点）的价格
-    prev2_low = low[prev2_seg[1]]      # 前两线段终点（低点）的价格
-
-    latest_high = high[latest_seg[0]]    # 最近线段起点（高点）的价格
-    prev_high = high[prev_seg[0]]        # 前一线段起点（高点）的价格
-    prev2_high = high[prev2_seg[0]]      # 前两线段起点（高点）的价格
-
-    latest_seg = segments[0]    # 最近的向下线段
-    if latest_seg[2] != 1:
-        return pf_out  # 最近线段不是向下线段，不满足
+    latest_high = high[seg_pts[down[0]]]    # 最近线段起点（高点）的价格
+    prev_high = high[seg_pts[down[1]]]      # 前一线段起点（高点）的价格
+    prev2_high = high[seg_pts[down[2]]]     # 前两线段起点（高点）的价格
     
-
-    if  prev_high > prev2_high:
-        return pf_out  # 最近线段低点不低于前一线段，不满足
+    # 第一个线段（保持原逻辑，取的是构建顺序中的第一个）必须是向下线段
+    if seg_dir[0] != 1:
+        return pf_out
+    
+    if prev_high > prev2_high:
+        return pf_out  # 前一线段高点高于前两线段，不满足
     
     if latest_high <= prev_high or latest_high <= prev2_high:
         return pf_out  # 最近线段高点不高于前一线段，不满足
@@ -109,16 +83,43 @@ def three_buy_variant(frac, high, low):
     if latest_low <= prev_low:
         return pf_out  # 最近线段低点不低于前一线段，不满足
     
-    # 5. 条件2：最后一根K线价格突破最近两个向下线段的起点高点之一
-    last_k_idx = data_len - 1  # 最后一根K线的索引
-    
     # 所有条件满足，标记信号
-    pf_out[last_k_idx] = 1.0
+    pf_out[data_len - 1] = 1.0
     return pf_out
 
+def three_buy_variant(frac, high, low):
+    """
+    识别三买变体信号
+    
+    参数:
+        frac: 转折点标记列表（1.0为高点，-1.0为低点，0.0无转折）
+        high: 最高价序列
+        low: 最低价序列
+    
+    返回:
+        numpy数组: 信号数组，1.0表示存在三买变体信号，0.0表示无
+    """
+    data_len = len(high)
+    # 确保输入数组长度一致
+    if len(low) != data_len or len(frac) != data_len:
+        raise ValueError("frac、high、low必须具有相同的长度")
+    
+    return three_buy_variant_kernel(
+        np.asarray(frac, dtype=np.float64),
+        np.asarray(high, dtype=np.float64),
+        np.asarray(low, dtype=np.float64),
+    )
 
 
 class StockDataCollector:
+    # 信号股票写入的目标blk文件
+    BLK_OUT_PATHS = (
+        r"D:\zd_hbzq\T0002\blocknew\QBGRX.blk",
+        r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
+        r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
+        r"D:\new_tdx\T0002\blocknew\zxg.blk"
+    )
+
     def __init__(self, blk_file_path):
         """
         初始化股票数据收集器
@@ -130,6 +131,7 @@ class StockDataCollector:
             redis_db: Redis数据库编号
         """
         self.blk_file_path = blk_file_path
+        self.blk_mtime = self.get_blk_mtime()  # 记录加载时的修改时间，文件变化时才重新加载
         self.stock_list = self.load_stock_list()
         self.triggered_stocks = set()  # 新增：用于记录已触发的股票代码
         # 服务器列表
@@ -137,6 +139,19 @@ class StockDataCollector:
             ('152.136.167.10', 7709),
             ('36.153.42.16', 7709)
         ]
+        # 线程池：每只股票的K线获取相互独立，并发执行以重叠网络等待
+        self.max_workers = len(self.servers) * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # pytdx长连接池（按线程独占，空闲过久先发心跳），与其他脚本共用gupiaojichu中的实现
+        self.tdx_pool = gupiaojichu.TdxApiPool(self.servers)
+        # 启动时先调用一次numba内核完成编译（cache=True后续启动直接读缓存），避免第一轮轮询卡住
+        dummy = np.zeros(10, dtype=np.float64)
+        three_buy_variant(dummy, dummy, dummy)
+        # 后台蜂鸣提醒，与其他脚本共用gupiaojichu中的实现
+        self.beeper = gupiaojichu.Beeper()
+        # 各blk文件中已有的股票代码，已存在的不再重复追加；触发时先放入缓冲，每轮结束统一写入
+        self.blk_written = self.load_blk_written()
+        self.pending_writes = defaultdict(list)
         
         logging.info(f"初始化完成，共加载 {len(self.stock_list)} 只股票")
     
@@ -180,6 +195,21 @@ class StockDataCollector:
             
         return stock_list
     
+    def get_blk_mtime(self):
+        """获取blk文件修改时间，文件不可访问时返回None"""
+        try:
+            return os.path.getmtime(self.blk_file_path)
+        except OSError:
+            return None
+    
+    def refresh_stock_list(self):
+        """blk文件修改时间变化时重新加载股票列表，未变化时不读文件"""
+        mtime = self.get_blk_mtime()
+        if mtime != self.blk_mtime:
+            self.blk_mtime = mtime
+            self.stock_list = self.load_stock_list()
+            logging.info(f"blk文件已变化，重新加载 {len(self.stock_list)} 只股票")
+    
     def get_5min_data(self, market, stock_code, full_code):
         """
         获取单只股票的5分钟K线数据（200条）
@@ -190,74 +220,79 @@ class StockDataCollector:
             full_code: 完整股票代码 (如 sh600000)
             
         Returns:
-            list or None: 200条K线数据，每条包含open, close, high, low, datetime
+            tuple: (最高价列表, 最低价列表)，获取失败时为 (None, None)
         """
-        api = TdxHq_API()
+        # 从当前线程的连接池轮询取连接，失败时依次尝试其他服务器
+        local = self.tdx_pool.get()
         
-        # 尝试所有服务器直到成功
-        for server_ip, server_port in self.servers:
+        for i in self.tdx_pool.rotation(local):
+            server_ip, server_port = self.servers[i]
+            if not self.tdx_pool.ensure(local, i):
+                continue
+            
             try:
-                if api.connect(server_ip, server_port):
-                    logging.debug(f"成功连接到服务器 {server_ip}:{server_port}，获取 {full_code}")
-                    
-                    # 获取5分钟K线数据 (category=0)，获取200条
-                    data = api.get_security_bars(0, market, stock_code, 0, 200)
-                    api.disconnect()
-                    
-                    if data:
-                        # 处理所有200条数据
-                        result_list = []
-                        result_list_high = []
-                        result_list_low = []
-                        for bar in data:
-                            # 提取需要的字段
-                            result = {
-                                'open': float(bar['open']),
-                                'high': float(bar['high']),
-                                'low': float(bar['low']),
-                                'close': float(bar['close']),
-                                'datetime': bar['datetime']
-                            }
-                            result_list_high.append(float(bar['high']))
-                            result_list_low.append(float(bar['low']))
-                            result_list.append(result)
-                        
-                        # 按时间排序（从旧到新）
-                        # result_list.sort(key=lambda x: x['datetime'])
-                        
-                        logging.debug(f"成功获取 {full_code} 数据: {len(result_list)} 条")
-                        return result_list,result_list_high,result_list_low
-                    else:
-                        logging.warning(f"未获取到 {full_code} 的数据")
-                        return None,None,None
-                else:
-                    logging.debug(f"连接服务器 {server_ip}:{server_port} 失败")
-                    
+                # 获取5分钟K线数据 (category=0)，获取200条
+                data = local.api_pool[i].get_security_bars(0, market, stock_code, 0, 200)
             except Exception as e:
                 logging.debug(f"服务器 {server_ip}:{server_port} 获取 {full_code} 出错: {e}")
+                self.tdx_pool.mark_broken(local, i)
                 continue
+            self.tdx_pool.touch(local, i)
+            
+            if data:
+                # 下游只用到high和low，直接提取两列；pytdx解析出的价格已是float，无需再转换
+                result_list_high = [bar['high'] for bar in data]
+                result_list_low = [bar['low'] for bar in data]
+                
+                logging.debug(f"成功获取 {full_code} 数据: {len(result_list_high)} 条")
+                return result_list_high,result_list_low
+            else:
+                logging.warning(f"未获取到 {full_code} 的数据")
+                return None,None
                 
         logging.error(f"所有服务器都无法获取 {full_code} 的数据")
-        return None,None,None
+        return None,None
+    
+    def load_blk_written(self):
+        """
+        读取各输出blk文件中已有的股票代码
+        
+        Returns:
+            dict: {文件路径: 已写入的代码集合(市场1位+代码6位)}，文件不存在时为空集合
+        """
+        blk_written = {}
+        for file_path in self.BLK_OUT_PATHS:
+            codes = set()
+            if os.path.exists(file_path):
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        codes = {line.strip() for line in f if line.strip()}
+                except Exception as e:
+                    logging.error(f"读取文件 {file_path} 失败: {e}")
+            blk_written[file_path] = codes
+        return blk_written
     
     def write_to_blk_files(self, market, stock_code):
-        """将股票代码写入两个blk文件"""
+        """将股票代码加入blk文件写入缓冲（文件中已有的跳过），由flush_blk_files统一落盘"""
         # 组合格式：market(1位) + stock_code(6位)
         blk_code = f"{market}{stock_code}"
-        # 目标文件路径
-        file_paths = [
-            r"D:\zd_hbzq\T0002\blocknew\QBGRX.blk",
-            r"D:\new_tdx\T0002\blocknew\QBGRX.blk",
-            r"D:\zd_hbzq\T0002\blocknew\zxg.blk",
-            r"D:\new_tdx\T0002\blocknew\zxg.blk"
-        ]
+        for file_path in self.BLK_OUT_PATHS:
+            if blk_code in self.blk_written[file_path]:
+                continue
+            self.blk_written[file_path].add(blk_code)
+            self.pending_writes[file_path].append(blk_code)
+    
+    def flush_blk_files(self):
+        """把本轮缓冲的股票代码一次性追加写入各blk文件"""
+        pending = self.pending_writes
+        self.pending_writes = defaultdict(list)
         
-        for file_path in file_paths:
+        for file_path, blk_codes in pending.items():
             try:
                 # 以追加模式写入，确保文件存在（不存在则创建）
                 with open(file_path, 'a', encoding='utf-8') as f:
-                    f.write(f"{blk_code}\n")
-                logging.info(f"成功将 {blk_code} 写入 {file_path}")
+                    f.write('\n'.join(blk_codes) + '\n')
+                logging.info(f"成功将 {', '.join(blk_codes)} 写入 {file_path}")
             except Exception as e:
                 logging.error(f"写入文件 {file_path} 失败: {e}")
 
@@ -265,18 +300,25 @@ class StockDataCollector:
         """
         更新所有股票数据到Redis
         """
-        self.stock_list = self.load_stock_list()
+        self.refresh_stock_list()
         success_count = 0
         fail_count = 0
         
         logging.info("开始更新所有股票数据...")
         
-        for market, stock_code, full_code in self.stock_list:
+        # 获取K线在工作线程并发执行；计算信号、写blk文件和蜂鸣只在主线程进行，避免争用文件和音频设备
+        futures = {
+            self.executor.submit(self.get_5min_data, market, stock_code, full_code): (market, stock_code, full_code)
+            for market, stock_code, full_code in self.stock_list
+        }
+        
+        for future in as_completed(futures):
+            market, stock_code, full_code = futures[future]
             try:
                 # 获取股票数据（200条）
-                stock_data,stock_data_high,stock_data_low = self.get_5min_data(market, stock_code, full_code)
+                stock_data_high,stock_data_low = future.result()
                 
-                if stock_data:
+                if stock_data_high:
                     data_len = len(stock_data_high)
                     stock_data_frac =gupiaojichu.identify_turns(data_len,stock_data_high,stock_data_low)
                     ok = three_buy_variant(stock_data_frac,stock_data_high,stock_data_low)
@@ -284,7 +326,7 @@ class StockDataCollector:
                     if  ok[-1] ==1.0 and full_code not in self.triggered_stocks:
                         self.write_to_blk_files(market, stock_code)
                         logging.warning(f"强势背驰股票： {stock_code}")
-                        winsound.Beep(1000, 500)  # 1000Hz频率，持续500毫秒
+                        self.beeper.beep()
                         self.triggered_stocks.add(full_code)  # 记录已触发的股票
                  
                     success_count += 1
@@ -296,7 +338,7 @@ class StockDataCollector:
                 fail_count += 1
                 logging.error(f"处理 {full_code} 时发生错误: {e}")
                 
-        
+        self.flush_blk_files()
         logging.info(f"数据更新完成: 成功 {success_count}, 失败 {fail_count}")
         return success_count, fail_count
 
@@ -70,14 +70,13 @@ def three_buy_variant(frac, high, low):
             break  # 找不到相反方向的转折点，终止构建
     
     # 3. 筛选向下线段（方向为1：从高点到低点）
+    # 线段终点随构建顺序递增，倒序扫描即按结束位置从近到远，取到3个即停，不需要排序
     down_segments = []
-    for seg in segments:
-        start_idx, end_idx, direction = seg
+    for start_idx, end_idx, direction in reversed(segments):
         if direction == 1:  # 高点到低点，属于向下线段
             down_segments.append((start_idx, end_idx))
-    
-    # 按线段结束位置从近到远排序（最近的在前面）
-    down_segments.sort(key=lambda x: -x[1])  # 按end_idx降序排列
+            if len(down_segments) == 3:
+                break
     
     # 至少需要3个向下线段才可能形成信号
     if len(down_segments) < 3:
@@ -214,10 +213,9 @@ def identify_three_buy_variant(high, low):
     
     # 验证转折点交替性，生成最终转折点列表（frac）
     frac = [0.0] * data_len
-    for i in range(len(new_turns) - 1):
-        idx1, t1 = new_turns[i]
-        idx2, t2 = new_turns[i + 1]
-        if (t1 == 1 and t2 == -1) or (t1 == -1 and t2 == 1):
+    # 相邻转折点成对遍历，类型只有1和-1，不同即为交替
+    for (idx1, t1), (idx2, t2) in zip(new_turns, new_turns[1:]):
+        if t1 != t2:
             if idx1 < data_len:
                 frac[idx1] = float(t1)
     
@@ -247,14 +245,13 @@ def identify_three_buy_variant(high, low):
         if not found:
             break
     
-    # 筛选向下线段（方向为1：高点到低点）
-    down_segments = [
-        (start, end) for start, end, dir in segments
-        if dir == 1
-    ]
-    
-    # 按结束位置从近到远排序
-    down_segments.sort(key=lambda x: -x[1])
+    # 筛选向下线段（方向为1：高点到低点），倒序扫描即按结束位置从近到远，取到3个即停
+    down_segments = []
+    for start, end, dir in reversed(segments):
+        if dir == 1:
+            down_segments.append((start, end))
+            if len(down_segments) == 3:
+                break
     
     # 至少需要3个向下线段
     if len(down_segments) < 3:
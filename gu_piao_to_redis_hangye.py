@@ -1,8 +1,11 @@
 import os
 import struct
+import hashlib
 import redis
 import re
 from collections import defaultdict
+import numpy as np
+from gupiaojichu import parse_val_array, mget_in_batches
 
 # 配置参数
 TDX_PATH = r"D:\zd_hbzq"  # 通达信安装路径
@@ -12,6 +15,12 @@ REDIS_DB = 4
 RUST_STOCK_GROUP_PREFIX = "rust_stock_group:"
 STOCK_GROUP_PREFIX = "stock_group:"
 HANGYE_PREFIX = "hangye:val"
+# 股票→行业映射缓存（Hash）及其对应的板块文件签名
+INDUSTRY_MAP_KEY = "hangye:stock2industry"
+INDUSTRY_SIG_KEY = "hangye:map_sig"
+
+# 预编译的正则，避免每个键提取股票代码时重复查正则缓存
+_NON_DIGIT = re.compile(r'\D')
 
 def connect_redis():
     """连接到Redis数据库"""
@@ -83,10 +92,65 @@ def get_industry_stocks(tdx_path):
     print(f"共加载 {len(industry_stocks)} 个行业板块")
     return industry_stocks
 
+def get_blk_signature(tdx_path):
+    """
+    计算行业板块文件的签名（文件名+修改时间），任一文件增删或修改后签名随之变化
+    用sha256而不是内置hash()：字符串的hash()每次启动随机加盐，跨进程无法比较
+    """
+    block_dir = os.path.join(tdx_path, "T0002", "blocknew")
+    try:
+        blk_files = sorted(f for f in os.listdir(block_dir) if f.endswith(".blk") and "880" in f)
+        sig_items = [(f, os.path.getmtime(os.path.join(block_dir, f))) for f in blk_files]
+    except OSError as e:
+        print(f"读取板块文件修改时间失败: {e}")
+        return None
+    return hashlib.sha256(repr(sig_items).encode('utf-8')).hexdigest()
+
+def build_stock_to_industry(industry_stocks):
+    """构建股票到行业的映射"""
+    stock_to_industry = {}
+    for industry, stocks in industry_stocks.items():
+        for stock in stocks:
+            stock_to_industry[stock] = industry
+    return stock_to_industry
+
+def load_stock_to_industry(r, tdx_path):
+    """
+    获取股票到行业的映射：板块文件签名与Redis中缓存的一致时直接读取缓存，
+    否则重新解析板块文件，并把映射和签名写回Redis
+    """
+    sig = get_blk_signature(tdx_path)
+    if sig is not None:
+        try:
+            if r.get(INDUSTRY_SIG_KEY) == sig:
+                stock_to_industry = r.hgetall(INDUSTRY_MAP_KEY)
+                if stock_to_industry:
+                    print(f"板块文件未变化，从缓存加载 {len(stock_to_industry)} 只股票的行业映射")
+                    return stock_to_industry
+        except Exception as e:
+            print(f"读取行业映射缓存失败: {e}")
+    
+    industry_stocks = get_industry_stocks(tdx_path)
+    if not industry_stocks:
+        return {}
+    stock_to_industry = build_stock_to_industry(industry_stocks)
+    
+    if sig is not None and stock_to_industry:
+        try:
+            pipe = r.pipeline(transaction=True)
+            pipe.delete(INDUSTRY_MAP_KEY)
+            pipe.hset(INDUSTRY_MAP_KEY, mapping=stock_to_industry)
+            pipe.set(INDUSTRY_SIG_KEY, sig)
+            pipe.execute()
+        except Exception as e:
+            print(f"保存行业映射缓存失败: {e}")
+    return stock_to_industry
+
 def get_stock_data(r):
     """从Redis获取股票数据"""
     # 获取所有rust_stock_group:前缀的键
-    rust_keys = r.keys(f"{RUST_STOCK_GROUP_PREFIX}*")
+    # 用SCAN分批遍历，避免KEYS在键很多时长时间阻塞Redis；SCAN可能重复返回同一个键，按首次出现顺序去重
+    rust_keys = list(dict.fromkeys(r.scan_iter(match=f"{RUST_STOCK_GROUP_PREFIX}*", count=1000)))
     if not rust_keys:
         print(f"未找到{RUST_STOCK_GROUP_PREFIX}相关的键")
         return {}
@@ -94,30 +158,31 @@ def get_stock_data(r):
     stock_data = {}
     print(f"开始读取 {len(rust_keys)} 个股票数据...")
     
-    for rust_key in rust_keys:
+    # 批量读取：val数组和对应的股票代码按gupiaojichu.MGET_BATCH_SIZE分批MGET取回，不再每个键两次往返
+    # 从rust_stock_group:xxx提取唯一ID部分，拼出stock_group:xxx
+    stock_code_keys = [f"{STOCK_GROUP_PREFIX}{rust_key[len(RUST_STOCK_GROUP_PREFIX):]}" for rust_key in rust_keys]
+    try:
+        val_strs = mget_in_batches(r, rust_keys)
+        stock_codes = mget_in_batches(r, stock_code_keys)
+    except Exception as e:
+        print(f"批量读取股票数据失败: {e}")
+        return {}
+    
+    for rust_key, val_str, stock_code in zip(rust_keys, val_strs, stock_codes):
         try:
-            # 获取股票的val数组
-            val_str = r.get(rust_key)
+            # 股票的val数组
             if not val_str:
                 continue
             
             # 解析val数组(处理带方括号的情况)
-            cleaned_str = val_str.strip('[]')
-            cleaned_str = re.sub(r'\s+', '', cleaned_str)
-            if not cleaned_str:
+            val_array = parse_val_array(val_str)
+            if not val_array:
                 continue
-                
-            val_array = list(map(int, cleaned_str.split(',')))
-            
-            # 获取对应的股票代码
-            # 从rust_stock_group:xxx提取唯一ID部分
-            unique_id = rust_key[len(RUST_STOCK_GROUP_PREFIX):]
-            stock_code_key = f"{STOCK_GROUP_PREFIX}{unique_id}"
-            stock_code = r.get(stock_code_key)
             
+            # 对应的股票代码
             if stock_code:
                 # 提取6位核心代码
-                core_code = re.sub(r'\D', '', stock_code)[:6]
+                core_code = _NON_DIGIT.sub('', stock_code)[:6]
                 stock_data[core_code] = val_array
         except Exception as e:
             print(f"处理键 {rust_key} 失败: {e}")
@@ -126,16 +191,10 @@ def get_stock_data(r):
     print(f"成功加载 {len(stock_data)} 个股票的val数据")
     return stock_data
 
-def classify_by_industry(industry_stocks, stock_data):
+def classify_by_industry(stock_to_industry, stock_data):
     """按行业分类股票数据"""
     industry_data = defaultdict(list)
     
-    # 构建股票到行业的映射
-    stock_to_industry = {}
-    for industry, stocks in industry_stocks.items():
-        for stock in stocks:
-            stock_to_industry[stock] = industry
-    
     # 按行业分组
     for stock_code, val_array in stock_data.items():
         if stock_code in stock_to_industry:
@@ -156,26 +215,15 @@ def calculate_industry_average(industry_data):
             if max_length == 0:
                 continue
             
-            # 从后往前计算每个位置的平均值
-            average_array = []
-            for pos in range(max_length):  # pos=0对应最后一个元素
-                total = 0
-                count = 0
-                
-                for arr in arrays:
-                    # 从后往前取元素，不足的补0
-                    if len(arr) > pos:
-                        # 倒数第pos+1个元素
-                        val = arr[len(arr) - 1 - pos]
-                        total += val
-                    count += 1  # 即使数组较短也要计入数量
-                
-                # 计算平均值并保留1位小数
-                avg = round(total / count, 1)
-                average_array.append(avg)
+            # 所有数组按末尾对齐放进矩阵，前面不足的补0，按列求和即得每个位置的总和
+            mat = np.zeros((len(arrays), max_length), dtype=np.int64)
+            for i, arr in enumerate(arrays):
+                mat[i, max_length - len(arr):] = arr
+            totals = mat.sum(axis=0).tolist()
+            count = len(arrays)  # 即使数组较短也要计入数量
             
-            # 结果数组需要反转回来，因为我们是从后往前计算的
-            average_array.reverse()
+            # 计算平均值并保留1位小数（逐个用round，与np.round在.x5附近的舍入结果不同）
+            average_array = [round(total / count, 1) for total in totals]
             industry_averages[industry] = average_array
             print(f"计算完成: {industry}, 平均数组长度: {len(average_array)}")
         except Exception as e:
@@ -207,9 +255,9 @@ def main():
     if not r:
         return
     
-    # 1. 获取行业板块及其成分股
-    industry_stocks = get_industry_stocks(TDX_PATH)
-    if not industry_stocks:
+    # 1. 获取股票到行业的映射（板块文件未变化时直接用Redis中的缓存）
+    stock_to_industry = load_stock_to_industry(r, TDX_PATH)
+    if not stock_to_industry:
         print("未能获取行业板块数据，程序退出")
         return
     
@@ -220,7 +268,7 @@ def main():
         return
     
     # 3. 按行业分类股票数据
-    industry_data = classify_by_industry(industry_stocks, stock_data)
+    industry_data = classify_by_industry(stock_to_industry, stock_data)
     if not industry_data:
         print("未能按行业分类数据，程序退出")
         return
@@ -1,7 +1,10 @@
 import os
 import struct
-import pandas as pd
+import numpy as np
 import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from mootdx.reader import Reader
 from tqdm import tqdm
 import redis
@@ -10,44 +13,46 @@ from redis.exceptions import ConnectionError
 
 # 组前缀（与Rust端保持一致：rust_stock_group:）
 GROUP_PREFIX = "stock_group:"  # 统一组前缀，确保和Rust端同组
+# 写入Redis时每个pipeline批量提交的命令数
+REDIS_BATCH_SIZE = 1000
+
+
+# 日线文件每条记录32字节：日期、开高低收(价格*100)、成交额(float)、成交量、保留字段，对应struct格式'IIIIIfII'
+TDX_DAY_DTYPE = np.dtype([
+    ('date', '<u4'),
+    ('open', '<u4'),
+    ('high', '<u4'),
+    ('low', '<u4'),
+    ('close', '<u4'),
+    ('amount', '<f4'),
+    ('volume', '<u4'),
+    ('reserved', '<u4'),
+])
 
 
 def read_tdx_day_file_direct(file_path, max_records=20):
-    """读取日线文件，取最近20条记录，并对high/low保留两位小数"""
-    data_list = []
+    """
+    读取日线文件最近max_records条记录的high/low，并保留两位小数（计算唯一ID只需要这两列）
+    
+    Returns:
+        tuple: (high列表, low列表)，读取失败时为None
+    """
     try:
+        record_size = TDX_DAY_DTYPE.itemsize
         with open(file_path, 'rb') as f:
-            data_buffer = f.read()
+            # 只定位到最近max_records条记录处读取文件尾部，不再整个文件读入内存
+            num_records = os.fstat(f.fileno()).st_size // record_size
+            start_idx = max(0, num_records - max_records)
+            f.seek(start_idx * record_size)
+            data_buffer = f.read((num_records - start_idx) * record_size)
         
-        record_size = 32
-        num_records = len(data_buffer) // record_size
-        start_idx = max(0, num_records - max_records)
+        # 直接把最近的记录映射成结构化数组，按列整体换算，不再逐条unpack和构造dict
+        recs = np.frombuffer(data_buffer, dtype=TDX_DAY_DTYPE, count=len(data_buffer) // record_size)
         
-        for i in range(start_idx, num_records):
-            record = data_buffer[i*record_size:(i+1)*record_size]
-            fields = struct.unpack('IIIIIfII', record) 
-            
-            date_str = str(fields[0])
-            open_price = fields[1] / 100.0
-            # 对high和low四舍五入保留两位小数（核心修改）
-            high_price = round(fields[2] / 100.0, 2)  # 保留两位小数
-            low_price = round(fields[3] / 100.0, 2)   # 保留两位小数
-            close_price = fields[4] / 100.0
-            amount = fields[5]
-            volume = fields[6]
-            
-            data_list.append({
-                'date': pd.to_datetime(date_str, format='%Y%m%d'),
-                'open': open_price,
-                'high': high_price,  # 处理后的值
-                'low': low_price,    # 处理后的值
-                'close': close_price,
-                'amount': amount,
-                'volume': volume
-            })
-        
-        df = pd.DataFrame(data_list)
-        return df.tail(max_records) if not df.empty else df
+        # 对high和low四舍五入保留两位小数（核心修改），整列一次np.round，与逐个round结果相同
+        high = np.round(recs['high'] / 100.0, 2)  # 保留两位小数
+        low = np.round(recs['low'] / 100.0, 2)    # 保留两位小数
+        return high.tolist(), low.tolist()
     except Exception as e:
         print(f"读取文件 {file_path} 失败: {e}")
         return None
@@ -64,9 +69,61 @@ def is_stock_symbol(symbol, market):
     return False
 
 
+# 每个进程各自缓存的mootdx Reader，{tdx_path: Reader}
+_READERS = {}
+
+
+def get_reader(tdx_path):
+    """获取当前进程的mootdx Reader，每个进程只创建一次"""
+    reader = _READERS.get(tdx_path)
+    if reader is None:
+        reader = _READERS[tdx_path] = Reader.factory(market='std', tdxdir=tdx_path)
+    return reader
+
+
+def load_stock_file(tdx_path, market, market_dir, file_name, min_records):
+    """
+    读取单个日线文件最近min_records条的high/low并保留两位小数（在子进程中执行）
+    
+    Returns:
+        tuple: (股票键如sh600000, 符合条件时为(high列表, low列表)否则None, 需要打印的提示或None)
+    """
+    symbolok = file_name.replace('.day', '')[2:5]
+    symbol = file_name.replace('.day', '')[2:]
+    stock_key = f"{market}{symbol}"
+    try:
+        if not is_stock_symbol(symbolok, market):
+            return stock_key, None, None
+        
+        # 后续只用high/low计算唯一ID，只取这两列，不再把整个DataFrame传回主进程
+        high_low = None
+        if market == 'bj':
+            file_path = os.path.join(market_dir, file_name)
+            high_low = read_tdx_day_file_direct(file_path, max_records=min_records)
+        else:
+            df = get_reader(tdx_path).daily(symbol=symbol)
+            if df is not None:
+                df = df.tail(min_records)
+                # 对reader获取的high和low四舍五入保留两位小数（核心修改）
+                high_low = (df['high'].round(2).tolist(), df['low'].round(2).tolist())  # 保留两位小数
+        
+        if high_low is None:
+            return stock_key, None, None
+        if len(high_low[0]) < min_records:
+            return stock_key, None, f"{stock_key} 记录不足{min_records}条，跳过"
+        return stock_key, high_low, None
+        
+    except Exception as e:
+        return stock_key, None, f"读取{file_name}出错: {e}"
+
+
 def get_all_stock_data(tdx_path, min_records=20):
-    """读取股票数据，确保至少20条记录，并对high/low保留两位小数"""
-    reader = Reader.factory(market='std', tdxdir=tdx_path)
+    """
+    读取股票数据，确保至少20条记录，并对high/low保留两位小数
+    
+    Returns:
+        dict: {股票键: (high列表, low列表)}
+    """
     market_dirs = {
         'sh': os.path.join(tdx_path, 'vipdoc', 'sh', 'lday'),
         'sz': os.path.join(tdx_path, 'vipdoc', 'sz', 'lday'),
@@ -74,63 +131,46 @@ def get_all_stock_data(tdx_path, min_records=20):
     }
     
     all_stock_data = {}
-    for market, market_dir in market_dirs.items():
-        if not os.path.exists(market_dir):
-            print(f"目录不存在: {market_dir}")
-            continue
-            
-        day_files = [f for f in os.listdir(market_dir) if f.endswith('.day')]
-        print(f"读取{market}市场，共{len(day_files)}个文件...")
-        
-        for file_name in tqdm(day_files):
-            try:
-                symbolok = file_name.replace('.day', '')[2:5]
-                symbol = file_name.replace('.day', '')[2:]
-                
-                if not is_stock_symbol(symbolok, market):
-                    continue
-                
-                if market == 'bj':
-                    file_path = os.path.join(market_dir, file_name)
-                    df = read_tdx_day_file_direct(file_path, max_records=min_records)
-                else:
-                    df = reader.daily(symbol=symbol)
-                    if df is not None and not df.empty:
-                        df = df.tail(min_records).reset_index(drop=True)
-                        # 对reader获取的high和low四舍五入保留两位小数（核心修改）
-                        df['high'] = df['high'].round(2)  # 保留两位小数
-                        df['low'] = df['low'].round(2)     # 保留两位小数
-                
-                if df is not None and not df.empty and len(df) >= min_records:
-                    all_stock_data[f"{market}{symbol}"] = df
-                elif df is not None and len(df) < min_records:
-                    print(f"{market}{symbol} 记录不足{min_records}条，跳过")
-                
-            except Exception as e:
-                print(f"读取{file_name}出错: {e}")
+    # 各文件的读取相互独立，分给多个进程并行；map按提交顺序返回，结果顺序与逐个读取一致
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for market, market_dir in market_dirs.items():
+            if not os.path.exists(market_dir):
+                print(f"目录不存在: {market_dir}")
                 continue
-        
-        market_count = len([k for k in all_stock_data if k.startswith(market)])
-        print(f"{market}市场: 符合条件的股票共{market_count}只")
+                
+            day_files = [f for f in os.listdir(market_dir) if f.endswith('.day')]
+            print(f"读取{market}市场，共{len(day_files)}个文件...")
+            
+            results = executor.map(
+                load_stock_file,
+                repeat(tdx_path), repeat(market), repeat(market_dir), day_files, repeat(min_records),
+                chunksize=64,
+            )
+            for stock_key, high_low, message in tqdm(results, total=len(day_files)):
+                if message:
+                    print(message)
+                if high_low is not None:
+                    all_stock_data[stock_key] = high_low
+            
+            market_count = len([k for k in all_stock_data if k.startswith(market)])
+            print(f"{market}市场: 符合条件的股票共{market_count}只")
     
     return all_stock_data
 
 
 def generate_unique_id(high_last20, low_last20):
     """生成与Rust端一致的唯一ID（基于保留两位小数后的high和low）"""
-    hasher = hashlib.sha256()
-    # 大端字节序，与Rust的to_be_bytes保持一致
-    for val in high_last20:
-        hasher.update(struct.pack('>d', val))  # 基于两位小数的val计算哈希
-    for val in low_last20:
-        hasher.update(struct.pack('>d', val))  # 基于两位小数的val计算哈希
-    return hasher.hexdigest()
+    # 大端字节序，与Rust的to_be_bytes保持一致；先high后low依次拼成一块缓冲区，一次性计算哈希
+    # 与逐个update每个8字节的结果相同
+    buf = struct.pack(f'>{len(high_last20) + len(low_last20)}d', *high_last20, *low_last20)
+    return hashlib.sha256(buf).hexdigest()
 
 
 def save_to_redis(all_stock_data, redis_host="localhost", redis_port=6379, 
                  redis_password=None, db=4, group_prefix=GROUP_PREFIX):
     """
     按key前缀分组（与Rust端同组）：key=rust_stock_group:唯一ID，value=股票代码
+    all_stock_data为get_all_stock_data的结果：{股票键: (high列表, low列表)}
     """
     # 连接Redis
     try:
@@ -154,12 +194,14 @@ def save_to_redis(all_stock_data, redis_host="localhost", redis_port=6379,
     fail = 0
     
     print(f"\n开始存储{total}只股票数据...")
-    for stock_code, df in tqdm(all_stock_data.items()):
+    # 先算出所有 (key, 股票代码)，再用pipeline批量写入，不再每只股票一次往返
+    items = []
+    for stock_code, high_low in tqdm(all_stock_data.items()):
         try:
             # 提取最近20个high和low（已确保是两位小数）
-            recent_20 = df.tail(20)
-            high_list = recent_20['high'].tolist()
-            low_list = recent_20['low'].tolist()
+            high, low = high_low
+            high_list = high[-20:]
+            low_list = low[-20:]
             
             # 打印调试：输出处理后的high和low（可选，用于验证）
             # print(f"股票{stock_code}的high_list: {high_list}")
@@ -172,14 +214,25 @@ def save_to_redis(all_stock_data, redis_host="localhost", redis_port=6379,
             key = f"{group_prefix}{unique_id}"
             
             # 存储：key=组前缀+唯一ID，value=股票代码
-            r.set(key, stock_code.encode('utf-8'))
-            
-            success += 1
+            items.append((key, stock_code.encode('utf-8')))
             
         except Exception as e:
             print(f"{stock_code} 处理失败: {str(e)[:100]}")
             fail += 1
 
+    # 按顺序分批提交，同一key重复时与逐条set一样以后写入的为准
+    for start in range(0, len(items), REDIS_BATCH_SIZE):
+        batch = items[start:start + REDIS_BATCH_SIZE]
+        try:
+            pipe = r.pipeline(transaction=False)
+            for key, value in batch:
+                pipe.set(key, value)
+            pipe.execute()
+            success += len(batch)
+        except Exception as e:
+            print(f"批量写入第{start + 1}-{start + len(batch)}只股票失败: {str(e)[:100]}")
+            fail += len(batch)
+
     # 结果统计
     r.close()
     print(f"\n存储完成：成功{success}只，失败{fail}只")
@@ -187,6 +240,8 @@ def save_to_redis(all_stock_data, redis_host="localhost", redis_port=6379,
 
 
 if __name__ == "__main__":
+    # pyinstaller打包成exe后，子进程需要这一步才能正常启动
+    multiprocessing.freeze_support()
     tdx_path = r"D:\zd_hbzq"  # 你的通达信路径
     redis_host = "localhost"
     redis_port = 6379
@@ -1,5 +1,6 @@
 import redis
-import re  # 用于正则处理数组格式
+import numpy as np
+from gupiaojichu import parse_val_array, mget_in_batches
 
 def connect_redis():
     """连接到Redis的db4数据库"""
@@ -21,32 +22,28 @@ def process_stock_group(r):
     """处理rust_stock_group数据并计算统计结果（修复数组解析问题）"""
     # 1. 获取所有rust_stock_group:前缀的键
     print("正在读取rust_stock_group:相关数据...")
-    keys = r.keys('rust_stock_group:*')
+    # 用SCAN分批遍历，避免KEYS在键很多时长时间阻塞Redis；SCAN可能重复返回同一个键，按首次出现顺序去重，避免重复计数
+    keys = list(dict.fromkeys(r.scan_iter(match='rust_stock_group:*', count=1000)))
     if not keys:
         print("未找到rust_stock_group:相关的键")
         return
 
     # 2. 解析所有值为整数数组（处理JSON格式数组，过滤无效数据）
     valid_arrays = []
-    for key in keys:
-        val_str = r.get(key)
+    # 所有值按gupiaojichu.MGET_BATCH_SIZE分批MGET取回，不再每个键一次往返
+    val_strs = mget_in_batches(r, keys)
+    for key, val_str in zip(keys, val_strs):
         if not val_str:
             print(f"键 {key} 的值为空，已跳过")
             continue
         
         try:
-            # 核心修复：处理带方括号的JSON格式数组（如"[1, 2, 3]"）
-            # 步骤1：去除首尾的方括号
-            cleaned_str = val_str.strip('[]')
-            # 步骤2：去除所有空格（处理"1, 2, 3"这类带空格的情况）
-            cleaned_str = re.sub(r'\s+', '', cleaned_str)
-            # 步骤3：按逗号分割为元素（空数组处理：避免split后出现空字符串）
-            if not cleaned_str:
+            # 处理带方括号的JSON格式数组（如"[1, 2, 3]"）
+            arr = parse_val_array(val_str)
+            if not arr:
                 print(f"键 {key} 的值为空数组，已跳过")
                 continue
-            elements = cleaned_str.split(',')
-            # 步骤4：转换为整数数组并验证范围（1-9）
-            arr = list(map(int, elements))
+            # 验证范围（1-9）
             if all(1 <= x <= 9 for x in arr):
                 valid_arrays.append(arr)
             else:
@@ -64,23 +61,13 @@ def process_stock_group(r):
     max_len = max(len(arr) for arr in valid_arrays)
     print(f"最大数组长度: {max_len}，将从后往前统计{max_len}个位置")
 
-    # 4. 初始化统计结果（1-9每个值对应一个统计数组）
-    result = {x: [0] * max_len for x in range(1, 10)}
+    # 4. 所有数组倒序后左对齐放进矩阵：第pos列对应倒数第pos+1位，长度不足的位置填0（不属于1-9，不计数）
+    mat = np.zeros((len(valid_arrays), max_len), dtype=np.int8)
+    for i, arr in enumerate(valid_arrays):
+        mat[i, :len(arr)] = arr[::-1]
 
-    # 5. 从后往前统计每个位置的数值出现次数
-    for pos in range(max_len):  # pos=0对应倒数第1位，pos=1对应倒数第2位...
-        count = {x: 0 for x in range(1, 10)}
-        
-        for arr in valid_arrays:
-            # 检查数组是否足够长（当前位置是否有值）
-            if len(arr) > pos:
-                # 获取当前位置的数值（从后往前数第pos+1个）
-                val = arr[len(arr) - 1 - pos]
-                count[val] += 1
-        
-        # 更新结果数组
-        for x in range(1, 10):
-            result[x][pos] = count[x]
+    # 5. 从后往前统计每个位置的数值出现次数：每个值做一次整列比较求和（1-9每个值对应一个统计数组）
+    result = {x: (mat == x).sum(axis=0).tolist() for x in range(1, 10)}
 
     # 6. 将结果存入Redis（格式：逗号分隔字符串，便于后续解析）
     print("正在保存统计结果到Redis...")
@@ -1,172 +1,181 @@
-from collections import deque
 import math
+import os
+import re
+import time
+import pickle
+import hashlib
+import logging
+import threading
+import queue
+import numpy as np
+try:
+    # 只有TdxApiPool用到pytdx，纯计算的函数不依赖它
+    from pytdx.hq import TdxHq_API
+except ImportError:
+    TdxHq_API = None
+try:
+    # winsound只在Windows上有，Beeper在其他环境下不响
+    import winsound
+except ImportError:
+    winsound = None
+try:
+    # orjson解析短数组比标准库json快数倍，未安装时退回json
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+try:
+    # bottleneck的move_max/move_min是C实现的单调队列，未安装时退回下面的编译内核
+    import bottleneck as bn
+except ImportError:
+    bn = None
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    # 未安装numba时（如打包环境不带numba），内核按普通Python函数执行，结果相同，只是慢一些
+    # 各脚本都从这里导入njit和HAS_NUMBA，不再各自判断
+    HAS_NUMBA = False
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
 
-class MergedBar:
-    def __init__(self, high, low, orig_idx, is_same_value):
-        self.high = high
-        self.low = low
-        self.orig_idx = orig_idx
-        self.is_same_value = is_same_value
+# 浮点数精度阈值（对齐Rust注释的"极小值判断"），所有价格比较共用
+EPS = 1e-6
+# 通达信.cfg映射文件的解析缓存目录（放在本仓库目录下，不写入通达信安装目录）
+MAP_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mapcache')
+# 从Redis批量读取时每条MGET包含的键数
+MGET_BATCH_SIZE = 1000
+# 预编译的正则，避免每个键解析时重复查正则缓存
+_WS = re.compile(r'\s+')
 
-def sliding_max(arr, window_size):
-    """计算滑动窗口最大值（单调队列实现）"""
-    n = len(arr)
-    result = [ -math.inf for _ in range(n) ]
-    dq = deque()  # 存储索引，队首为当前窗口最大值索引
+@njit(cache=True)
+def sliding_max_kernel(arr, window_size):
+    """
+    滑动窗口最大值的编译内核（单调队列），arr为float64数组，窗口未形成的位置为-inf
+    队列用定长环形缓冲区存索引：队列中最多window_size个索引，容量取不小于它的2的幂，下标用&取模
+    """
+    n = arr.shape[0]
+    result = np.full(n, -np.inf)
+    size = 1
+    while size < window_size:
+        size <<= 1
+    mask = size - 1
+    buf = np.empty(size, dtype=np.int64)
+    head = 0  # 队首位置，队首为当前窗口最大值索引
+    tail = 0  # 队尾的下一个位置，head == tail 表示队列为空
     
     for i in range(n):
         # 移除窗口外的元素（索引 <= i - window_size）
-        while dq and dq[0] <= i - window_size:
-            dq.popleft()
+        while head < tail and buf[head & mask] <= i - window_size:
+            head += 1
         
         # 移除队列中小于当前元素的索引（它们不可能是最大值）
-        while dq and arr[dq[-1]] <= arr[i]:
-            dq.pop()
+        while head < tail and arr[buf[(tail - 1) & mask]] <= arr[i]:
+            tail -= 1
         
-        dq.append(i)
+        buf[tail & mask] = i
+        tail += 1
         
         # 窗口完全形成后开始记录结果
         if i >= window_size - 1:
-            result[i] = arr[dq[0]]
+            result[i] = arr[buf[head & mask]]
     
     return result
 
-def sliding_min(arr, window_size):
-    """计算滑动窗口最小值（单调队列实现）"""
-    n = len(arr)
-    result = [ math.inf for _ in range(n) ]
-    dq = deque()  # 存储索引，队首为当前窗口最小值索引
+@njit(cache=True)
+def sliding_min_kernel(arr, window_size):
+    """滑动窗口最小值的编译内核，结构同sliding_max_kernel，窗口未形成的位置为inf"""
+    n = arr.shape[0]
+    result = np.full(n, np.inf)
+    size = 1
+    while size < window_size:
+        size <<= 1
+    mask = size - 1
+    buf = np.empty(size, dtype=np.int64)
+    head = 0
+    tail = 0
     
     for i in range(n):
         # 移除窗口外的元素
-        while dq and dq[0] <= i - window_size:
-            dq.popleft()
+        while head < tail and buf[head & mask] <= i - window_size:
+            head += 1
         
         # 移除队列中大于当前元素的索引
-        while dq and arr[dq[-1]] >= arr[i]:
-            dq.pop()
+        while head < tail and arr[buf[(tail - 1) & mask]] >= arr[i]:
+            tail -= 1
         
-        dq.append(i)
+        buf[tail & mask] = i
+        tail += 1
         
         # 窗口完全形成后开始记录结果
         if i >= window_size - 1:
-            result[i] = arr[dq[0]]
+            result[i] = arr[buf[head & mask]]
     
     return result
 
-# def merge_contained_bars(high, low, data_len):
-#     """处理K线包含关系及连续同值K线合并"""
-#     if data_len == 0:
-#         return []
-    
-#     merged = []
-#     eps = 1e-6  # 浮点数精度阈值
-    
-#     for i in range(data_len):
-#         curr_high = high[i]
-#         curr_low = low[i]
-#         # 判断当前K线是否为"同值K线"（high≈low）
-#         is_current_same = abs(curr_high - curr_low) < eps
-        
-#         current_bar = MergedBar(
-#             high=curr_high,
-#             low=curr_low,
-#             orig_idx=i,
-#             is_same_value=is_current_same
-#         )
-        
-#         if not merged:
-#             merged.append(current_bar)
-#             continue
-        
-#         last_bar = merged[-1]
-        
-#         # 处理连续同值K线合并
-#         if is_current_same and last_bar.is_same_value:
-#             values_equal = abs(last_bar.high - curr_high) < eps
-#             if values_equal:
-#                 # 合并：保留最早的orig_idx
-#                 merged_same_bar = MergedBar(
-#                     high=last_bar.high,
-#                     low=last_bar.low,
-#                     orig_idx=last_bar.orig_idx,
-#                     is_same_value=True
-#                 )
-#                 merged.pop()
-#                 merged.append(merged_same_bar)
-#                 continue
-        
-#         # 同值K线与非同值K线不参与包含合并
-#         if last_bar.is_same_value or is_current_same:
-#             merged.append(current_bar)
-#             continue
-        
-#         # 检查包含关系
-#         is_contained = (curr_high <= last_bar.high + eps and curr_low >= last_bar.low - eps) or \
-#                        (last_bar.high <= curr_high + eps and last_bar.low >= curr_low - eps)
-        
-#         if not is_contained:
-#             merged.append(current_bar)
-#         else:
-#             # 存在包含关系，按趋势合并
-#             if len(merged) >= 2:
-#                 prev_last = merged[-2]
-#                 # 判断前序趋势
-#                 is_up = (last_bar.high > prev_last.high + eps) and (last_bar.low > prev_last.low + eps)
-#                 is_down = (last_bar.high < prev_last.high - eps) and (last_bar.low < prev_last.low - eps)
-                
-#                 if is_up:
-#                     max_high = max(last_bar.high, curr_high)
-#                     if abs(max_high - last_bar.high) < eps:
-#                         orig_idx = last_bar.orig_idx
-#                     else:
-#                         orig_idx = current_bar.orig_idx
-#                     new_bar = MergedBar(
-#                         high=max_high,
-#                         low=max(last_bar.low, curr_low),
-#                         orig_idx=orig_idx,
-#                         is_same_value=False
-#                     )
-#                 elif is_down:
-#                     min_low = min(last_bar.low, curr_low)
-#                     if abs(min_low - last_bar.low) < eps:
-#                         orig_idx = last_bar.orig_idx
-#                     else:
-#                         orig_idx = current_bar.orig_idx
-#                     new_bar = MergedBar(
-#                         high=min(last_bar.high, curr_high),
-#                         low=min_low,
-#                         orig_idx=orig_idx,
-#                         is_same_value=False
-#                     )
-#                 else:
-#                     # 非明确趋势：取范围
-#                     new_bar = MergedBar(
-#                         high=max(last_bar.high, curr_high),
-#                         low=min(last_bar.low, curr_low),
-#                         orig_idx=last_bar.orig_idx,
-#                         is_same_value=False
-#                     )
-#             else:
-#                 # 仅1根非同值K线，合并取范围
-#                 max_high = max(last_bar.high, curr_high)
-#                 if abs(max_high - last_bar.high) < eps:
-#                     orig_idx = last_bar.orig_idx
-#                 else:
-#                     orig_idx = current_bar.orig_idx
-#                 new_bar = MergedBar(
-#                     high=max_high,
-#                     low=min(last_bar.low, curr_low),
-#                     orig_idx=orig_idx,
-#                     is_same_value=False
-#                 )
-            
-#             merged.pop()
-#             merged.append(new_bar)
+def sliding_max(arr, window_size):
+    """计算滑动窗口最大值（单调队列实现），窗口未形成的位置为-inf"""
+    arr = np.asarray(arr, dtype=np.float64)
+    # bottleneck要求窗口不超过数组长度，更短的数组走编译内核（结果全部为窗口未形成）
+    if bn is not None and len(arr) >= window_size:
+        result = bn.move_max(arr, window_size)
+        result[:window_size - 1] = -math.inf
+        return result.tolist()
+    return sliding_max_kernel(arr, window_size).tolist()
+
+def sliding_min(arr, window_size):
+    """计算滑动窗口最小值（单调队列实现），窗口未形成的位置为inf"""
+    arr = np.asarray(arr, dtype=np.float64)
+    # bottleneck要求窗口不超过数组长度，更短的数组走编译内核（结果全部为窗口未形成）
+    if bn is not None and len(arr) >= window_size:
+        result = bn.move_min(arr, window_size)
+        result[:window_size - 1] = math.inf
+        return result.tolist()
+    return sliding_min_kernel(arr, window_size).tolist()
+
+def sliding_max4(arr):
+    """窗口固定为4的滑动窗口最大值，arr为numpy数组；每个位置只需比较4个值，直接对错位切片两两取max，前3个位置为-inf"""
+    result = np.full(len(arr), -math.inf)
+    if len(arr) >= 4:
+        np.maximum(np.maximum(arr[3:], arr[2:-1]), np.maximum(arr[1:-2], arr[:-3]), out=result[3:])
+    return result
+
+def sliding_min4(arr):
+    """窗口固定为4的滑动窗口最小值，arr为numpy数组，前3个位置为inf"""
+    result = np.full(len(arr), math.inf)
+    if len(arr) >= 4:
+        np.minimum(np.minimum(arr[3:], arr[2:-1]), np.minimum(arr[1:-2], arr[:-3]), out=result[3:])
+    return result
+
+def compute_all_extremes(high, low, window_size):
+    """
+    一次算出前序/后序窗口的最大high和最小low，high/low为numpy数组
+    从j开始的后序窗口（j 到 j + window_size - 1）就是以j + window_size - 1结尾的前序窗口，
+    直接错位复用前序结果，不再反转数组重算两遍
+    :return: (pre_max_high, pre_min_low, post_max_high, post_min_low)，窗口不完整的位置为-inf/inf
+    """
+    if window_size == 4:
+        pre_max_high = sliding_max4(high)
+        pre_min_low = sliding_min4(low)
+    else:
+        pre_max_high = np.asarray(sliding_max(high, window_size), dtype=np.float64)
+        pre_min_low = np.asarray(sliding_min(low, window_size), dtype=np.float64)
     
-#     return merged
+    n = len(high)
+    shift = window_size - 1
+    post_max_high = np.full(n, -math.inf)
+    post_min_low = np.full(n, math.inf)
+    if n > shift:
+        post_max_high[:n - shift] = pre_max_high[shift:]
+        post_min_low[:n - shift] = pre_min_low[shift:]
+    return pre_max_high, pre_min_low, post_max_high, post_min_low
+
 class MergedBar:
     """对应Rust中的MergedBar结构体"""
+    # 固定字段，不为每个实例创建__dict__，省内存且属性读取更快
+    __slots__ = ('high', 'low', 'orig_idx', 'is_same_value')
+    
     def __init__(self, high: float, low: float, orig_idx: int, is_same_value: bool):
         self.high = high
         self.low = low
@@ -174,12 +183,20 @@ class MergedBar:
         self.is_same_value = is_same_value  # 是否为同值K线（high≈low）
 
 def merge_contained_bars(high, low, data_len):
-    """处理K线包含关系及连续同值K线合并（完全对齐Rust逻辑）"""
-    if data_len == 0:
-        return []
-    
-    merged = []
-    eps = 1e-6  # 浮点数精度阈值（对齐Rust注释的"极小值判断"）
+    """
+    处理K线包含关系及连续同值K线合并（完全对齐Rust逻辑）
+    :return: 按列存放的合并结果 (high数组, low数组, orig_idx数组, is_same_value数组)
+    """
+    return merge_contained_bars_kernel(np.asarray(high[:data_len], dtype=np.float64),
+                                       np.asarray(low[:data_len], dtype=np.float64))
+
+def extend_merged_bars(merged, high, low, data_len, start_idx=0):
+    """
+    在已合并的K线序列merged末尾继续合并新K线（原地修改merged）
+    合并只依赖merged的最后两根，因此可以缓存已合并的尾部、只对新到的K线增量合并
+    :param start_idx: 第一根新K线在原始序列中的索引，用于orig_idx
+    """
+    eps = EPS  # 绑定为局部变量，循环内按局部变量读取
     
     for i in range(data_len):
         curr_high = high[i]
@@ -187,16 +204,10 @@ def merge_contained_bars(high, low, data_len):
         
         # 1. 判断当前K线是否为同值K线（Rust注释要求的精度判断）
         is_current_same = abs(curr_high - curr_low) < eps
-        
-        current_bar = MergedBar(
-            high=curr_high,
-            low=curr_low,
-            orig_idx=i,
-            is_same_value=is_current_same
-        )
+        curr_orig_idx = start_idx + i
         
         if not merged:
-            merged.append(current_bar)
+            merged.append(MergedBar(curr_high, curr_low, curr_orig_idx, is_current_same))
             continue
         
         last_bar = merged[-1]
@@ -206,19 +217,12 @@ def merge_contained_bars(high, low, data_len):
             values_equal = abs(last_bar.high - curr_high) < eps
             if values_equal:
                 # 合并：继承last_bar的高低点，保留最早的orig_idx（Rust的..last_bar逻辑）
-                merged_same_bar = MergedBar(
-                    high=last_bar.high,
-                    low=last_bar.low,
-                    orig_idx=last_bar.orig_idx,  # 关键：取最早的索引，而非当前
-                    is_same_value=True
-                )
-                merged.pop()
-                merged.append(merged_same_bar)
+                # 合并结果与last_bar完全相同，无需替换
                 continue
         
         # 3. 同值K线与非同值K线不参与包含合并（Rust的核心规则）
         if last_bar.is_same_value or is_current_same:
-            merged.append(current_bar)
+            merged.append(MergedBar(curr_high, curr_low, curr_orig_idx, is_current_same))
             continue
         
         # 4. 检查包含关系（严格对齐Rust的包含逻辑，带精度容错）
@@ -227,7 +231,7 @@ def merge_contained_bars(high, low, data_len):
                        (last_bar.high <= curr_high + eps and last_bar.low >= curr_low - eps)
         
         if not is_contained:
-            merged.append(current_bar)
+            merged.append(MergedBar(curr_high, curr_low, curr_orig_idx, False))
         else:
             # 5. 包含关系合并（按Rust的趋势规则）
             if len(merged) >= 2:
@@ -242,7 +246,7 @@ def merge_contained_bars(high, low, data_len):
                 if is_up:
                     # 向上趋势：取高点最高，低点最高，orig_idx选高点更高的（相同则取前一个）
                     max_high = max(last_bar.high, curr_high)
-                    orig_idx = last_bar.orig_idx if abs(max_high - last_bar.high) < eps else current_bar.orig_idx
+                    orig_idx = last_bar.orig_idx if abs(max_high - last_bar.high) < eps else curr_orig_idx
                     new_bar = MergedBar(
                         high=max_high,
                         low=max(last_bar.low, curr_low),  # Rust的last_bar.low.max(curr_low)
@@ -252,7 +256,7 @@ def merge_contained_bars(high, low, data_len):
                 elif is_down:
                     # 向下趋势：取低点最低，高点最低，orig_idx选低点更低的（相同则取前一个）
                     min_low = min(last_bar.low, curr_low)
-                    orig_idx = last_bar.orig_idx if abs(min_low - last_bar.low) < eps else current_bar.orig_idx
+                    orig_idx = last_bar.orig_idx if abs(min_low - last_bar.low) < eps else curr_orig_idx
                     new_bar = MergedBar(
                         high=min(last_bar.high, curr_high),  # Rust的last_bar.high.min(curr_high)
                         low=min_low,
@@ -270,7 +274,7 @@ def merge_contained_bars(high, low, data_len):
             else:
                 # 仅1根非同值K线：合并取高低点范围，orig_idx选高点更高的（相同则取前一个）
                 max_high = max(last_bar.high, curr_high)
-                orig_idx = last_bar.orig_idx if abs(max_high - last_bar.high) < eps else current_bar.orig_idx
+                orig_idx = last_bar.orig_idx if abs(max_high - last_bar.high) < eps else curr_orig_idx
                 new_bar = MergedBar(
                     high=max_high,
                     low=min(last_bar.low, curr_low),
@@ -278,164 +282,403 @@ def merge_contained_bars(high, low, data_len):
                     is_same_value=False
                 )
             
-            # 替换最后一根K线（Rust的pop+push）
-            merged.pop()
-            merged.append(new_bar)
-    
-    return merged
+            # 替换最后一根K线（Rust的pop+push），直接覆盖最后一个位置
+            merged[-1] = new_bar
 
-def identify_turns(data_len, high, low):
-    """识别K线转向点（顶底分型）主函数"""
-    # 初始化输出为0
-    pf_out = [0.0 for _ in range(data_len)]
-    
-    if data_len < 6:
-        return pf_out
+@njit(cache=True)
+def merge_contained_bars_kernel(high, low):
+    """
+    merge_contained_bars的编译内核，合并规则与extend_merged_bars完全相同
+    合并结果按列存放在预分配的数组中，m为已合并根数，pop+push改为直接覆盖第m-1根
+    :return: (high数组, low数组, orig_idx数组, is_same_value数组)
+    """
+    data_len = high.shape[0]
+    out_high = np.empty(data_len, dtype=np.float64)
+    out_low = np.empty(data_len, dtype=np.float64)
+    out_idx = np.empty(data_len, dtype=np.int64)
+    out_same = np.empty(data_len, dtype=np.bool_)
+    eps = EPS
+    m = 0
     
-    # 处理K线包含关系及合并
-    merged_bars = merge_contained_bars(high, low, data_len)
-    merged_len = len(merged_bars)
-    window_size = 4
-    
-    if merged_len <= window_size * 2:
-        return pf_out
-    
-    # 提取合并后K线的high和low数组
-    merged_high = [bar.high for bar in merged_bars]
-    merged_low = [bar.low for bar in merged_bars]
-    
-    # 滑动窗口极值预计算
-    # 1. 前序窗口（i - window_size 到 i - 1）的max_high和min_low
-    pre_max_high = sliding_max(merged_high, window_size)
-    pre_min_low = sliding_min(merged_low, window_size)
-    
-    # 2. 后序窗口（i + 1 到 i + window_size）的max_high和min_low
-    # 反转数组计算滑动窗口，再反转结果
-    reversed_high = merged_high[::-1]
-    reversed_low = merged_low[::-1]
-    reversed_post_max_high = sliding_max(reversed_high, window_size)
-    reversed_post_min_low = sliding_min(reversed_low, window_size)
-    # 反转回原顺序
-    post_max_high = reversed_post_max_high[::-1]
-    post_min_low = reversed_post_min_low[::-1]
-    
-    # 识别转向点
-    turns = []
-    
-    # 处理中间部分K线（前后各window_size根）
-    for i in range(window_size, merged_len - window_size):
-        current = merged_bars[i]
-        current_high = current.high
-        current_low = current.low
-        
-        # 前序窗口最大值（i - window_size 到 i - 1）
-        max_prev_high = pre_max_high[i - 1]
-        # 后序窗口最大值（i + 1 到 i + window_size）
-        max_next_high = post_max_high[i + 1]
-        max_prev_next_high = max(max_prev_high, max_next_high)
-        
-        # 前序窗口最小值（i - window_size 到 i - 1）
-        min_prev_low = pre_min_low[i - 1]
-        # 后序窗口最小值（i + 1 到 i + window_size）
-        min_next_low = post_min_low[i + 1]
-        min_prev_next_low = min(min_prev_low, min_next_low)
-        
-        if current_high >= max_prev_next_high - 1e-6:
-            turns.append( (i, 1) )
-        elif current_low <= min_prev_next_low + 1e-6:
-            turns.append( (i, -1) )
-    
-    # 处理最后window_size根K线
-    start = max(0, merged_len - window_size)
-    for i in range(start, merged_len):
-        current = merged_bars[i]
-        current_high = current.high
-        current_low = current.low
+    for i in range(data_len):
+        curr_high = high[i]
+        curr_low = low[i]
+        is_current_same = abs(curr_high - curr_low) < eps
         
-        start_prev = max(0, i - window_size)
-        # 计算前序窗口极值
-        if start_prev == 0 and i - 1 >= window_size - 1:
-            max_prev_high = pre_max_high[i - 1]
-            min_prev_low = pre_min_low[i - 1]
-        else:
-            # 不足window_size时直接计算
-            max_prev_high = max(merged_high[start_prev:i]) if start_prev < i else -math.inf
-            min_prev_low = min(merged_low[start_prev:i]) if start_prev < i else math.inf
+        if m > 0:
+            last_high = out_high[m - 1]
+            last_low = out_low[m - 1]
+            last_idx = out_idx[m - 1]
+            last_same = out_same[m - 1]
+            
+            # 连续同值K线且值相等：合并后与最后一根完全相同（保留最早的orig_idx），无需改动
+            if is_current_same and last_same and abs(last_high - curr_high) < eps:
+                continue
+            
+            # 同值K线与非同值K线不参与包含合并；不存在包含关系时同样直接追加
+            if not (last_same or is_current_same) and (
+                    (curr_high <= last_high + eps and curr_low >= last_low - eps) or
+                    (last_high <= curr_high + eps and last_low >= curr_low - eps)):
+                # orig_idx直接由一次比较选出（编译后为条件传送，不产生难预测的分支）：
+                # abs(max(last_high, curr_high) - last_high) < eps 等价于 curr_high - last_high < eps，低点同理
+                if m >= 2:
+                    prev_high = out_high[m - 2]
+                    prev_low = out_low[m - 2]
+                    is_up = (last_high > prev_high - eps) and (last_low > prev_low - eps)
+                    is_down = (last_high < prev_high + eps) and (last_low < prev_low + eps)
+                    
+                    if is_up:
+                        new_high = max(last_high, curr_high)
+                        new_low = max(last_low, curr_low)
+                        new_idx = i if curr_high - last_high >= eps else last_idx
+                    elif is_down:
+                        new_high = min(last_high, curr_high)
+                        new_low = min(last_low, curr_low)
+                        new_idx = i if last_low - curr_low >= eps else last_idx
+                    else:
+                        new_high = max(last_high, curr_high)
+                        new_low = min(last_low, curr_low)
+                        new_idx = last_idx
+                else:
+                    new_high = max(last_high, curr_high)
+                    new_low = min(last_low, curr_low)
+                    new_idx = i if curr_high - last_high >= eps else last_idx
+                
+                # 替换最后一根K线
+                out_high[m - 1] = new_high
+                out_low[m - 1] = new_low
+                out_idx[m - 1] = new_idx
+                out_same[m - 1] = False
+                continue
         
-        if current_high >= max_prev_high - 1e-6:
-            turns.append( (i, 1) )
-        elif current_low <= min_prev_low + 1e-6:
-            turns.append( (i, -1) )
+        out_high[m] = curr_high
+        out_low[m] = curr_low
+        out_idx[m] = i
+        out_same[m] = is_current_same
+        m += 1
     
-    # 合并连续同类型转向点
-    new_turns = []
+    return out_high[:m], out_low[:m], out_idx[:m], out_same[:m]
+
+@njit(cache=True)
+def merge_same_type_turns(turn_idx, turn_type, merged_high, merged_low):
+    """
+    合并连续同类型转向点：每段连续同类型的转向点只保留一个，
+    顶取high最高、底取low最低的（后面的要超出EPS才替换，相同时保留靠前的）
+    :return: (转向点下标数组, 转向点类型数组)
+    """
+    n = turn_idx.shape[0]
+    out_idx = np.empty(n, dtype=np.int64)
+    out_type = np.empty(n, dtype=np.int8)
+    m = 0
     i = 0
-    while i < len(turns):
-        current_idx, current_type = turns[i]
-        current_val = merged_bars[current_idx].high if current_type == 1 else merged_bars[current_idx].low
+    while i < n:
+        current_type = turn_type[i]
+        current_idx = turn_idx[i]
+        current_val = merged_high[current_idx] if current_type == 1 else merged_low[current_idx]
         
         j = i + 1
-        while j < len(turns) and turns[j][1] == current_type:
-            val = merged_bars[turns[j][0]].high if current_type == 1 else merged_bars[turns[j][0]].low
-            if (current_type == 1 and val > current_val + 1e-6) or (current_type == -1 and val < current_val - 1e-6):
-                current_idx = turns[j][0]
-                current_val = val
+        while j < n and turn_type[j] == current_type:
+            idx = turn_idx[j]
+            if current_type == 1:
+                val = merged_high[idx]
+                if val > current_val + EPS:
+                    current_idx = idx
+                    current_val = val
+            else:
+                val = merged_low[idx]
+                if val < current_val - EPS:
+                    current_idx = idx
+                    current_val = val
             j += 1
         
-        new_turns.append( (current_idx, current_type) )
+        out_idx[m] = current_idx
+        out_type[m] = current_type
+        m += 1
         i = j
     
-    # 顶底分型高低关系验证
-    validated_turns = []
-    for i in range(len(new_turns)):
-        if i == 0:
-            validated_turns.append(new_turns[i])
-            continue
-        
-        if not validated_turns:
-            validated_turns.append(new_turns[i])
+    return out_idx[:m], out_type[:m]
+
+@njit(cache=True)
+def validate_turns(turn_idx, turn_type, merged_high, merged_low):
+    """
+    顶底分型高低关系验证：已确认的转向点作为栈，新转向点与栈顶类型相同则跳过；
+    底后接顶要求顶高于底、顶后接底要求底低于顶（超出EPS），满足则入栈，否则弹出栈顶
+    :return: (转向点下标数组, 转向点类型数组)
+    """
+    n = turn_idx.shape[0]
+    out_idx = np.empty(n, dtype=np.int64)
+    out_type = np.empty(n, dtype=np.int8)
+    m = 0
+    for i in range(n):
+        curr_idx = turn_idx[i]
+        curr_type = turn_type[i]
+        if m == 0:
+            out_idx[m] = curr_idx
+            out_type[m] = curr_type
+            m += 1
             continue
         
-        prev_idx, prev_type = validated_turns[-1]
-        curr_idx, curr_type = new_turns[i]
-        
+        prev_idx = out_idx[m - 1]
+        prev_type = out_type[m - 1]
         if prev_type == curr_type:
             continue
         
-        # 获取分型关键值
-        prev_val = merged_bars[prev_idx].high if prev_type == 1 else merged_bars[prev_idx].low
-        curr_val = merged_bars[curr_idx].high if curr_type == 1 else merged_bars[curr_idx].low
-        
-        # 验证高低关系
-        is_valid = False
-        if (prev_type, curr_type) == (-1, 1):
-            is_valid = curr_val > prev_val + 1e-6
-        elif (prev_type, curr_type) == (1, -1):
-            is_valid = curr_val < prev_val - 1e-6
+        # 获取分型关键值并验证高低关系
+        if curr_type == 1:
+            is_valid = merged_high[curr_idx] > merged_low[prev_idx] + EPS
+        else:
+            is_valid = merged_low[curr_idx] < merged_high[prev_idx] - EPS
         
         if is_valid:
-            validated_turns.append( (curr_idx, curr_type) )
+            out_idx[m] = curr_idx
+            out_type[m] = curr_type
+            m += 1
         else:
-            validated_turns.pop()
+            m -= 1
+    
+    return out_idx[:m], out_type[:m]
+
+def identify_turns(data_len, high, low):
+    """识别K线转向点（顶底分型）主函数"""
+    # 初始化输出为0
+    pf_out = [0.0] * data_len
+    
+    if data_len < 6:
+        return pf_out
+    
+    # 处理K线包含关系及合并（按列存放的数组）
+    merged_high, merged_low, merged_orig_idx, _ = merge_contained_bars(high, low, data_len)
+    merged_len = len(merged_high)
+    window_size = 4
+    
+    if merged_len <= window_size * 2:
+        return pf_out
     
-    new_turns = validated_turns
-    if len(new_turns) <= window_size:
+    # 滑动窗口极值预计算
+    # 1. 前序窗口（i - window_size 到 i - 1）的max_high和min_low：pre[i - 1]
+    # 2. 后序窗口（i + 1 到 i + window_size）的max_high和min_low：post[i + 1]
+    pre_max_high, pre_min_low, post_max_high, post_min_low = compute_all_extremes(
+        merged_high, merged_low, window_size)
+    
+    # 识别转向点
+    # 第i根对应前序窗口pre[i - 1]、后序窗口post[i + 1]，中间部分（前后各window_size根）和最后window_size根一起判断：
+    # 最后window_size根的后序窗口不足，post为-inf/inf（最后一根没有post[i + 1]），取max/min后只剩前序窗口，与单独判断时相同；
+    # 前序窗口在merged_len > window_size * 2时总是完整的window_size根，即pre[i - 1]
+    # pre/post本轮不再使用，直接在pre上原地合并，不另外分配数组
+    max_prev_next_high = pre_max_high[window_size - 1:merged_len - 1]
+    min_prev_next_low = pre_min_low[window_size - 1:merged_len - 1]
+    np.maximum(max_prev_next_high[:-1], post_max_high[window_size + 1:], out=max_prev_next_high[:-1])
+    np.minimum(min_prev_next_low[:-1], post_min_low[window_size + 1:], out=min_prev_next_low[:-1])
+    # 顶分型优先，不是顶分型才判断底分型
+    is_top = merged_high[window_size:] >= max_prev_next_high - EPS
+    is_bottom = ~is_top & (merged_low[window_size:] <= min_prev_next_low + EPS)
+    turn_pos = np.flatnonzero(is_top | is_bottom)
+    
+    # 合并连续同类型转向点
+    # 转向点按列存放：下标数组 + 类型数组（1顶/-1底，int8即可）
+    turn_type = np.where(is_top[turn_pos], np.int8(1), np.int8(-1))
+    new_idx, new_type = merge_same_type_turns(turn_pos + window_size, turn_type, merged_high, merged_low)
+    
+    # 顶底分型高低关系验证
+    new_idx, new_type = validate_turns(new_idx, new_type, merged_high, merged_low)
+    if len(new_idx) <= window_size:
         return pf_out
     
-    # 验证交替性并输出
-    confirmed_turns = []
-    for i in range(len(new_turns) - 1):
-        idx1, t1 = new_turns[i]
-        idx2, t2 = new_turns[i + 1]
-        if (t1 == 1 and t2 == -1) or (t1 == -1 and t2 == 1):
-            confirmed_turns.append( (idx1, t1) )
-    if new_turns:
-        confirmed_turns.append(new_turns[-1])
+    # 验证交替性：与下一个转向点类型不同的保留，最后一个总是保留
+    keep = np.ones(len(new_idx), dtype=np.bool_)
+    keep[:-1] = new_type[:-1] != new_type[1:]
     
-    # 映射到原始索引输出
-    for merged_idx, turn_type in confirmed_turns:
-        orig_idx = merged_bars[merged_idx].orig_idx
-        if orig_idx < data_len:
-            pf_out[orig_idx] = float(turn_type)
+    # 映射到原始索引，整体一次写入输出
+    orig_idx = merged_orig_idx[new_idx[keep]]
+    turn_type = new_type[keep]
+    in_range = orig_idx < data_len
+    out = np.zeros(data_len, dtype=np.float64)
+    out[orig_idx[in_range]] = turn_type[in_range]
+    # 调用方逐个下标读取结果，仍返回列表
+    pf_out = out.tolist()
     
-    return pf_out
\ No newline at end of file
+    return pf_out
+
+
+class TdxApiPool:
+    """
+    pytdx行情长连接池：连接池按线程独占，每个工作线程各持有一组长连接（每个服务器一个），互不共享socket
+    连接空闲超过idle_seconds时，复用前先发心跳确认服务器没有断开
+    """
+    def __init__(self, servers, idle_seconds=30):
+        """
+        :param servers: 服务器列表 [(ip, port), ...]
+        :param idle_seconds: 连接空闲超过该秒数，复用前先发心跳
+        """
+        self.servers = servers
+        self.idle_seconds = idle_seconds
+        self.local = threading.local()
+
+    def get(self):
+        """
+        获取当前线程的连接池，首次调用时创建
+        :return: threading.local，含 api_pool / api_alive / api_last_used / api_next 属性
+        """
+        local = self.local
+        if not hasattr(local, 'api_pool'):
+            local.api_pool = [TdxHq_API(raise_exception=True) for _ in self.servers]
+            local.api_alive = [False] * len(self.servers)
+            local.api_last_used = [0.0] * len(self.servers)  # 每个连接最后一次成功通信的时间
+            local.api_next = 0  # 轮询起始下标
+        return local
+
+    def rotation(self, local):
+        """本次请求依次尝试的连接下标：从轮询起始下标开始轮一圈，并把起始下标后移一位"""
+        pool_size = len(local.api_pool)
+        start = local.api_next
+        local.api_next = (start + 1) % pool_size
+        return [(start + k) % pool_size for k in range(pool_size)]
+
+    def connect(self, local, i):
+        """
+        (重新)建立连接池中第i个服务器的连接
+        :return: 是否连接成功
+        """
+        server_ip, server_port = self.servers[i]
+        try:
+            local.api_pool[i].connect(server_ip, server_port)
+            local.api_alive[i] = True
+            local.api_last_used[i] = time.monotonic()
+            logging.debug(f"成功连接到服务器 {server_ip}:{server_port}")
+        except Exception as e:
+            local.api_alive[i] = False
+            logging.debug(f"连接服务器 {server_ip}:{server_port} 失败: {e}")
+        return local.api_alive[i]
+
+    def ensure(self, local, i):
+        """
+        取用连接池中第i个连接前确认其可用：未连接则连接；空闲过久先发心跳，心跳失败则重连
+        :return: 连接是否可用
+        """
+        if not local.api_alive[i]:
+            return self.connect(local, i)
+        if time.monotonic() - local.api_last_used[i] > self.idle_seconds:
+            try:
+                local.api_pool[i].do_heartbeat()
+                local.api_last_used[i] = time.monotonic()
+            except Exception as e:
+                server_ip, server_port = self.servers[i]
+                logging.debug(f"服务器 {server_ip}:{server_port} 心跳失败，重新连接: {e}")
+                self.mark_broken(local, i)
+                return self.connect(local, i)
+        return True
+
+    def mark_broken(self, local, i):
+        """标记第i个连接失效，下次使用时重连"""
+        local.api_alive[i] = False
+        try:
+            local.api_pool[i].disconnect()
+        except Exception:
+            pass
+
+    def touch(self, local, i):
+        """记录第i个连接刚成功通信过"""
+        local.api_last_used[i] = time.monotonic()
+
+
+class Beeper:
+    """
+    后台蜂鸣提醒：winsound.Beep会阻塞500毫秒，放到后台线程执行，beep()不阻塞调用线程
+    队列容量为1，同时触发的多只股票只响一次
+    """
+
+    def __init__(self):
+        self.beep_q = queue.Queue(maxsize=1)
+        if winsound is None:
+            logging.warning("未找到winsound（非Windows环境），蜂鸣提醒不可用")
+            return
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def worker(self):
+        """后台蜂鸣线程：取到提醒就响一次，两次蜂鸣至少间隔1秒"""
+        while True:
+            self.beep_q.get()
+            try:
+                winsound.Beep(1000, 500)  # 1000Hz频率，持续500毫秒
+            except Exception as e:
+                logging.error(f"蜂鸣失败: {e}")
+            time.sleep(0.5)
+
+    def beep(self):
+        """请求蜂鸣提醒；已有待响的提醒时直接合并"""
+        try:
+            self.beep_q.put_nowait(())
+        except queue.Full:
+            pass
+
+
+def load_map(cfg_path, col_idx_key, col_idx_val, filter_prefix=None):
+    """
+    读取通达信.cfg映射文件（'|'分隔、gbk编码），返回 {第col_idx_key列: 第col_idx_val列} 字典
+    解析结果缓存到MAP_CACHE_DIR，缓存中记录的.cfg修改时间与当前一致时直接读缓存，不再重新解析
+    Args:
+        filter_prefix: 只保留值以该前缀开头的记录（如指数标识'X'），None表示不过滤
+    """
+    # .cfg不存在时这里抛出FileNotFoundError，由调用方提示
+    cfg_mtime = os.path.getmtime(cfg_path)
+    # 同一个文件按不同列/过滤条件解析的结果分开缓存
+    key = repr((os.path.abspath(cfg_path), col_idx_key, col_idx_val, filter_prefix))
+    cache_name = f"{os.path.basename(cfg_path)}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.pkl"
+    cache_path = os.path.join(MAP_CACHE_DIR, cache_name)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['cfg_mtime'] == cfg_mtime:
+                return cached['mapping']
+        except Exception as e:
+            logging.warning(f"读取映射缓存 {cache_path} 失败，重新解析: {e}")
+
+    # 只有load_map用到pandas，纯计算的函数不依赖它
+    import pandas as pd
+    # 只解析用到的两列；优先用C引擎，个别文件C引擎解析失败时退回python引擎
+    read_kwargs = dict(sep='|', encoding='gbk', dtype=str, header=None, usecols=[col_idx_key, col_idx_val])
+    try:
+        df = pd.read_csv(cfg_path, engine='c', **read_kwargs)
+    except (pd.errors.ParserError, ValueError):
+        df = pd.read_csv(cfg_path, engine='python', **read_kwargs)
+    if filter_prefix is not None:
+        df = df[df[col_idx_val].str.startswith(filter_prefix)]
+    mapping = pd.Series(df[col_idx_val].values, index=df[col_idx_key]).to_dict()
+
+    try:
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump({'cfg_mtime': cfg_mtime, 'mapping': mapping}, f, protocol=5)
+    except OSError as e:
+        logging.warning(f"保存映射缓存 {cache_path} 失败: {e}")
+    return mapping
+
+
+def parse_val_array(val_str):
+    """
+    解析Redis中的val数组字符串为整数列表
+    Rust端写入的是JSON数组（如"[1, 2, 3]"），直接按JSON解析；
+    不是整数JSON数组时退回原来的方式：去掉方括号和空白后按逗号切分，格式错误时抛出ValueError
+    """
+    try:
+        arr = json_loads(val_str)
+    except ValueError:
+        arr = None
+    if isinstance(arr, list) and all(type(x) is int for x in arr):
+        return arr
+    cleaned_str = _WS.sub('', val_str.strip('[]'))
+    if not cleaned_str:
+        return []
+    return list(map(int, cleaned_str.split(',')))
+
+
+def mget_in_batches(r, keys, batch_size=MGET_BATCH_SIZE):
+    """
+    按固定大小分批MGET，所有批次放进同一个pipeline一次发出
+    单条请求和回复的大小都有上限，返回的值列表与keys顺序一致
+    """
+    pipe = r.pipeline(transaction=False)
+    for start in range(0, len(keys), batch_size):
+        pipe.mget(keys[start:start + batch_size])
+    return [val for batch in pipe.execute() for val in batch]
@@ -6,14 +6,32 @@ import matplotlib.pyplot as plt
 from pytdx.hq import TdxHq_API
 from typing import Callable, Dict, List, Tuple
 import gupiaojichu
+from gupiaojichu import njit
 import struct
 from mootdx.reader import Reader
-from collections import defaultdict, deque
+from collections import defaultdict, deque, namedtuple
 import os
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 # 忽略无关警告
 warnings.filterwarnings('ignore')
+# 开启pandas写时复制：切片、浅拷贝和取列只在真正写入时才复制数据（pandas 3.0起已是默认，设置无影响）
+# 没有该选项的旧版本直接跳过；策略和分析函数都不会原地修改传入的表，不开启时结果相同
+try:
+    pd.set_option('mode.copy_on_write', True)
+except KeyError:
+    pass  # OptionError是KeyError的子类
+
+# 配置日志：LOG_LEVEL改为logging.DEBUG可输出逐笔买卖明细和最后一个时间点的排名数据
+# 批量回测的子进程由init_backtest_worker按主进程当前的级别重新配置
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+# numba编译时会输出大量DEBUG日志，不随LOG_LEVEL打开
+logging.getLogger('numba').setLevel(logging.WARNING)
 
 # 通达信板块文件路径
 BLOB_FILE_PATH_INDEX = r"D:\zd_hbzq\T0002\blocknew\YJSJBK.blk"
@@ -21,6 +39,220 @@ BLOB_FILE_PATH = r"D:\zd_hbzq\T0002\blocknew\SSYNYS.blk"
 # BLOB_FILE_PATH = r"D:\zd_hbzq\T0002\blocknew\TEST.blk"
 # 本地通达信数据默认路径
 DEFAULT_TDX_PATH = r"D:\zd_hbzq"
+# 联网获取的K线缓存目录：每只股票每个周期一个文件，再次获取时只向服务器请求缓存之后的新K线
+KLINE_CACHE_DIR = ".kcache"
+try:
+    # 安装了pyarrow时K线缓存存为zstd压缩的parquet（列式读写），未安装时退回pickle
+    import pyarrow  # noqa: F401
+    KLINE_CACHE_EXT = ".parquet"
+except ImportError:
+    KLINE_CACHE_EXT = ".pkl"
+# 增量获取时每次向服务器请求的K线条数
+KLINE_INCREMENT_STEP = 100
+
+def kline_cache_path(code, ktype):
+    """联网K线缓存文件路径：KLINE_CACHE_DIR/股票代码_ktype.parquet（没有pyarrow时为.pkl）"""
+    return os.path.join(KLINE_CACHE_DIR, f"{code}_{ktype}{KLINE_CACHE_EXT}")
+
+
+def format_security_bars(data):
+    """把pytdx get_security_bars的返回值整理成以datetime为索引的开高低收量额DataFrame"""
+    df = pd.DataFrame(data)
+    if df.empty:
+        return df
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    df = df.rename(columns={
+        'open': '开盘价', 'high': '最高价', 'low': '最低价', 
+        'close': '收盘价', 'vol': '成交量', 'amount': '成交额'
+    })
+    # 设置日期时间为索引，保留核心字段
+    return df.set_index('datetime')[['开盘价', '最高价', '最低价', '收盘价', '成交量', '成交额']]
+
+
+def moving_average(values, window):
+    """window根的简单移动平均，前window-1个位置为NaN；返回可写的数组（写时复制下to_numpy()为只读视图）"""
+    return pd.Series(values, dtype=np.float64).rolling(window=window).mean().to_numpy(copy=True)
+
+
+@njit(cache=True)
+def day_signal_kernel(close, ma):
+    """
+    日线过滤条件，一次遍历算出，不生成MA移位、各条件等中间序列
+    当日条件：收盘价 > MA 且 MA > 3根之前的MA（MA为NaN时不满足）
+    返回每根日线的前一日是否满足条件（即条件shift(1).fillna(False)）
+    """
+    n = len(close)
+    valid = np.zeros(n, dtype=np.bool_)
+    for i in range(3, n - 1):
+        valid[i + 1] = close[i] > ma[i] and ma[i] > ma[i - 3]
+    return valid
+
+
+# run_backtest_kernel的返回结果：按字段名取用，不再按位置拆包
+BacktestKernelResult = namedtuple('BacktestKernelResult', [
+    'kept_idx',           # 写入结果的K线位置（被跳过的买入K线不写结果）
+    'position',           # 持仓数量
+    'cash',               # 可用现金
+    'asset',              # 总资产
+    'stop',               # 止损价格
+    'risk',               # 单笔风险金额
+    'ev_kind',            # 每根K线的事件类型：1买入、-1卖出、2以损定量数量为0、0无
+    'ev_num',             # 成交数量
+    'ev_fee',             # 费用
+    'ev_pnl',             # 盈亏
+    'ev_stop',            # 止损价
+    'ev_risk',            # 单笔风险金额
+    'ev_base',            # 买入时总资产
+    'final_stop',         # 结束时的止损价
+    'final_in_position',  # 结束时是否持仓
+    'final_risk',         # 结束时的单笔风险金额
+])
+
+@njit(cache=True)
+def run_backtest_kernel(close, low, high, signal, rank_ok, active_stop, init_cash, commission,
+                        stop_loss_ratio, risk_per_trade):
+    """
+    run_backtest逐根K线的资金/持仓状态机（纯数值部分）
+    资金和持仓只在信号K线上变化：只遍历signal非0的K线，两个信号之间的K线整段填充当前状态
+    Args:
+        signal: 策略信号（int8，1买入，-1卖出，0无）
+        rank_ok: 每根K线是否满足排名条件（不做排名过滤时全为True）
+        active_stop: 策略记录的持仓中实时止损价（没有记录的K线为NaN）
+        risk_per_trade: 回测开始时的单笔风险金额
+    Returns:
+        BacktestKernelResult: 各字段含义见其定义
+    """
+    n = len(close)
+    keep = np.ones(n, dtype=np.bool_)  # 被跳过的买入K线不写结果
+    position_full = np.empty(n, dtype=np.int64)
+    cash_full = np.empty(n)
+    risk_full = np.empty(n)
+    in_pos_full = np.empty(n, dtype=np.bool_)
+    ev_kind = np.zeros(n, dtype=np.int8)
+    ev_num = np.zeros(n, dtype=np.int64)
+    ev_fee = np.zeros(n)
+    ev_pnl = np.zeros(n)
+    ev_stop = np.zeros(n)
+    ev_risk = np.zeros(n)
+    ev_base = np.zeros(n)
+
+    cash = init_cash
+    position = 0
+    buy_price = 0.0
+    buy_fee = 0.0
+    buy_in_total_asset = 0.0
+    stop_loss_price = 0.0
+    in_position = False
+    buy_idx = -1
+    prev = 0
+    for i in np.flatnonzero(signal != 0):
+        # 上一个信号到这一个信号之间状态不变
+        position_full[prev:i] = position
+        cash_full[prev:i] = cash
+        risk_full[prev:i] = risk_per_trade
+        in_pos_full[prev:i] = in_position
+        prev = i + 1
+
+        close_price = close[i]
+        current_total_asset = cash + position * close_price
+
+        if signal[i] == 1 and cash > close_price and not in_position:
+            if not rank_ok[i]:
+                keep[i] = False
+                continue
+            if i > 0:
+                # 与min(最低价, 前一根最高价)相同：相等时取最低价
+                loss_price = low[i]
+                if high[i - 1] < loss_price:
+                    loss_price = high[i - 1]
+                if (close_price - loss_price) / loss_price * 100 > 2.4:
+                    keep[i] = False
+                    continue
+                if (close_price - loss_price) / loss_price * 100 < 0.5:
+                    keep[i] = False
+                    continue
+                stop_loss_price = loss_price
+            else:
+                stop_loss_price = low[i]
+
+            # 以损定量，与calculate_position_size相同
+            buy_num = 0
+            if close_price > stop_loss_price:
+                risk_per_trade = current_total_asset * stop_loss_ratio
+                max_shares = risk_per_trade / (close_price - stop_loss_price)
+                buy_num = int(max_shares // 100 * 100)
+                max_affordable = current_total_asset / (close_price * 1.001)
+                buy_num = min(buy_num, int(max_affordable // 100 * 100))
+                buy_num = max(buy_num, 0)
+
+            if buy_num > 0:
+                buy_in_total_asset = cash + position * close_price
+                cost = buy_num * close_price * (1 + commission)
+                fee = buy_num * close_price * commission
+                if cash >= cost:
+                    position += buy_num
+                    cash -= cost
+                    buy_price = close_price
+                    buy_fee = fee
+                    in_position = True
+                    buy_idx = i
+                    ev_kind[i] = 1
+                    ev_num[i] = buy_num
+                    ev_fee[i] = fee
+                    ev_stop[i] = stop_loss_price
+                    ev_risk[i] = risk_per_trade
+            else:
+                ev_kind[i] = 2
+                ev_stop[i] = stop_loss_price
+
+        elif signal[i] == -1 and position > 0:
+            sell_num = position
+            fee = sell_num * close_price * commission
+            income = sell_num * close_price * (1 - commission)
+            total_buy_cost = sell_num * buy_price + buy_fee
+            pnl = (income - fee) - total_buy_cost
+            cash += income
+            ev_kind[i] = -1
+            ev_num[i] = sell_num
+            ev_fee[i] = fee
+            ev_pnl[i] = pnl
+            ev_risk[i] = risk_per_trade
+            ev_base[i] = buy_in_total_asset
+
+            position = 0
+            buy_price = 0.0
+            buy_fee = 0.0
+            stop_loss_price = 0.0
+            in_position = False
+            risk_per_trade = 0.0
+
+        position_full[i] = position
+        cash_full[i] = cash
+        risk_full[i] = risk_per_trade
+        in_pos_full[i] = in_position
+    position_full[prev:] = position
+    cash_full[prev:] = cash
+    risk_full[prev:] = risk_per_trade
+    in_pos_full[prev:] = in_position
+
+    # 持仓中的止损价每根K线取策略记录的实时止损价，买入K线取买入时算出的止损价
+    stop_full = np.where(in_pos_full, active_stop, 0.0)
+    if buy_idx >= 0:
+        for i in np.flatnonzero(ev_kind == 1):
+            stop_full[i] = ev_stop[i]
+    if in_position and buy_idx != n - 1:
+        stop_loss_price = active_stop[n - 1]
+
+    kept_idx = np.flatnonzero(keep)
+    position_arr = position_full[kept_idx]
+    cash_arr = cash_full[kept_idx]
+    asset_arr = cash_arr + position_arr * close[kept_idx]
+    stop_arr = stop_full[kept_idx]
+    risk_arr = np.where(in_pos_full[kept_idx], risk_full[kept_idx], 0.0)
+    return BacktestKernelResult(kept_idx, position_arr, cash_arr, asset_arr, stop_arr, risk_arr, ev_kind, ev_num,
+                                ev_fee, ev_pnl, ev_stop, ev_risk, ev_base, stop_loss_price, in_position,
+                                risk_per_trade)
+
 
 class TdxStockBacktest:
     """基于pytdx的股票回测框架（支持多周期K线+止损策略+以损定量+三买变体买点）"""
@@ -146,28 +378,21 @@ class TdxStockBacktest:
         market = 1 if code.startswith('6') else 0
         
         try:
-            # 获取原始数据
-            data = self.api.get_security_bars(ktype, market, code, start, count)
-            # 转换为DataFrame并格式化
-            df = pd.DataFrame(data)
-            if df.empty:
+            # 从最新K线开始取时先读缓存，缓存够count条就只请求缓存之后的新K线
+            cached = self.load_k_cache(code, ktype) if start == 0 else None
+            if cached is not None and len(cached) >= count:
+                result_df = self.fetch_k_increment(market, code, count, ktype, cached)
+            else:
+                result_df = format_security_bars(self.api.get_security_bars(ktype, market, code, start, count))
+            if result_df.empty:
                 print(f"未获取到{self._ktype2name(ktype)}数据")
-                return df, [], []
+                return result_df, [], []
+            if start == 0:
+                self.save_k_cache(code, ktype, result_df)
             
             # 提取最高价和最低价列表
-            result_list_high = df['high'].astype(float).tolist()
-            result_list_low = df['low'].astype(float).tolist()
-            
-            # 格式化字段
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            df = df.rename(columns={
-                'open': '开盘价', 'high': '最高价', 'low': '最低价', 
-                'close': '收盘价', 'vol': '成交量', 'amount': '成交额'
-            })
-            # 设置日期时间为索引
-            df = df.set_index('datetime')
-            # 保留核心字段
-            result_df = df[['开盘价', '最高价', '最低价', '收盘价', '成交量', '成交额']]
+            result_list_high = result_df['最高价'].astype(float).tolist()
+            result_list_low = result_df['最低价'].astype(float).tolist()
             
             # 按周期存储数据
             period = self._ktype2name(ktype)
@@ -178,6 +403,66 @@ class TdxStockBacktest:
             print(f"获取{self._ktype2name(ktype)}数据失败: {e}")
             return pd.DataFrame(), [], []
     
+    @staticmethod
+    def load_k_cache(code: str, ktype: int):
+        """读取K线缓存，没有缓存或读取失败时返回None"""
+        cache_path = kline_cache_path(code, ktype)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            if KLINE_CACHE_EXT == ".parquet":
+                cached = pd.read_parquet(cache_path)
+            else:
+                cached = pd.read_pickle(cache_path)
+        except Exception as e:
+            logging.warning(f"读取K线缓存 {cache_path} 失败，重新获取: {e}")
+            return None
+        return cached if not cached.empty else None
+    
+    @staticmethod
+    def save_k_cache(code: str, ktype: int, df: pd.DataFrame):
+        """保存K线缓存，写入失败只记录警告"""
+        cache_path = kline_cache_path(code, ktype)
+        try:
+            os.makedirs(KLINE_CACHE_DIR, exist_ok=True)
+            if KLINE_CACHE_EXT == ".parquet":
+                df.to_parquet(cache_path, compression='zstd')
+            else:
+                df.to_pickle(cache_path, protocol=5)
+        except (OSError, ValueError) as e:
+            logging.warning(f"保存K线缓存 {cache_path} 失败: {e}")
+    
+    def fetch_k_increment(self, market: int, code: str, count: int, ktype: int, cached: pd.DataFrame) -> pd.DataFrame:
+        """
+        先请求最新的一小批K线，接上缓存的最后一根K线就拼接后取最新count条（缓存至少有count条）
+        缓存的最后一根K线可能是盘中未走完的K线，重叠部分以新请求到的为准
+        请求了count条仍接不上缓存时（缓存太旧），直接使用新请求到的K线
+        服务器没有数据修改时间可查，改用重叠部分判断缓存是否过期：除缓存最后一根外，重叠的已走完K线
+        与新请求到的不一致（服务器数据已修正），整份缓存作废，重新请求完整的count条
+        """
+        last_dt = cached.index[-1]
+        parts = []
+        fetched = 0
+        while fetched < count:
+            # 第一次只请求KLINE_INCREMENT_STEP条，接不上缓存时把剩下的一次请求完
+            step = min(KLINE_INCREMENT_STEP, count) if not parts else count - fetched
+            part = format_security_bars(self.api.get_security_bars(ktype, market, code, fetched, step))
+            if part.empty:
+                break
+            parts.append(part)
+            fetched += len(part)
+            if part.index[0] <= last_dt or len(part) < step:
+                break
+        if not parts:
+            return pd.DataFrame()
+        fresh = pd.concat(parts[::-1])
+        overlap = cached[(cached.index >= fresh.index[0]) & (cached.index < last_dt)]
+        if len(overlap) and not overlap.equals(fresh.reindex(overlap.index)):
+            logging.info(f"{code} 的K线缓存与服务器数据不一致，重新获取")
+            return format_security_bars(self.api.get_security_bars(ktype, market, code, 0, count))
+        combined = pd.concat([cached[cached.index < fresh.index[0]], fresh])
+        return combined.tail(count)
+    
     def _ktype2name(self, ktype: int) -> str:
         """将ktype数值转换为周期名称"""
         ktype_map = {
@@ -330,15 +615,7 @@ class TdxStockBacktest:
 
         # 1. 读取股票-行业映射
         try:
-            df_hy = pd.read_csv(
-                tdxhy_file, 
-                sep='|', 
-                encoding='gbk', 
-                dtype=str, 
-                header=None, 
-                engine='python'
-            )
-            stock_to_industry_map = pd.Series(df_hy[5].values, index=df_hy[1]).to_dict()
+            stock_to_industry_map = gupiaojichu.load_map(tdxhy_file, 1, 5)
             logging.info(f"成功构建股票-行业映射，共 {len(stock_to_industry_map)} 条记录")
         except FileNotFoundError:
             logging.error(f"未找到股票-行业映射文件: {tdxhy_file}，请检查通达信路径是否正确")
@@ -347,17 +624,7 @@ class TdxStockBacktest:
 
         # 2. 读取股票-指数映射
         try:
-            df_zs = pd.read_csv(
-                tdxzs_file, 
-                sep='|', 
-                header=None, 
-                dtype=str,
-                encoding='gbk', 
-                engine='python'
-            )
-            mask = df_zs[5].str.startswith('X')  # 过滤指数标识
-            filtered_series = pd.Series(df_zs.loc[mask, 5].values, index=df_zs.loc[mask, 1])
-            stock_to_zs_map = filtered_series.to_dict()
+            stock_to_zs_map = gupiaojichu.load_map(tdxzs_file, 1, 5, filter_prefix='X')  # 过滤指数标识
             logging.info(f"成功构建股票-指数映射，共 {len(stock_to_zs_map)} 条记录")
         except FileNotFoundError:
             logging.error(f"未找到指数映射文件: {tdxzs_file}，请检查通达信路径是否正确")
@@ -677,15 +944,17 @@ class TdxStockBacktest:
         max_drawdown = self.calc_max_drawdown(self.backtest_result['总资产'].values)
         
         # 胜率
-        total_trades = len(self.trade_pnl)
-        win_trades = sum(1 for pnl in self.trade_pnl if pnl > 0)
+        pnl = self.trade_pnl
+        total_trades = len(pnl)
+        win_mask = pnl > 0
+        win_trades = int(np.count_nonzero(win_mask))
         win_rate = win_trades / total_trades * 100 if total_trades > 0 else 0
         
         # 盈亏比：平均盈利 / 平均亏损（取绝对值）
-        profits = [pnl for pnl in self.trade_pnl if pnl > 0]
-        losses = [abs(pnl) for pnl in self.trade_pnl if pnl < 0]
-        avg_profit = np.mean(profits) if profits else 0.0
-        avg_loss = np.mean(losses) if losses else 0.0
+        profits = pnl[win_mask]
+        losses = -pnl[pnl < 0]
+        avg_profit = profits.mean() if profits.size else 0.0
+        avg_loss = losses.mean() if losses.size else 0.0
         profit_loss_ratio = avg_profit / avg_loss if avg_loss != 0 else 0.0
         
         # 夏普比率（简化版，无风险利率取0）
@@ -762,51 +1031,48 @@ class TdxStockBacktest:
         return False, ""   
     
     def three_buy_strategy(self, day_df: pd.DataFrame, min30_data: pd.DataFrame, min30_high: List[float], min30_low: List[float]) -> pd.DataFrame:
-            data = min30_data.copy()
-            data.index.name = 'datetime'
-            day_df.index.name = 'datetime'
+            # 不再整表复制输入：中间结果都放在本地数组里，最后挂到输入的浅拷贝上（写时复制下不复制数据，也不改动调用方的表）
+            data = min30_data.copy(deep=False)
+            data.index = data.index.rename('datetime')
+            n = len(data)
             
             # --- 1. 日线过滤条件 (保持原逻辑) ---
-            day_df = day_df.copy()
-            day_df['ma60'] = day_df['收盘价'].rolling(window=60).mean()
-            day_df['ma60_shift3'] = day_df['ma60'].shift(3)
-            day_df['day_cond'] = (day_df['收盘价'] > day_df['ma60']) & (day_df['ma60'] > day_df['ma60_shift3'])
-            day_df['day_signal_valid'] = day_df['day_cond'].shift(1).fillna(False)
-
-            data['date_only'] = data.index.date
-            day_df['date_only'] = day_df.index.date
-            data = data.reset_index().merge(
-                day_df[['date_only', 'day_signal_valid']], 
-                on='date_only', 
-                how='left'
-            ).set_index('datetime')
+            # 收盘价 > MA60 且 MA60 > 3根之前的MA60，取前一日的结果
+            day_close = day_df['收盘价'].to_numpy(np.float64)
+            day_signal_valid = day_signal_kernel(day_close, moving_average(day_close, 60))
+
+            # 按日期把日线条件对到每根30分钟K线：两边都取当天零点作为键，用索引reindex在C层完成查找，
+            # 不再为每行生成Python date对象再merge；当天没有日线的K线与左连接一样得到NaN
+            day_signal_valid = pd.Series(day_signal_valid, index=day_df.index.normalize())
+            day_signal_valid = day_signal_valid.reindex(data.index.normalize()).to_numpy()
 
             # --- 2. 预计算基础指标 ---
-            buy_signals = self.calculate_three_buy_signals(min30_high, min30_low, data['收盘价'].tolist())
-            data['buy_signal'] = buy_signals
-            data['ma60'] = data['收盘价'].rolling(window=60).mean().bfill()
-            
             close_list = data['收盘价'].tolist()
-            ma60_list = data['ma60'].tolist()
+            buy_signals = self.calculate_three_buy_signals(min30_high, min30_low, close_list)
+            ma60 = moving_average(data['收盘价'].to_numpy(), 60)
+            if len(ma60) >= 60:
+                ma60[:59] = ma60[59]  # 与bfill()相同：前59根用第一个有效均值填充
+            
+            ma60_list = ma60.tolist()
+            day_valid_list = day_signal_valid.tolist()
             high_list = min30_high
             low_list = min30_low
             
             # --- 3. 核心状态机循环 ---
-            data['signal'] = 0
-            data['sell_reason'] = ""
+            signal = np.zeros(n, dtype=np.int64)
+            sell_reason = [""] * n
+            active_stop_loss = np.full(n, np.nan)  # 持仓中记录的实时止损价，其余K线为NaN
             in_pos = False
             buy_price = 0.0
             buy_idx = 0
             initial_stop_loss = 0.0
             current_stop_loss = 0.0 # 新增：当前实时执行的止损价
             
-            for i in range(len(data)):
-                current_idx_time = data.index[i]
-                
+            for i in range(n):
                 if not in_pos:
                     # 尝试买入
-                    if data['buy_signal'].iloc[i] == 1.0 and data['day_signal_valid'].iloc[i]:
-                        data.loc[current_idx_time, 'signal'] = 1
+                    if buy_signals[i] == 1.0 and day_valid_list[i]:
+                        signal[i] = 1
                         in_pos = True
                         buy_price = close_list[i]
                         buy_idx = i
@@ -820,8 +1086,8 @@ class TdxStockBacktest:
                 else:       
                     # A. 止损检查 (优先级最高，使用 current_stop_loss)
                     if low_list[i] <= current_stop_loss:
-                        data.loc[current_idx_time, 'signal'] = -1
-                        data.loc[current_idx_time, 'sell_reason'] = f"触发止损(当前止损价:{current_stop_loss})"
+                        signal[i] = -1
+                        sell_reason[i] = f"触发止损(当前止损价:{current_stop_loss})"
                         in_pos = False
                         continue
 
@@ -830,8 +1096,8 @@ class TdxStockBacktest:
                     # --- 新增：介入后第三根K线逻辑 (hold_count == 3) ---
                     if hold_count == 3:
                         if close_list[i] < buy_price:
-                            # data.loc[current_idx_time, 'signal'] = -1
-                            # data.loc[current_idx_time, 'sell_reason'] = "第三根K线低于买入价强制卖出"
+                            # signal[i] = -1
+                            # sell_reason[i] = "第三根K线低于买入价强制卖出"
                             # in_pos = False
                             # continue
                             pass
@@ -840,7 +1106,7 @@ class TdxStockBacktest:
                             current_stop_loss = max(current_stop_loss, buy_price)
 
                     min30_frac = gupiaojichu.identify_turns(i, high_list[:i], low_list[:i])
-                    data.loc[current_idx_time, 'active_stop_loss'] = current_stop_loss # 记录当前止损价，便于调试和分析
+                    active_stop_loss[i] = current_stop_loss # 记录当前止损价，便于调试和分析
                     # B. 动态卖出检查
                     is_sell, reason = self.check_dynamic_sell_condition(
                         current_idx=i,
@@ -854,10 +1120,16 @@ class TdxStockBacktest:
                     )
                     
                     if is_sell:
-                        data.loc[current_idx_time, 'signal'] = -1
-                        data.loc[current_idx_time, 'sell_reason'] = reason
+                        signal[i] = -1
+                        sell_reason[i] = reason
                         in_pos = False
 
+            data['day_signal_valid'] = day_signal_valid
+            data['buy_signal'] = buy_signals
+            data['ma60'] = ma60
+            data['signal'] = signal
+            data['sell_reason'] = sell_reason
+            data['active_stop_loss'] = active_stop_loss
             return data
     
     def run_backtest(self, code: str, period: str = '30min', init_cash: float = 100000.0, 
@@ -910,120 +1182,82 @@ class TdxStockBacktest:
         print(f"\n以损定量配置：单笔交易最大亏损 = 总资金 × {stop_loss_ratio*100}%")
         
         # 初始化回测参数
-        cash = init_cash  # 可用资金
-        position = 0  # 持仓数量
-        total_asset = init_cash  # 总资产（现金+持仓市值）
-        trade_records = []  # 交易记录
-        daily_results = []  # 每30分钟结果
-        self.trade_pnl = []      # 记录每笔交易的盈亏
         
         # 止损相关初始化
         self.stop_loss_price = 0.0
         self.in_position = False
-        buy_kline_low = 0.0
-        buy_datetime = None
-        
-        # 逐行执行回测
-        buy_price = 0
-        buy_fee = 0
-        
-        for datetime, row in data.iterrows():
-            close_price = row['收盘价']
-            low_price = row['最低价']
-            high_price = row['最高价']
-            current_total_asset = cash + position * close_price
-            current_idx = data.index.get_loc(datetime)  # 当前K线索引
-
-            # 核心修改：实时更新回测器手中的止损价
-            if self.in_position:
-                # 这里的 active_stop_loss 包含了你新加的“第三根K线移位”后的价格
-                self.stop_loss_price = row['active_stop_loss']
-            
-            # ===== 优化后的买入逻辑：加入收盘价高于前顶分型条件 =====
-            if row['signal'] == 1 and cash > close_price and not self.in_position:
-                # 【新增】排名检查
-                if top_stocks_by_time is not None:
-                    if datetime not in top_stocks_by_time or stock_to_zs_final_map.get(code) not in top_stocks_by_time[datetime]:
-                        # 不满足排名条件，跳过此次买入
-                        continue
-
-                # 3. 原有的止损价计算逻辑
-                if current_idx > 0:
-                    prev_close = data['最高价'].iloc[current_idx - 1]
-                    loss_price = min(row['最低价'], prev_close)
-
-                    if (close_price-loss_price)/loss_price*100 > 2.4:
-                        continue
-                    if (close_price-loss_price)/loss_price*100 < 0.5:
-                        continue
-                    self.stop_loss_price = loss_price
-                else:
-                    # 如果是第一根K线（无前值），则使用当前最低价
-                    self.stop_loss_price = row['最低价']
-                
-                # 4. 以损定量：计算可买数量
-                buy_num = self.calculate_position_size(
-                    current_cash=current_total_asset,
-                    entry_price=close_price,
-                    stop_loss_price=self.stop_loss_price
-                )
+        
+        # 循环前一次性取出各列，逐根K线的资金/持仓状态机在编译内核中执行
+        n = len(data)
+        times = data.index.tolist()
+        close_arr = data['收盘价'].to_numpy(np.float64)
+        signal_arr = data['signal'].to_numpy(np.int8)
+        # 策略没有出现过持仓中的K线时不会生成active_stop_loss列
+        if 'active_stop_loss' in data:
+            active_stop_arr = data['active_stop_loss'].to_numpy(np.float64)
+        else:
+            active_stop_arr = np.full(n, np.nan)
+        # 排名检查只涉及字典查找，先对所有买入信号K线算好，不满足排名条件的K线跳过此次买入
+        rank_ok = np.ones(n, dtype=np.bool_)
+        if top_stocks_by_time is not None:
+            zs_code = stock_to_zs_final_map.get(code)
+            for i in np.flatnonzero(signal_arr == 1):
+                rank_ok[i] = times[i] in top_stocks_by_time and zs_code in top_stocks_by_time[times[i]]
+        
+        res = run_backtest_kernel(
+            close_arr, data['最低价'].to_numpy(np.float64), data['最高价'].to_numpy(np.float64),
+            signal_arr, rank_ok, active_stop_arr, float(init_cash), float(commission),
+            float(self.stop_loss_ratio), float(self.risk_per_trade))
+        
+        # 按发生顺序生成交易明细（tolist()得到Python数值，与逐行回测时的取值相同）
+        # 逐笔交易的明细日志只在DEBUG级别输出，先判断级别，批量回测时不做f-string格式化
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        ev_kind = res.ev_kind
+        ev_pos = np.flatnonzero(ev_kind)
+        close_list = data['收盘价'].tolist()
+        sell_reason_list = data['sell_reason'].tolist()
+        for current_idx, kind, num, fee, pnl, stop, risk, base in zip(
+                ev_pos.tolist(), ev_kind[ev_pos].tolist(), res.ev_num[ev_pos].tolist(), res.ev_fee[ev_pos].tolist(),
+                res.ev_pnl[ev_pos].tolist(), res.ev_stop[ev_pos].tolist(), res.ev_risk[ev_pos].tolist(),
+                res.ev_base[ev_pos].tolist()):
+            datetime = times[current_idx]
+            close_price = close_list[current_idx]
+            if kind == 1:
+                buy_num = num
+                self.stop_loss_price = stop
+                self.risk_per_trade = risk
+                self.in_position = True
+                self.buy_kline_index = current_idx  # 【新增】记录买入时的全局 K 线索引
+                trade_detail = {
+                    '股票代码': code,
+                    '交易时间': datetime,
+                    '交易类型': '买入',
+                    '价格': close_price,
+                    '数量': buy_num,
+                    '费用': fee,
+                    '单笔盈亏': 0.0,  # 买入时盈亏为0，卖出时更新
+                    '是否盈利': None,
+                    '设置止损价': self.stop_loss_price,
+                    '单笔风险金额': self.risk_per_trade,
+                    '风险比例': self.stop_loss_ratio*100,
+                    '单k涨幅': (close_price - self.stop_loss_price)/self.stop_loss_price*100
+                }
+                self.all_trades_detail.append(trade_detail)  # 存入交易明细
                 
-                if buy_num > 0:
-                    # 【核心修正】：记录买入这一刻的账户总资产，作为后续计算盈亏比的分母
-                    self.buy_in_total_asset = cash + position * close_price
-                    # 计算交易成本
-                    cost = buy_num * close_price * (1 + commission)
-                    fee = buy_num * close_price * commission
-                    if cash >= cost:
-                        position += buy_num
-                        cash -= cost
-                        buy_price = close_price
-                        buy_fee = fee
-                        self.in_position = True
-                        buy_datetime = datetime
-                        self.buy_kline_index = current_idx  # 【新增】记录买入时的全局 K 线索引
-                        
-                        trade_detail = {
-                            '股票代码': code,
-                            '交易时间': datetime,
-                            '交易类型': '买入',
-                            '价格': close_price,
-                            '数量': buy_num,
-                            '费用': fee,
-                            '单笔盈亏': 0.0,  # 买入时盈亏为0，卖出时更新
-                            '是否盈利': None,
-                            '设置止损价': self.stop_loss_price,
-                            '单笔风险金额': self.risk_per_trade,
-                            '风险比例': self.stop_loss_ratio*100,
-                            '单k涨幅': (close_price - self.stop_loss_price)/self.stop_loss_price*100
-                        }
-                        trade_records.append(trade_detail)
-                        self.all_trades_detail.append(trade_detail)  # 存入交易明细
-                        
-                        print(f"【买入开仓（以损定量）】{datetime} - 价格{close_price}，数量{buy_num}")
-                        print(f"          - 止损价:{self.stop_loss_price} | 单笔风险金额:{self.risk_per_trade:.2f} | 风险比例:{self.stop_loss_ratio*100}%")
-                else:
-                    print(f"【买入失败】{datetime} - 以损定量计算可买数量为0（止损价{self.stop_loss_price} >= 买入价{close_price}）")
-            
-            # ===== 正常卖出信号执行 =====
-            elif row['signal'] == -1 and position > 0:
+                if log_debug:
+                    logging.debug(f"【买入开仓（以损定量）】{datetime} - 价格{close_price}，数量{buy_num}")
+                    logging.debug(f"          - 止损价:{self.stop_loss_price} | 单笔风险金额:{self.risk_per_trade:.2f} | 风险比例:{self.stop_loss_ratio*100}%")
+            elif kind == 2:
+                if log_debug:
+                    logging.debug(f"【买入失败】{datetime} - 以损定量计算可买数量为0（止损价{stop} >= 买入价{close_price}）")
+            else:
                 # 获取当前K线索引（第几根K线）
-                current_kline_idx = data.index.get_loc(datetime) + 1  # 从1开始计数
+                current_kline_idx = current_idx + 1  # 从1开始计数
                 # 获取卖出原因
-                sell_reason = row['sell_reason'] if 'sell_reason' in row else "未知原因"
-                
-                # 卖出全部持仓
-                sell_num = position
-                # 计算交易费用
-                fee = sell_num * close_price * commission
-                # 卖出收入 = 卖出数量 × 卖出价格 × (1 - 佣金率)
-                income = sell_num * close_price * (1 - commission)
-                # 计算这笔交易的盈亏
-                total_buy_cost = sell_num * buy_price + buy_fee
-                total_sell_income = income - fee
-                pnl = total_sell_income - total_buy_cost
+                sell_reason = sell_reason_list[current_idx]
+                sell_num = num
+                self.buy_in_total_asset = base
                 hold_k_count = current_idx - self.buy_kline_index + 1  # 持仓K线数量
-                cash += income
                 trade_detail = {
                     '股票代码': code,
                     '交易时间': datetime,
@@ -1036,47 +1270,45 @@ class TdxStockBacktest:
                     '卖出原因': sell_reason,
                     '当前K线索引': current_kline_idx,
                     '持仓K线数量': hold_k_count,  # 【新增】记录相对持仓时长
-                    '单笔风险金额': self.risk_per_trade,
+                    '单笔风险金额': risk,
                     '实际盈亏比例': pnl/self.buy_in_total_asset*100
                 }
-                trade_records.append(trade_detail)
-                self.trade_pnl.append(pnl)
                 self.all_trades_detail.append(trade_detail)  # 存入交易明细
                 
                 # 重置持仓和止损参数
-                position = 0
-                buy_price = 0
-                buy_fee = 0
                 self.stop_loss_price = 0.0
                 self.in_position = False
-                buy_kline_low = 0.0
                 self.risk_per_trade = 0.0
                 
                 # 新增：打印卖出原因和K线索引
-                print(f"【策略卖出】{datetime} - 第{current_kline_idx}根K线 | 价格{close_price}，数量{sell_num}，盈亏{pnl:.2f}")
-                print(f"          - 卖出原因：{sell_reason}")
-                print(f"          - 单笔风险金额:{self.risk_per_trade:.2f} | 实际盈亏比例:{pnl/self.buy_in_total_asset*100:.2f}%")
-            
-            # 计算当前总资产
-            total_asset = cash + position * close_price
-            daily_results.append({
-                '时间': datetime,
-                '收盘价': close_price,
-                '持仓数量': position,
-                '可用现金': cash,
-                '总资产': total_asset,
-                '累计收益': total_asset - init_cash,
-                '累计收益率': (total_asset - init_cash) / init_cash * 100,
-                '止损价格': self.stop_loss_price if self.in_position else 0.0,
-                '单笔风险金额': self.risk_per_trade if self.in_position else 0.0
-            })
-        
-        # 整理回测结果
-        self.backtest_result = pd.DataFrame(daily_results)
-        self.backtest_result = self.backtest_result.set_index('时间')
-        
-        # 添加交易记录
-        self.trade_records = pd.DataFrame(trade_records)
+                if log_debug:
+                    logging.debug(f"【策略卖出】{datetime} - 第{current_kline_idx}根K线 | 价格{close_price}，数量{sell_num}，盈亏{pnl:.2f}")
+                    logging.debug(f"          - 卖出原因：{sell_reason}")
+                    logging.debug(f"          - 单笔风险金额:{self.risk_per_trade:.2f} | 实际盈亏比例:{pnl/self.buy_in_total_asset*100:.2f}%")
+        
+        # 每笔交易的盈亏：按卖出事件一次性取出，保存为数组供calc_backtest_metrics直接做掩码统计
+        self.trade_pnl = res.ev_pnl[ev_kind == -1]
+        
+        # 回测结束时的止损/持仓状态以内核为准
+        self.stop_loss_price = res.final_stop
+        self.in_position = bool(res.final_in_position)
+        self.risk_per_trade = res.final_risk
+        
+        # 整理回测结果（被跳过的买入K线不写结果）
+        asset_arr = res.asset
+        self.backtest_result = pd.DataFrame({
+            '收盘价': close_arr[res.kept_idx],
+            '持仓数量': res.position,
+            '可用现金': res.cash,
+            '总资产': asset_arr,
+            '累计收益': asset_arr - init_cash,
+            '累计收益率': (asset_arr - init_cash) / init_cash * 100,
+            '止损价格': res.stop,
+            '单笔风险金额': res.risk,
+        }, index=pd.Index(data.index[res.kept_idx], name='时间'))
+        
+        # 交易记录只由逐笔交易明细生成，与返回给批量回测的明细是同一份数据
+        self.trade_records = pd.DataFrame(self.all_trades_detail)
         
         # 计算核心指标
         metrics = self.calc_backtest_metrics(init_cash)
@@ -1150,41 +1382,38 @@ def calculate_total_trades_metrics(all_trades_detail: List[Dict]) -> Dict:
             '最大单笔亏损': 0.0
         }
 
-    # 2. 提取不同类别的持仓数据
-    hold_periods = [t['持仓K线数量'] for t in pnl_trades]
-    win_hold_periods = [t['持仓K线数量'] for t in pnl_trades if t['是否盈利']]
-    loss_hold_periods = [t['持仓K线数量'] for t in pnl_trades if not t['是否盈利']]
-
-    # 基础指标计算...
-    total_pnl_trades = len(pnl_trades)
-    win_trades = [t for t in pnl_trades if t['是否盈利']]
-    loss_trades = [t for t in pnl_trades if not t['是否盈利']]
+    # 2. 一次取出每笔卖出交易的盈亏、是否盈利和持仓K线数量，后面的统计都在数组上用布尔掩码完成
+    pnl = np.array([t['单笔盈亏'] for t in pnl_trades], dtype=np.float64)
+    win_mask = np.array([bool(t['是否盈利']) for t in pnl_trades], dtype=bool)
+    hold_periods = np.array([t['持仓K线数量'] for t in pnl_trades])
+    win_hold_periods = hold_periods[win_mask]
+    loss_hold_periods = hold_periods[~win_mask]
+    win_pnl = pnl[win_mask]
+    loss_pnl = pnl[~win_mask]
     
     # 3. 计算要求的指标
-    avg_hold_k = np.mean(hold_periods) if hold_periods else 0.0
-    avg_win_hold_k = np.mean(win_hold_periods) if win_hold_periods else 0.0
-    avg_loss_hold_k = np.mean(loss_hold_periods) if loss_hold_periods else 0.0
-    max_hold_k = np.max(hold_periods) if hold_periods else 0.0
+    avg_hold_k = hold_periods.mean()
+    avg_win_hold_k = win_hold_periods.mean() if win_hold_periods.size else 0.0
+    avg_loss_hold_k = loss_hold_periods.mean() if loss_hold_periods.size else 0.0
+    max_hold_k = hold_periods.max()
     
     # 核心计算
     total_trades_all = len(all_trades_detail)          # 所有交易笔数（含买入）
     total_pnl_trades = len(pnl_trades)                 # 有效交易笔数（卖出/止损）
-    win_trades = [t for t in pnl_trades if t['是否盈利']] # 盈利笔数
-    loss_trades = [t for t in pnl_trades if not t['是否盈利']] # 亏损笔数
-    total_win_count = len(win_trades)
-    total_loss_count = len(loss_trades)
+    total_win_count = len(win_pnl)                     # 盈利笔数
+    total_loss_count = len(loss_pnl)                   # 亏损笔数
     
-    # 金额类指标
-    total_profit = sum(t['单笔盈亏'] for t in win_trades)
-    total_loss = abs(sum(t['单笔盈亏'] for t in loss_trades))
+    # 金额类指标（按交易顺序逐笔累加，与原来的sum结果相同）
+    total_profit = sum(win_pnl.tolist())
+    total_loss = abs(sum(loss_pnl.tolist()))
     total_net_profit = total_profit - total_loss
     avg_win_per_trade = total_profit / total_win_count if total_win_count > 0 else 0.0
     avg_loss_per_trade = total_loss / total_loss_count if total_loss_count > 0 else 0.0
     total_profit_loss_ratio = avg_win_per_trade / avg_loss_per_trade if avg_loss_per_trade > 0 else 0.0
     
     # 极值指标
-    max_single_win = max([t['单笔盈亏'] for t in win_trades], default=0.0)
-    max_single_loss = min([t['单笔盈亏'] for t in loss_trades], default=0.0)
+    max_single_win = float(win_pnl.max()) if win_pnl.size else 0.0
+    max_single_loss = float(loss_pnl.min()) if loss_pnl.size else 0.0
     
     # 胜率
     total_win_rate = (total_win_count / total_pnl_trades) * 100 if total_pnl_trades > 0 else 0.0
@@ -1213,6 +1442,42 @@ def calculate_total_trades_metrics(all_trades_detail: List[Dict]) -> Dict:
     
     return total_metrics
 
+# 每个子进程各自的回测对象和排名数据，由init_backtest_worker在子进程启动时设置一次
+_WORKER = {}
+
+
+def init_backtest_worker(top_stocks_by_time, stock_to_zs_final_map, log_level):
+    """
+    子进程初始化：创建本进程的回测对象；排名字典只在启动时传一次，不随每只股票重复序列化
+    Windows下子进程不继承主进程的日志配置，按主进程的日志级别重新配置
+    """
+    logging.basicConfig(level=log_level, format=LOG_FORMAT, force=True)
+    _WORKER['backtest'] = TdxStockBacktest()
+    _WORKER['top_stocks_by_time'] = top_stocks_by_time
+    _WORKER['stock_to_zs_final_map'] = stock_to_zs_final_map
+
+
+def backtest_one(code, init_cash, commission, stop_loss_ratio):
+    """
+    回测单只股票（在子进程中执行）
+    Returns:
+        tuple: (股票代码, 回测指标字典, 交易明细列表, 异常信息或None)
+    """
+    try:
+        _, metrics, trades_detail = _WORKER['backtest'].run_backtest(
+            code=code,
+            init_cash=init_cash,
+            commission=commission,
+            stop_loss_ratio=stop_loss_ratio,
+            use_local=True  ,# 统一使用本地数据
+            tdx_path=DEFAULT_TDX_PATH,
+            top_stocks_by_time=_WORKER['top_stocks_by_time'],   # 传入排名字典
+            stock_to_zs_final_map=_WORKER['stock_to_zs_final_map']    # 传入股票-指数映射
+        )
+        return code, metrics, trades_detail, None
+    except Exception as e:
+        return code, None, None, str(e)
+
 def batch_backtest(stock_codes: List[str], stock_codes_index: List[str], init_cash: float = 100000.0, 
                    commission: float = 0.0003, stop_loss_ratio: float = 0.01,
                    top_n: int = 60) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
@@ -1255,10 +1520,11 @@ def batch_backtest(stock_codes: List[str], stock_codes_index: List[str], init_ca
     print(f"排名计算完成，共 {len(top_stocks_by_time)} 个时间点有排名数据")
     # 检查是否为字典且不为空
     if isinstance(top_stocks_by_time, dict) and top_stocks_by_time:
-        # 获取排序后的最后一个日期（Key）
-        last_date = sorted(top_stocks_by_time.keys())[-1]
-        print(f"最后日期: {last_date}, 数据长度: {len(top_stocks_by_time[last_date])}")
-        print(f"最后数据内容: {top_stocks_by_time[last_date]}")
+        # 最后一个时间点的排名内容只在DEBUG级别输出（取最大的时间点，不必整体排序）
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            last_date = max(top_stocks_by_time)
+            logging.debug(f"最后日期: {last_date}, 数据长度: {len(top_stocks_by_time[last_date])}")
+            logging.debug(f"最后数据内容: {top_stocks_by_time[last_date]}")
     else:
         print("数据格式不正确或为空")
 
@@ -1266,30 +1532,22 @@ def batch_backtest(stock_codes: List[str], stock_codes_index: List[str], init_ca
     all_metrics = []
     all_trades_detail = []  # 存储所有股票的交易明细
 
-    # 逐只股票回测
-    for idx, code in enumerate(stock_codes):
-        print(f"\n------------------- 进度 {idx+1}/{len(stock_codes)} -------------------")
-        try:
-            _, metrics, trades_detail = backtest.run_backtest(
-                code=code,
-                init_cash=init_cash,
-                commission=commission,
-                stop_loss_ratio=stop_loss_ratio,
-                use_local=True  ,# 统一使用联网模式获取数据
-                tdx_path=DEFAULT_TDX_PATH,
-                top_stocks_by_time=top_stocks_by_time,   # 传入排名字典
-                stock_to_zs_final_map=stock_to_zs_final_map    # 传入股票-指数映射
-            )
+    # 各股票的回测相互独立，分给多个进程并行（每个进程用自己的回测对象，读本地数据）；
+    # map按提交顺序返回，汇总结果的顺序与逐只回测一致
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_backtest_worker,
+                             initargs=(top_stocks_by_time, stock_to_zs_final_map,
+                                       logging.getLogger().getEffectiveLevel())) as executor:
+        results = executor.map(backtest_one, stock_codes, repeat(init_cash), repeat(commission), repeat(stop_loss_ratio))
+        for idx, (code, metrics, trades_detail, error) in enumerate(results):
+            print(f"\n------------------- 进度 {idx+1}/{len(stock_codes)} -------------------")
+            if error is not None:
+                print(f"股票 {code} 回测异常: {error}")
+                continue
             if metrics:  # 仅保留有有效指标的股票
                 metrics['股票代码'] = code
                 all_metrics.append(metrics)
             if trades_detail:  # 收集交易明细
                 all_trades_detail.extend(trades_detail)
-            # 避免请求过快，休眠0.1秒
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"股票 {code} 回测异常: {e}")
-            continue
     
     # ========== 原有：单股票维度汇总 ==========
     if not all_metrics:
@@ -1372,11 +1630,8 @@ def calculate_pure_compounding(all_trades_detail: List[Dict], init_cash: float =
         current_capital = current_capital * (1 + trade_return_ratio)
         capital_curve.append(current_capital)
 
-    # 4. 计算复利曲线的最大回撤
-    capital_array = np.array(capital_curve)
-    running_max = np.maximum.accumulate(capital_array)
-    drawdowns = (capital_array - running_max) / running_max
-    max_dd = np.min(drawdowns) * 100
+    # 4. 计算复利曲线的最大回撤（与单股票回测共用同一个向量化实现）
+    max_dd = TdxStockBacktest.calc_max_drawdown(np.array(capital_curve))
 
     # 5. 汇总数据
     total_return_pct = (current_capital - init_cash) / init_cash * 100
@@ -1396,20 +1651,22 @@ def analyze_loss_periods(trades_df: pd.DataFrame) -> pd.DataFrame:
     if trades_df.empty:
         return pd.DataFrame()
     
-    df = trades_df.copy()
-    df['日期'] = pd.to_datetime(df['交易时间']).dt.date
+    # 不复制整张交易表：只取需要的两列，按日期分组汇总
+    trade_date = pd.to_datetime(trades_df['交易时间']).dt.date.rename('日期')
+    pnl = trades_df['单笔盈亏']
     
     # 1. 基础按日汇总
-    daily_stats = df[df['单笔盈亏'] != 0].groupby('日期')['单笔盈亏'].agg(['count', 'sum']).reset_index()
+    closed = pnl != 0
+    daily_stats = pnl[closed].groupby(trade_date[closed]).agg(['count', 'sum']).reset_index()
     daily_stats.columns = ['日期', '成交笔数', '当日净损益']
 
     # 2. 提取盈利日并排序 (金额从大到小)
-    profit_days = daily_stats[daily_stats['当日净损益'] > 0].copy()
+    profit_days = daily_stats[daily_stats['当日净损益'] > 0]
     profit_days = profit_days.sort_values(by='当日净损益', ascending=False).reset_index(drop=True)
     profit_days.columns = ['盈利日期', '盈利单数', '盈利金额']
 
     # 3. 提取亏损日并排序 (金额从小到大，即亏得最多的在最上面)
-    loss_days = daily_stats[daily_stats['当日净损益'] < 0].copy()
+    loss_days = daily_stats[daily_stats['当日净损益'] < 0]
     loss_days = loss_days.sort_values(by='当日净损益', ascending=True).reset_index(drop=True)
     loss_days.columns = ['亏损日期', '亏损单数', '亏损金额']
 
@@ -1432,25 +1689,28 @@ def analyze_by_buy_date(trades_df: pd.DataFrame) -> pd.DataFrame:
     # 确保按时间排序
     trades_df = trades_df.sort_values('交易时间').reset_index(drop=True)
 
+    # 交易类型先整列换成int8方向码（1买入，-1卖出，0其他），循环里只做整数比较，不再逐行比较中文字符串
+    trade_types = trades_df['交易类型'].astype(str)
+    side = np.where(trade_types == '买入', 1, np.where(trade_types.str.contains('卖出', regex=False), -1, 0)).astype(np.int8)
+    codes = trades_df['股票代码'].tolist()
+    pnls = trades_df['单笔盈亏'].tolist()
+    trade_dates = pd.to_datetime(trades_df['交易时间']).dt.date.tolist()
+
     # 使用队列记录每只股票的未匹配买入记录
-    buy_queue = defaultdict(deque)  # key: 股票代码, value: deque of (买入时间, 数量)
+    buy_queue = defaultdict(deque)  # key: 股票代码, value: deque of 买入记录的行号
 
     # 存储按买入日期汇总的盈亏数据
     buy_date_summary = {}  # key: 买入日期, value: {'盈利金额':0, '盈利单数':0, '亏损金额':0, '亏损单数':0}
 
-    for _, row in trades_df.iterrows():
-        code = row['股票代码']
-        ttype = row['交易类型']
-
-        if ttype == '买入':
+    for i, code in enumerate(codes):
+        if side[i] == 1:
             # 记录买入
-            buy_queue[code].append((row['交易时间'], row['数量']))
-        elif '卖出' in ttype:
+            buy_queue[code].append(i)
+        elif side[i] == -1:
             # 卖出，匹配最近的买入（先进先出）
             if code in buy_queue and buy_queue[code]:
-                buy_time, _ = buy_queue[code].popleft()
-                pnl = row['单笔盈亏']
-                buy_date = pd.to_datetime(buy_time).date()
+                buy_date = trade_dates[buy_queue[code].popleft()]
+                pnl = pnls[i]
 
                 if buy_date not in buy_date_summary:
                     buy_date_summary[buy_date] = {
@@ -1467,7 +1727,7 @@ def analyze_by_buy_date(trades_df: pd.DataFrame) -> pd.DataFrame:
                     buy_date_summary[buy_date]['亏损金额'] += pnl  # 负数
                     buy_date_summary[buy_date]['亏损单数'] += 1
             else:
-                print(f"警告: 卖出记录 {row.to_dict()} 没有对应的买入记录")
+                print(f"警告: 卖出记录 {trades_df.iloc[i].to_dict()} 没有对应的买入记录")
 
     # 构建 DataFrame
     rows = []
@@ -1485,11 +1745,11 @@ def analyze_by_buy_date(trades_df: pd.DataFrame) -> pd.DataFrame:
         return df
 
     # 分离盈利日和亏损日
-    profit_days = df[df['盈利金额'] > 0][['日期', '盈利单数', '盈利金额']].copy()
+    profit_days = df[df['盈利金额'] > 0][['日期', '盈利单数', '盈利金额']]
     profit_days = profit_days.rename(columns={'日期': '盈利日期'})
     profit_days = profit_days.sort_values('盈利金额', ascending=False).reset_index(drop=True)
 
-    loss_days = df[df['亏损金额'] < 0][['日期', '亏损单数', '亏损金额']].copy()
+    loss_days = df[df['亏损金额'] < 0][['日期', '亏损单数', '亏损金额']]
     loss_days = loss_days.rename(columns={'日期': '亏损日期'})
     loss_days = loss_days.sort_values('亏损金额', ascending=True).reset_index(drop=True)  # 亏损最多（负值最小）在前
 
@@ -1499,6 +1759,8 @@ def analyze_by_buy_date(trades_df: pd.DataFrame) -> pd.DataFrame:
 
 # ------------------- 主执行入口 -------------------
 if __name__ == "__main__":
+    # pyinstaller打包成exe后，子进程需要这一步才能正常启动
+    multiprocessing.freeze_support()
     # 1. 解析通达信板块文件
     stock_list = parse_tdx_blk_file(BLOB_FILE_PATH)
     stock_list_index = parse_tdx_blk_file(BLOB_FILE_PATH_INDEX)  # 重新解析一次，确保最新数据
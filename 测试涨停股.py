@@ -1,5 +1,4 @@
 import pandas as pd
-from pytdx.hq import TdxHq_API
 import redis
 import time
 import schedule
@@ -13,8 +12,10 @@ import numpy as np
 import pandas as pd
 import openpyxl
 from openpyxl.styles import Alignment
+from openpyxl.cell import WriteOnlyCell
 from collections import defaultdict
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 
 # 配置日志
@@ -28,11 +29,17 @@ logging.basicConfig(
 )
 
 class StockDataCollector:
+
     def __init__(self, blk_file_path):
         self.blk_file_path = blk_file_path
         self.stock_list = self.load_stock_list()
         self.profit_records = {}  # 存储收益记录，格式: {日期: [{股票信息}, ...]}
         self.servers = [('36.153.42.16', 7709)]
+        # 线程池：每只股票的K线获取相互独立，并发执行以重叠网络等待
+        self.max_workers = len(self.servers) * 8
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # pytdx长连接池（按线程独占，空闲过久先发心跳），与其他脚本共用gupiaojichu中的实现
+        self.tdx_pool = gupiaojichu.TdxApiPool(self.servers)
         logging.info(f"初始化完成，共加载 {len(self.stock_list)} 只股票")
     
     def load_stock_list(self):
@@ -58,37 +65,39 @@ class StockDataCollector:
         return stock_list
     
     def get_5min_data(self, market, stock_code, full_code):
-        api = TdxHq_API()
-        for server_ip, server_port in self.servers:
+        # 复用当前线程的长连接，不再每只股票都重新connect/disconnect；失败时依次尝试其他服务器
+        local = self.tdx_pool.get()
+        for i, (server_ip, server_port) in enumerate(self.servers):
+            if not self.tdx_pool.ensure(local, i):
+                continue
             try:
-                if api.connect(server_ip, server_port):
-                    data = api.get_security_bars(9, market, stock_code, 0, 500)
-                    api.disconnect()
-                    if data:
-                        result_list = []
-                        result_list_high = []
-                        result_list_low = []
-                        for bar in data:
-                            result = {
-                                'open': float(bar['open']),
-                                'high': float(bar['high']),
-                                'low': float(bar['low']),
-                                'close': float(bar['close']),
-                                'volume': float(bar['vol']),
-                                'datetime': bar['datetime']  # 假设格式为'YYYYMMDDHHMM'
-                            }
-                            result_list_high.append(float(bar['high']))
-                            result_list_low.append(float(bar['low']))
-                            result_list.append(result)
-                        return result_list, result_list_high, result_list_low
-                    else:
-                        logging.warning(f"未获取到 {full_code} 的数据")
-                        return None, None, None
-                else:
-                    logging.debug(f"连接服务器 {server_ip}:{server_port} 失败")
+                data = local.api_pool[i].get_security_bars(9, market, stock_code, 0, 500)
             except Exception as e:
                 logging.debug(f"服务器获取 {full_code} 出错: {e}")
+                self.tdx_pool.mark_broken(local, i)
                 continue
+            self.tdx_pool.touch(local, i)
+            
+            if data:
+                result_list = []
+                result_list_high = []
+                result_list_low = []
+                for bar in data:
+                    result = {
+                        'open': float(bar['open']),
+                        'high': float(bar['high']),
+                        'low': float(bar['low']),
+                        'close': float(bar['close']),
+                        'volume': float(bar['vol']),
+                        'datetime': bar['datetime']  # 假设格式为'YYYYMMDDHHMM'
+                    }
+                    result_list_high.append(float(bar['high']))
+                    result_list_low.append(float(bar['low']))
+                    result_list.append(result)
+                return result_list, result_list_high, result_list_low
+            else:
+                logging.warning(f"未获取到 {full_code} 的数据")
+                return None, None, None
         logging.error(f"所有服务器都无法获取 {full_code} 的数据")
         return None, None, None
     
@@ -98,9 +107,15 @@ class StockDataCollector:
         self.stock_list = self.load_stock_list()
         logging.info("开始更新所有股票数据...")
         
-        for market, stock_code, full_code in self.stock_list:
+        # 获取K线在工作线程并发执行；按股票列表顺序取结果并在主线程计算，收益记录顺序与逐只获取时一致
+        futures = [
+            self.executor.submit(self.get_5min_data, market, stock_code, full_code)
+            for market, stock_code, full_code in self.stock_list
+        ]
+        
+        for (market, stock_code, full_code), future in zip(self.stock_list, futures):
             try:
-                stock_data, _, _ = self.get_5min_data(market, stock_code, full_code)
+                stock_data, _, _ = future.result()
                 if stock_data and len(stock_data) >= 11:  # 确保有足够K线（需到次K的次K）
                     # 计算ZT和YZB状态
                     for i in range(1, len(stock_data)):
@@ -249,50 +264,37 @@ class StockDataCollector:
                 # 3. 确定最大行数（各日期中股票数量的最大值）
                 max_rows = max(len(data['stocks']) for data in date_data.values())
 
-                # 4. 使用openpyxl写入Excel并设置格式
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = "收益记录"
+                # 4. 使用openpyxl只写模式写入Excel并设置格式：按行流式写出，不在内存中保留整张表的单元格对象
+                wb = openpyxl.Workbook(write_only=True)
+                ws = wb.create_sheet("收益记录")
 
-                # 写入表头（第一行）
-                current_col = 1  # 从第1列开始（A列），如需从E列开始可改为5
-                for date in sorted_dates:
-                    # 股票名列标题（日期）
-                    ws.cell(row=1, column=current_col).value = date
-                    ws.cell(row=1, column=current_col).alignment = Alignment(horizontal='center')  # 居中
-                    
-                    # 盈亏列标题（介入盈亏）
-                    ws.cell(row=1, column=current_col + 1).value = "介入盈亏"
-                    ws.cell(row=1, column=current_col + 1).alignment = Alignment(horizontal='center')  # 居中
-                    
-                    current_col += 2  # 移动到下一个日期的列
+                # 调整列宽（只写模式下需在写入数据前设置），每个日期占股票名、盈亏两列
+                for col in range(1, 2 * len(sorted_dates) + 1):
+                    ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 12  # 固定列宽
 
-                # 写入数据行（从第二行开始）
-                for row_idx in range(2, max_rows + 2):  # 行号从2开始，共max_rows行
-                    data_idx = row_idx - 2  # 数据索引（0-based）
-                    current_col = 1
-                    
+                # 所有表头单元格共用同一个居中样式对象，不再每个单元格新建一次
+                center = Alignment(horizontal='center')  # 居中
+
+                # 写入表头（第一行）：每个日期依次为 股票名列标题（日期）、盈亏列标题（介入盈亏）
+                header = []
+                for date in sorted_dates:
+                    for title in (date, "介入盈亏"):
+                        cell = WriteOnlyCell(ws, value=title)
+                        cell.alignment = center
+                        header.append(cell)
+                ws.append(header)
+
+                # 写入数据行（从第二行开始），共max_rows行
+                for data_idx in range(max_rows):  # 数据索引（0-based）
+                    row = []
                     for date in sorted_dates:
                         stocks = date_data[date]['stocks']
                         profits = date_data[date]['profits']
                         
-                        # 写入股票名称
-                        if data_idx < len(stocks):
-                            ws.cell(row=row_idx, column=current_col).value = stocks[data_idx]
-                        else:
-                            ws.cell(row=row_idx, column=current_col).value = ""  # 空值填充
-                        
-                        # 写入介入盈亏
-                        if data_idx < len(profits):
-                            ws.cell(row=row_idx, column=current_col + 1).value = profits[data_idx]
-                        else:
-                            ws.cell(row=row_idx, column=current_col + 1).value = ""  # 空值填充
-                        
-                        current_col += 2
-
-                # 调整列宽（根据内容自适应）
-                for col in range(1, ws.max_column + 1):
-                    ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 12  # 固定列宽
+                        # 股票名称、介入盈亏，不足的位置空值填充
+                        row.append(stocks[data_idx] if data_idx < len(stocks) else "")
+                        row.append(profits[data_idx] if data_idx < len(profits) else "")
+                    ws.append(row)
 
                 # 保存文件
                 wb.save('涨停股收益记录.xlsx')